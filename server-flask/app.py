@@ -21,14 +21,16 @@ from routes.employees import employees_bp
 from routes.salary import salary_bp
 from routes.tickets import tickets_bp
 from routes.warranties import warranties_bp
+from routes.locations import locations_bp
 from services.cloudinary_service import init_cloudinary
-from routes.emi import sync_all_emi_statuses
+from services.scheduler import run_scheduler, default_jobs
+from services.export_jobs import run_worker as run_export_worker
+from services.photo_pipeline import run_worker as run_photo_worker
 import logging
 import os
 import re
 from datetime import datetime
 import threading
-import time
 
 from config import Config
 
@@ -67,30 +69,40 @@ app.db = connect_db(app)
 init_cloudinary(app)
 
 
-def _start_emi_status_sync_worker():
-    if os.environ.get('EMI_AUTO_SYNC_ENABLED', 'true').lower() != 'true':
-        logger.info('[emi-sync] Automatic EMI sync disabled by environment flag')
+def _start_scheduler():
+    # Every web process may run the scheduler; job leases make each due run happen once.
+    # Set to false when `python -m scheduler` runs separately.
+    if os.environ.get('SCHEDULER_INLINE', 'true').lower() != 'true':
+        logger.info('[scheduler] Inline scheduler disabled by environment flag')
+        return
+    if app.db is None:
         return
 
-    interval_seconds = int(os.environ.get('EMI_AUTO_SYNC_INTERVAL_SECONDS', '3600'))
+    thread = threading.Thread(target=run_scheduler, args=(app.db, default_jobs()), name='scheduler', daemon=True)
+    thread.start()
 
-    def _worker():
-        while True:
-            try:
-                with app.app_context():
-                    result = sync_all_emi_statuses(app.db)
-                    if result.get('updatedPlans', 0) > 0:
-                        logger.info(
-                            f"[emi-sync] Updated {result['updatedPlans']} EMI plans and {result['updatedInstallments']} installments"
-                        )
-            except Exception as sync_error:
-                logger.error(f"[emi-sync] Error syncing EMI statuses: {sync_error}", exc_info=True)
-
-            time.sleep(interval_seconds)
-
-    thread = threading.Thread(target=_worker, name='emi-status-sync', daemon=True)
+def _start_export_job_worker():
+    # Exports are built by export_worker.py; opt in to an inline worker thread (one web
+    # process at a time, via the export lease) for single-process development
+    if os.environ.get('EXPORT_JOBS_INLINE_WORKER', 'false').lower() != 'true':
+        logger.info('[export-jobs] Inline export worker off; exports are built by export_worker.py')
+        return
+    if app.db is None:
+        return
+
+    thread = threading.Thread(target=run_export_worker, args=(app.db,), kwargs={'leased': True}, name='export-jobs', daemon=True)
+    thread.start()
+
+def _start_photo_job_worker():
+    # Staged uploads live on this host's disk; set to false when photo_worker.py runs on the same host
+    if os.environ.get('PHOTO_JOBS_INLINE_WORKER', 'true').lower() != 'true':
+        logger.info('[photo-jobs] Inline photo worker disabled by environment flag')
+        return
+    if app.db is None:
+        return
+
+    thread = threading.Thread(target=run_photo_worker, args=(app.db,), name='photo-jobs', daemon=True)
     thread.start()
-    logger.info(f'[emi-sync] Background EMI sync worker started (interval: {interval_seconds}s)')
 
 # Register Blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/users')
@@ -111,6 +123,7 @@ app.register_blueprint(employees_bp, url_prefix='/api/employees')
 app.register_blueprint(salary_bp, url_prefix='/api/salary')
 app.register_blueprint(tickets_bp, url_prefix='/api/tickets')
 app.register_blueprint(warranties_bp, url_prefix='/api/warranties')
+app.register_blueprint(locations_bp, url_prefix='/api/locations')
 # Public invoice viewing (no authentication required)
 app.register_blueprint(public_invoice_bp, url_prefix='/public/invoice')
 # Public customer card viewing (no authentication required)
@@ -118,7 +131,9 @@ app.register_blueprint(public_customer_card_bp, url_prefix='/public/customer-car
 # Public unified blueprint (includes customer vCard)
 app.register_blueprint(public_bp, url_prefix='/public')
 
-_start_emi_status_sync_worker()
+_start_scheduler()
+_start_export_job_worker()
+_start_photo_job_worker()
 
 # The Express routes were: 
 # app.use('/api/checkout', checkoutRoutes);
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Counter scan latency benchmark: the old `$or` barcode/sku/name-regex find_one
+vs exact lookups on the unique indexes vs the warm in-process catalog map.
+
+Seeds a throwaway database (never the app's DB_NAME) and drops it afterwards.
+
+Usage: MONGODB_URI=... python benchmark_barcode_lookup.py [catalog_size] [scans]
+"""
+
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+from pymongo import MongoClient
+
+from benchmark_product_search import BENCH_DB_NAME, _catalog
+from services.catalog_cache import CatalogCache
+
+
+def _seed(db, size):
+    db.products.drop()
+    batch = []
+    for product in _catalog(size):
+        batch.append(product)
+        if len(batch) == 5000:
+            db.products.insert_many(batch)
+            batch = []
+    if batch:
+        db.products.insert_many(batch)
+    for field in ("barcode", "sku"):
+        db.products.create_index(field, unique=True, partialFilterExpression={field: {"$type": "string"}})
+    db.products.create_index([("updatedAt", 1), ("_id", 1)])
+
+
+def _old_lookup(db, code):
+    return db.products.find_one({"$or": [{"barcode": code}, {"sku": code}, {"name": re.compile(code, re.IGNORECASE)}]})
+
+
+def _time(fn, codes):
+    samples = []
+    for code in codes:
+        start = time.perf_counter()
+        fn(code)
+        samples.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[max(0, int(len(ordered) * 0.95) - 1)]
+
+
+def run(size=50000, scans=500):
+    uri = os.environ.get('MONGODB_URI')
+    if not uri:
+        print("MONGODB_URI is required")
+        return None
+
+    client = MongoClient(uri)
+    db = client[BENCH_DB_NAME]
+    print(f"Seeding {size} products into '{BENCH_DB_NAME}'...")
+    _seed(db, size)
+
+    rng = random.Random(7)
+    # Mostly barcodes, some SKUs, a few unknown codes (the old path scans the whole collection for those)
+    codes = []
+    for _ in range(scans):
+        idx = rng.randrange(size)
+        roll = rng.random()
+        codes.append(f"PROD{idx:010d}" if roll < 0.8 else (f"SKU-{idx:06d}" if roll < 0.95 else f"UNKNOWN{idx}"))
+
+    cache = CatalogCache()
+    cache._load(db)
+
+    results = {}
+    try:
+        results["old $or + regex"] = _time(lambda c: _old_lookup(db, c), codes)
+        results["unique index"] = _time(
+            lambda c: db.products.find_one({"barcode": c}) or db.products.find_one({"sku": c}), codes
+        )
+        results["catalog map"] = _time(lambda c: cache.lookup(db, c), codes)
+    finally:
+        client.drop_database(BENCH_DB_NAME)
+
+    print("=" * 56)
+    print(f"BARCODE LOOKUP BENCHMARK ({size} SKUs, {scans} scans)")
+    print("=" * 56)
+    for label, (p50, p95) in results.items():
+        print(f"  {label:<16} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms")
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500)
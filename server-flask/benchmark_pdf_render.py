@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Per-PDF render benchmark for invoice and PVC card generation.
+Runs fully offline (no database) against synthetic documents.
+
+Usage: python benchmark_pdf_render.py [iterations]
+"""
+
+import sys
+import time
+from datetime import datetime, timezone
+
+from services.pdf_service import generate_invoice_pdf
+from services.customer_service import build_pvc_card_pdf
+
+
+def _sample_invoice(item_count=6):
+    items = []
+    for idx in range(item_count):
+        items.append({
+            "productName": f"Sample Product {idx + 1}",
+            "hsnCode": "8517",
+            "quantity": 1 + idx % 3,
+            "unitPrice": 1499.0,
+            "lineSubtotal": 1499.0 * (1 + idx % 3),
+            "lineGstAmount": 228.66 * (1 + idx % 3),
+        })
+    return {
+        "billNumber": "INV-2026-0001",
+        "billDate": datetime(2026, 4, 2, 10, 30, tzinfo=timezone.utc),
+        "customerName": "Benchmark Customer",
+        "customerPhone": "9876543210",
+        "customerAddress": "Market Road",
+        "customerPlace": "Malappuram",
+        "paymentMode": "emi",
+        "emiDetails": {"months": 6, "emiAmount": 1500, "downPayment": 2000},
+        "items": items,
+        "subtotal": sum(i["lineSubtotal"] for i in items),
+        "discountAmount": 0,
+        "cgst": 600.0,
+        "sgst": 600.0,
+        "grandTotal": 12000,
+    }
+
+
+def _sample_customer():
+    return {
+        "name": "Benchmark Customer",
+        "phone": "9876543210",
+        "email": "bench@example.com",
+        "company": "Bench Co",
+        "position": "Owner",
+        "address": "Market Road",
+        "place": "Malappuram",
+        "pincode": "676505",
+        "gstin": "32AAAAA0000A1Z5",
+    }
+
+
+def _time_per_call(fn, iterations):
+    fn()  # warm-up: first call pays import and font-metric loading
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def run(iterations=50):
+    invoice = _sample_invoice()
+    customer = _sample_customer()
+
+    results = {
+        "invoice_pdf": _time_per_call(lambda: generate_invoice_pdf(invoice), iterations),
+        "pvc_card_pdf": _time_per_call(lambda: build_pvc_card_pdf(customer, "26:07 Electronics", "7594012761"), iterations),
+    }
+
+    print("=" * 50)
+    print(f"PDF RENDER BENCHMARK ({iterations} iterations)")
+    print("=" * 50)
+    for name, ms in results.items():
+        print(f"  {name:<14} {ms:8.2f} ms/pdf")
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
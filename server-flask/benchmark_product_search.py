@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Product search latency benchmark: indexed searchTerms lookup vs the old
+unanchored regex scan, on a synthetic catalog.
+
+Seeds a throwaway database (never the app's DB_NAME) and drops it afterwards.
+
+Usage: MONGODB_URI=... python benchmark_product_search.py [catalog_size] [iterations]
+"""
+
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+from pymongo import MongoClient
+
+from services.product_search import build_search_terms, search_products, name_key
+
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'inventory_search_benchmark')
+
+BRANDS = ['Samsung', 'Redmi', 'Apple', 'Realme', 'Oppo', 'Vivo', 'Boat', 'Noise', 'JBL', 'Sony', 'Lenovo', 'HP']
+KINDS = ['Phone', 'Charger', 'Cable', 'Earbuds', 'Headphones', 'Cover', 'Tempered Glass', 'Power Bank',
+         'Smart Watch', 'Speaker', 'Adapter', 'Memory Card']
+VARIANTS = ['Black', 'Blue', 'White', '64GB', '128GB', '256GB', 'Type-C', 'Lightning', '25W', '45W', 'Pro', 'Max']
+
+QUERIES = ['sam', 'samsung', 'samsung cha', 'earb', 'boat earbuds', 'type c', 'powr bank', 'tempred glass',
+           '128', 'jbl speaker blue']
+
+
+def _catalog(size):
+    rng = random.Random(42)
+    for idx in range(size):
+        name = f"{rng.choice(BRANDS)} {rng.choice(KINDS)} {rng.choice(VARIANTS)} {idx % 97}"
+        barcode = f"PROD{idx:010d}"
+        sku = f"SKU-{idx:06d}"
+        yield {
+            "name": name,
+            "nameLower": name_key(name),
+            "barcode": barcode,
+            "sku": sku,
+            "hsnCode": "8517",
+            "price": 100 + idx % 5000,
+            "quantity": idx % 40,
+            "searchTerms": build_search_terms(name, barcode, sku, "8517"),
+        }
+
+
+def _seed(db, size):
+    db.products.drop()
+    batch = []
+    for product in _catalog(size):
+        batch.append(product)
+        if len(batch) == 5000:
+            db.products.insert_many(batch)
+            batch = []
+    if batch:
+        db.products.insert_many(batch)
+    db.products.create_index("searchTerms")
+    db.products.create_index("barcode", sparse=True)
+    db.products.create_index("sku", sparse=True)
+    db.products.create_index("name")
+    db.products.create_index([("nameLower", 1), ("_id", 1)])
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[int(len(ordered) * 0.95) - 1]
+
+
+def _old_regex_search(db, text):
+    regex = re.compile(re.escape(text), re.IGNORECASE)
+    return list(db.products.find({"$or": [{"name": regex}, {"barcode": regex}, {"hsnCode": regex}]})
+                .sort("name", 1).limit(20))
+
+
+def run(size=50000, iterations=20):
+    uri = os.environ.get('MONGODB_URI')
+    if not uri:
+        print("MONGODB_URI is required")
+        return None
+
+    client = MongoClient(uri)
+    db = client[BENCH_DB_NAME]
+    print(f"Seeding {size} products into '{BENCH_DB_NAME}'...")
+    _seed(db, size)
+
+    projection = {"name": 1, "barcode": 1, "price": 1, "quantity": 1}
+    results = {}
+    try:
+        for label, fn in (("indexed", lambda q: search_products(db, q, 20, projection)),
+                          ("regex", lambda q: _old_regex_search(db, q))):
+            samples = []
+            for query in QUERIES:
+                fn(query)  # warm-up
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    fn(query)
+                    samples.append((time.perf_counter() - start) * 1000)
+            results[label] = _percentiles(samples)
+    finally:
+        client.drop_database(BENCH_DB_NAME)
+
+    print("=" * 50)
+    print(f"PRODUCT SEARCH BENCHMARK ({size} SKUs, {iterations} iterations x {len(QUERIES)} queries)")
+    print("=" * 50)
+    for label, (p50, p95) in results.items():
+        print(f"  {label:<8} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20)
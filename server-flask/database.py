@@ -1,8 +1,17 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 import certifi
 import sys
 import logging
 
+from services.change_feed import TOMBSTONE_RETENTION_DAYS
+from services.customer_keys import customer_match_keys
+from services.product_search import search_terms_for, name_key
+from services.locations import ensure_default_location, open_stock_levels
+from services.stock_ledger import compact_snapshots
+from services.scheduler import SCHEDULER_RUN_RETENTION_DAYS
+from services.emi_installments import migrate_embedded_installments
+from services.warranty_service import backfill_renewal_prices
+
 # Simple global variables to hold the connection state
 client = None
 db = None
@@ -76,6 +85,9 @@ def _create_indexes(database):
         database.customers.create_index("email", unique=True, sparse=True)
         database.customers.create_index("phone", sparse=True)
         database.customers.create_index("name")
+        # Bulk import dedupe: normalised phone (last 10 digits) and lower-cased email
+        database.customers.create_index("phoneNormalized", sparse=True)
+        database.customers.create_index("emailNormalized", sparse=True)
         
         # Bills/Invoices indexes (for Customer Portal reconciliation)
         database.bills.create_index("billNumber", unique=True)
@@ -90,7 +102,199 @@ def _create_indexes(database):
         database.warranties.create_index("customerPhone")
         database.warranties.create_index("expiryDate")
         database.warranties.create_index("invoiceNo")
+        # Admin warranty listing: newest purchase first, optionally by status or expiring window;
+        # renewal prices are re-stamped per product
+        database.warranties.create_index([("startDate", -1), ("_id", -1)])
+        database.warranties.create_index([("status", 1), ("startDate", -1), ("_id", -1)])
+        database.warranties.create_index([("status", 1), ("expiryDate", 1)])
+        database.warranties.create_index("productId")
+
+        # Product list keyset paging on (name, _id); barcode/SKU are unique, see below
+        database.products.create_index([("name", 1), ("_id", 1)])
+        # Import upserts match names case-insensitively (product_import.NAME_COLLATION)
+        database.products.create_index("name", name="name_ci", collation={"locale": "en", "strength": 2})
+        # Search-as-you-type: multikey index over name/code prefixes and name trigrams;
+        # name-prefix hits are a range scan on the lowercased name
+        database.products.create_index("searchTerms")
+        database.products.create_index([("nameLower", 1), ("_id", 1)])
+
+        # Change feed: incremental sync reads by updatedAt; deletes are tombstoned for TOMBSTONE_RETENTION_DAYS
+        database.products.create_index([("updatedAt", 1), ("_id", 1)])
+        database.customers.create_index([("updatedAt", 1), ("_id", 1)])
+        database.bills.create_index([("updatedAt", 1), ("_id", 1)])
+        database.tombstones.create_index([("collection", 1), ("deletedAt", 1)])
+        database.tombstones.create_index("deletedAt", expireAfterSeconds=TOMBSTONE_RETENTION_DAYS * 86400)
+
+        # Stock ledger: per-product history newest first; snapshots fold older movements
+        database.stock_movements.create_index([("productId", 1), ("at", -1), ("_id", -1)])
+        database.stock_movements.create_index("at")
+        database.stock_movements.create_index([("refType", 1), ("refId", 1)])
+        database.stock_snapshot_runs.create_index([("cutoff", -1)])
+        database.stock_reconciliations.create_index([("createdAt", -1)])
+
+        # Locations: one stock level per (product, location); per-store listings read by location first
+        database.locations.create_index("code", unique=True)
+        database.stock_levels.create_index([("productId", 1), ("locationId", 1)], unique=True)
+        database.stock_levels.create_index([("locationId", 1), ("productId", 1)])
+        database.stock_movements.create_index([("locationId", 1), ("at", -1)])
+        database.stock_transfers.create_index([("createdAt", -1)])
+
+        # EMI status sync reads only plans whose next due-date transition has passed
+        database.emi_plans.create_index("nextTransitionAt")
+        # Admin EMI listing: newest first, optionally by status / customer / overdue amount
+        database.emi_plans.create_index([("createdAt", -1), ("_id", -1)])
+        database.emi_plans.create_index([("status", 1), ("createdAt", -1), ("_id", -1)])
+        database.emi_plans.create_index([("customerId", 1), ("createdAt", -1)])
+        database.emi_plans.create_index("overdueAmount")
+        database.emi_plans.create_index("billId")
+        database.emi_plans.create_index("billNumber")
+        # Installments: one row per (plan, number); due-date queries and the forecast read open
+        # installments by status and due date, per customer for its drill-down
+        database.emi_installments.create_index([("planId", 1), ("installmentNo", 1)], unique=True)
+        database.emi_installments.create_index([("status", 1), ("dueDate", 1)])
+        database.emi_installments.create_index([("customerId", 1), ("status", 1), ("dueDate", 1)])
+        database.bills.create_index("paymentMode")
+
+        # Export job queue (worker claims oldest queued job; users list their own jobs)
+        database.export_jobs.create_index([("status", 1), ("createdAt", 1)])
+        database.export_jobs.create_index([("createdBy", 1), ("createdAt", -1)])
+
+        # Photo pipeline: each host claims its own staged uploads, oldest first
+        database.photo_jobs.create_index([("host", 1), ("status", 1), ("createdAt", 1)])
+        database.photo_jobs.create_index("photoId")
+
+        # Scheduler run history per job, newest first; old runs expire after SCHEDULER_RUN_RETENTION_DAYS
+        database.scheduler_runs.create_index([("job", 1), ("startedAt", -1)])
+        database.scheduler_runs.create_index("finishedAt", expireAfterSeconds=SCHEDULER_RUN_RETENTION_DAYS * 86400)
         
         logger.info("🔧 Core & Performance Database Indexes Created Successfully.")
     except Exception as e:
         logger.warning(f"Index creation warning: {e}")
+
+    _create_product_code_indexes(database)
+    _backfill_customer_match_keys(database)
+    _backfill_product_search_terms(database)
+    _open_stock_locations(database)
+    _compact_stock_snapshots(database)
+    _migrate_emi_installments(database)
+    _backfill_warranty_renewal_prices(database)
+
+def _backfill_warranty_renewal_prices(database):
+    """Stamp renewalPrice on warranties written before it was kept (no-op once done)."""
+    try:
+        backfill_renewal_prices(database)
+    except Exception as e:
+        logger.warning(f"Warranty renewal price backfill warning: {e}")
+
+def _migrate_emi_installments(database):
+    """Move embedded EMI installments into their own collection (no-op once done)."""
+    try:
+        migrate_embedded_installments(database)
+    except Exception as e:
+        logger.warning(f"EMI installment migration warning: {e}")
+
+def _compact_stock_snapshots(database):
+    """
+    Keep one current snapshot per product: drop superseded generations, then enforce it with a
+    unique productId index (no-op once the index exists).
+    """
+    try:
+        existing = database.stock_snapshots.index_information()
+        if "productId_unique" in existing:
+            return
+        removed = compact_snapshots(database)
+        database.stock_snapshots.create_index("productId", unique=True, name="productId_unique")
+        if "productId_1_at_-1" in existing:
+            database.stock_snapshots.drop_index("productId_1_at_-1")
+        if removed:
+            logger.info(f"🔧 Removed {removed} superseded stock snapshots")
+    except Exception as e:
+        logger.warning(f"Stock snapshot compaction warning: {e}")
+
+def _open_stock_locations(database):
+    """Create the default location and move pre-location stock into it (no-op once done)."""
+    try:
+        ensure_default_location(database)
+        open_stock_levels(database)
+    except Exception as e:
+        logger.warning(f"Stock location backfill warning: {e}")
+
+def _create_product_code_indexes(database):
+    """
+    Unique barcode and SKU indexes for exact scan lookups. Only string values are indexed,
+    so products without a SKU (or a barcode still being generated) don't collide.
+    Falls back to a plain index if existing data has duplicates, so startup never fails.
+    """
+    existing = database.products.index_information()
+    for field in ("barcode", "sku"):
+        unique_name = f"{field}_unique"
+        if unique_name in existing:
+            continue
+        try:
+            if f"{field}_1" in existing:
+                database.products.drop_index(f"{field}_1")
+            database.products.create_index(
+                field, name=unique_name, unique=True, partialFilterExpression={field: {"$type": "string"}}
+            )
+        except Exception as e:
+            logger.warning(f"Unique {field} index not created (duplicate values?): {e}")
+            try:
+                database.products.create_index(field, sparse=True)
+            except Exception as e2:
+                logger.warning(f"Index creation warning: {e2}")
+
+def _backfill_product_search_terms(database, batch_size=1000):
+    """
+    Index products written before searchTerms/nameLower existed (no-op once done).
+    Reads a batch at a time in _id order, so a large catalog is never held in memory.
+    """
+    try:
+        stamped, last_id = 0, None
+        query = {"$or": [{"searchTerms": {"$exists": False}}, {"nameLower": {"$exists": False}}]}
+        while True:
+            page = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+            batch = list(database.products.find(page, {"name": 1, "barcode": 1, "sku": 1, "hsnCode": 1})
+                         .sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+            database.products.bulk_write([
+                UpdateOne({"_id": product['_id']}, {"$set": {
+                    "searchTerms": search_terms_for(product),
+                    "nameLower": name_key(product.get('name')),
+                }})
+                for product in batch
+            ], ordered=False)
+            stamped += len(batch)
+        if stamped:
+            logger.info(f"🔧 Built search terms for {stamped} products")
+    except Exception as e:
+        logger.warning(f"Product search term backfill warning: {e}")
+
+def _backfill_customer_match_keys(database, batch_size=1000):
+    """
+    Stamp phoneNormalized/emailNormalized on customers created before they existed (no-op once done).
+    Reads a batch at a time in _id order, so customers whose phone holds no digits are passed over once.
+    """
+    try:
+        stamped, last_id = 0, None
+        query = {"phoneNormalized": {"$exists": False}, "emailNormalized": {"$exists": False},
+                 "$or": [{"phone": {"$nin": [None, ""]}}, {"email": {"$nin": [None, ""]}}]}
+        while True:
+            page = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+            batch = list(database.customers.find(page, {"phone": 1, "email": 1}).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+            ops = []
+            for customer in batch:
+                keys = customer_match_keys(customer.get('phone'), customer.get('email'))
+                if keys:
+                    ops.append(UpdateOne({"_id": customer['_id']}, {"$set": keys}))
+            if ops:
+                database.customers.bulk_write(ops, ordered=False)
+                stamped += len(ops)
+        if stamped:
+            logger.info(f"🔧 Backfilled customer match keys on {stamped} customers")
+    except Exception as e:
+        logger.warning(f"Customer match key backfill warning: {e}")
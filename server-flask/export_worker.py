@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Standalone export job worker.
+Claims queued jobs from the export_jobs collection and writes their files to
+EXPORT_JOB_DIR. Run it alongside the web service on the same host (render.yaml
+starts both) so heavy exports never share a process with request handling.
+
+Usage: python export_worker.py [--once]
+"""
+
+import logging
+import sys
+
+from flask import Flask
+
+from config import Config
+from database import connect_db
+from services.export_jobs import run_worker, process_next_job, cleanup_expired_jobs
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    app = Flask('export-worker')
+    app.config.from_object(Config)
+    db = connect_db(app)
+    if db is None:
+        logger.error("Export worker could not connect to MongoDB")
+        sys.exit(1)
+
+    if '--once' in sys.argv:
+        processed = 0
+        while process_next_job(db):
+            processed += 1
+        cleanup_expired_jobs(db)
+        logger.info(f"[export-jobs] Processed {processed} job(s)")
+        return
+
+    run_worker(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Standalone product photo worker.
+Claims photo jobs staged on this host, renders WebP thumbnails and uploads the
+original and variants to Cloudinary. Run it on the same machine (and with the
+same PHOTO_STAGING_DIR) as the web service, with PHOTO_JOBS_INLINE_WORKER=false.
+
+Usage: python photo_worker.py [--once]
+"""
+
+import logging
+import sys
+
+from flask import Flask
+
+from config import Config
+from database import connect_db
+from services.cloudinary_service import init_cloudinary
+from services.photo_pipeline import run_worker, process_next_job, fail_abandoned_jobs
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    app = Flask('photo-worker')
+    app.config.from_object(Config)
+    db = connect_db(app)
+    if db is None:
+        logger.error("Photo worker could not connect to MongoDB")
+        sys.exit(1)
+    init_cloudinary(app)
+
+    if '--once' in sys.argv:
+        processed = 0
+        while process_next_job(db):
+            processed += 1
+        fail_abandoned_jobs(db)
+        logger.info(f"[photo-jobs] Processed {processed} photo(s)")
+        return
+
+    run_worker(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import logging
 import bcrypt
 import os
+import re
 import shutil
 from datetime import datetime, timedelta
 from bson import ObjectId
@@ -11,6 +12,8 @@ from utils.auth_middleware import authenticate_token, require_admin
 from services.audit_service import log_audit
 from utils.constants import ALLOW_ADMIN_PASSWORD_CHANGE
 from utils.tzutils import utc_now, to_iso_string
+from services.scheduler import SCHEDULER_RUN_RETENTION_DAYS, serialize_job_state
+from services.pagination import keyset_page
 
 logger = logging.getLogger(__name__)
 
@@ -75,7 +78,7 @@ def update_company_phone():
     if not re.match(r'^[0-9+\-()\s]{6,30}$', phone_clean):
         return jsonify({"error": "Invalid phone number format"}), 400
 
-    result = db.bills.update_many({}, {"$set": {"companyPhone": phone_clean}})
+    result = db.bills.update_many({}, {"$set": {"companyPhone": phone_clean, "updatedAt": utc_now()}})
     
     log_audit(db, "ADMIN_UPDATE_COMPANY_PHONE", str(admin["_id"]), admin["username"], {
         "companyPhone": phone_clean,
@@ -107,7 +110,7 @@ def clear_database():
         'audit_logs', 'product_images', 'user_images', 'returns',
         'public_invoice_links', 'public_customer_cards', 'notifications',
         'categories', 'warranties', 'payment_links', 'otp_codes',
-        'emi_plans', 'employees'  # Added missing collections
+        'emi_plans', 'emi_installments', 'employees'  # Added missing collections
     ]
 
     for coll in collections_to_clear:
@@ -156,7 +159,7 @@ def wipe_data():
         wipe_results = {}
         collections_to_wipe = [
             'products', 'customers', 'bills', 'expenses',
-            'returns', 'warranties', 'emi_plans', 'payment_links',
+            'returns', 'warranties', 'emi_plans', 'emi_installments', 'payment_links',
             'public_invoice_links', 'public_customer_cards', 'otp_codes',
             'product_images', 'user_images', 'notifications', 'categories'
         ]
@@ -250,123 +253,88 @@ def wipe_data():
         }), 500
 
 
+EMI_LIST_DEFAULT_LIMIT = 50
+EMI_LIST_MAX_LIMIT = 200
+EMI_PLAN_STATUSES = ('active', 'closed', 'defaulted')
+EMI_PLAN_LIST_FIELDS = {
+    "billNumber": 1, "customerId": 1, "customerName": 1, "customerPhone": 1, "totalAmount": 1,
+    "principalAmount": 1, "downPayment": 1, "tenure": 1, "monthlyEmi": 1, "interestRate": 1,
+    "interestMethod": 1, "status": 1, "totalPaid": 1, "outstandingAmount": 1, "overdueAmount": 1,
+    "paidInstallments": 1, "overdueInstallments": 1, "nextDueDate": 1, "createdAt": 1
+}
+
 @admin_bp.route('/emi-plans', methods=['GET'])
 @authenticate_token
 @require_admin
 def get_all_emi_plans():
-    """Fetch all EMI plans for admin dashboard with safe data parsing."""
+    """
+    EMI plans for the admin dashboard, newest first, one keyset page at a time.
+    Reads the status and summary fields kept current by the EMI sync and reconcile jobs.
+    Query: status, customerId, minOverdue, search (bill number / customer name or phone prefix),
+    limit, cursor.
+    """
     try:
-        db = get_db()
-        
-        # 1. Sync check (only for truly missing plans)
-        # Instead of regex searching every request, we just look for 5 most recent EMI bills that might need plans
-        recent_emi_bills = db.bills.find(
-            {"paymentMode": {"$regex": "emi", "$options": "i"}},
-            sort=[("createdAt", -1)]
-        ).limit(10)
-        
-        from dateutil import parser
-        from routes.emi import _sync_emi_plan_status
-        
-        def safe_float(val, default=0.0):
-            try:
-                return float(val or default)
-            except (ValueError, TypeError):
-                return float(default)
-
-        for bill in recent_emi_bills:
-            exists = db.emi_plans.find_one({"billId": bill["_id"]})
-            if not exists:
-                emi_details = bill.get("emiDetails", {})
-                try:
-                    months = int(emi_details.get('months', 0) or 0)
-                except (ValueError, TypeError):
-                    months = 0
-
-                if months > 0:
-                    emi_amt = safe_float(emi_details.get('emiAmount', 0))
-                    bill_date = bill.get('billDate')
-                    if isinstance(bill_date, str):
-                        try:
-                            bill_date = parser.parse(bill_date)
-                        except:
-                            bill_date = utc_now()
-                    elif not bill_date:
-                        bill_date = utc_now()
-
-                    installments = []
-                    for m in range(1, months + 1):
-                        due_date = bill_date + timedelta(days=30 * m)
-                        installments.append({
-                            "installmentNo": m,
-                            "dueDate": due_date,
-                            "amount": emi_amt,
-                            "status": "pending",
-                            "paidAmount": 0,
-                            "paidDate": None
-                        })
-                    
-                    down_payment = safe_float(emi_details.get("downPayment", 0))
-                    grand_total = safe_float(bill.get("grandTotal", 0))
-                    
-                    db.emi_plans.insert_one({
-                        "billId": bill["_id"],
-                        "billNumber": bill.get("billNumber"),
-                        "customerId": bill.get("customerId"),
-                        "customerName": bill.get("customerName"),
-                        "customerPhone": bill.get("customerPhone"),
-                        "totalAmount": grand_total,
-                        "downPayment": down_payment,
-                        "principalAmount": safe_float(emi_details.get("principalAmount"), grand_total - down_payment),
-                        "monthlyEmi": safe_float(emi_details.get("emiAmount"), 0),
-                        "tenure": months,
-                        "interestRate": safe_float(emi_details.get("interestRate"), 0),
-                        "startDate": bill_date,
-                        "status": "active",
-                        "installments": installments,
-                        "createdAt": bill.get('createdAt', utc_now())
-                    })
-
-        # 2. Fetch plans
-        plans_cursor = db.emi_plans.find().sort("createdAt", -1).limit(500)
-        plans_list = []
-        now = utc_now()
-        
-        for p in plans_cursor:
-            try:
-                # Sync status on the fly to ensure accuracy
-                _sync_emi_plan_status(p, now=now)
-                
-                installments = p.get('installments', [])
-                total_paid = sum(safe_float(inst.get('paidAmount', 0)) for inst in installments)
-                
-                plans_list.append({
-                    "id": str(p['_id']),
-                    "billNumber": p.get('billNumber') or "N/A",
-                    "customerId": str(p.get('customerId')) if p.get('customerId') else None,
-                    "customerName": p.get('customerName', 'N/A'),
-                    "customerPhone": p.get('customerPhone', 'N/A'),
-                    "totalAmount": safe_float(p.get('totalAmount', 0)),
-                    "principalAmount": safe_float(p.get('principalAmount', 0)),
-                    "downPayment": safe_float(p.get('downPayment', 0)),
-                    "tenure": int(p.get('tenure', 0) or 0),
-                    "monthlyEmi": safe_float(p.get('monthlyEmi', 0)),
-                    "totalPaid": total_paid,
-                    "status": p.get('status', 'active'),
-                    "createdAt": to_iso_string(p.get('createdAt'))
-                })
-            except Exception as plan_err:
-                logger.warning(f"Error processing EMI plan {p.get('_id')}: {plan_err}")
-                continue
-            
-        return jsonify({"success": True, "emiPlans": plans_list}), 200
-    except Exception as e:
-        logger.error(f"Error fetching EMI plans: {str(e)}", exc_info=True)
-        return jsonify({
-            "error": "Failed to fetch EMI plans", 
-            "message": str(e),
-            "emiPlans": []
-        }), 500
+        limit = min(max(int(request.args.get('limit', EMI_LIST_DEFAULT_LIMIT)), 1), EMI_LIST_MAX_LIMIT)
+        min_overdue = float(request.args['minOverdue']) if request.args.get('minOverdue') else None
+    except ValueError:
+        return jsonify({"error": "limit and minOverdue must be numbers"}), 400
+
+    query = {}
+    status = request.args.get('status', '').strip().lower()
+    if status and status != 'all':
+        if status not in EMI_PLAN_STATUSES:
+            return jsonify({"error": f"status must be one of: {', '.join(EMI_PLAN_STATUSES)}"}), 400
+        query['status'] = status
+    customer_id = request.args.get('customerId', '').strip()
+    if customer_id:
+        if not ObjectId.is_valid(customer_id):
+            return jsonify({"error": "Invalid customer ID"}), 400
+        query['customerId'] = {"$in": [ObjectId(customer_id), customer_id]}
+    if min_overdue is not None:
+        query['overdueAmount'] = {"$gte": min_overdue}
+    search = request.args.get('search', '').strip()
+    if search:
+        prefix = {"$regex": f"^{re.escape(search)}", "$options": "i"}
+        query['$or'] = [{"billNumber": prefix}, {"customerName": prefix}, {"customerPhone": prefix}]
+
+    db = get_db()
+    try:
+        plans, next_cursor = keyset_page(db.emi_plans, query, "createdAt", limit,
+                                         cursor=request.args.get('cursor') or None,
+                                         projection=EMI_PLAN_LIST_FIELDS, direction=-1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    counts = {s: db.emi_plans.count_documents({"status": s}) for s in EMI_PLAN_STATUSES}
+    counts['total'] = sum(counts.values())
+
+    return jsonify({
+        "success": True,
+        "emiPlans": [{
+            "id": str(p['_id']),
+            "billNumber": p.get('billNumber') or "N/A",
+            "customerId": str(p.get('customerId')) if p.get('customerId') else None,
+            "customerName": p.get('customerName', 'N/A'),
+            "customerPhone": p.get('customerPhone', 'N/A'),
+            "totalAmount": p.get('totalAmount', 0),
+            "principalAmount": p.get('principalAmount', 0),
+            "downPayment": p.get('downPayment', 0),
+            "tenure": p.get('tenure', 0),
+            "monthlyEmi": p.get('monthlyEmi', 0),
+            "interestRate": p.get('interestRate', 0),
+            "interestMethod": p.get('interestMethod', 'flat'),
+            "totalPaid": p.get('totalPaid', 0),
+            "outstandingAmount": p.get('outstandingAmount', 0),
+            "overdueAmount": p.get('overdueAmount', 0),
+            "paidInstallments": p.get('paidInstallments', 0),
+            "overdueInstallments": p.get('overdueInstallments', 0),
+            "nextDueDate": to_iso_string(p.get('nextDueDate')),
+            "status": p.get('status', 'active'),
+            "createdAt": to_iso_string(p.get('createdAt'))
+        } for p in plans],
+        "nextCursor": next_cursor,
+        "counts": counts
+    }), 200
 
 
 @admin_bp.route('/database-stats', methods=['GET'])
@@ -454,6 +422,32 @@ def get_audit_logs():
     })
 
 
+@admin_bp.route('/scheduler', methods=['GET'])
+@authenticate_token
+@require_admin
+def get_scheduler_jobs():
+    """Background job schedule, lease holder and the last few runs of each job."""
+    db = get_db()
+    runs_per_job = min(int(request.args.get('runs', 5)), 50)
+    jobs = []
+    for state in db.scheduler_jobs.find().sort("_id", 1):
+        runs = db.scheduler_runs.find({"job": state['_id']}).sort("startedAt", -1).limit(runs_per_job)
+        jobs.append(serialize_job_state(state, runs))
+    return jsonify({"jobs": jobs, "retentionDays": SCHEDULER_RUN_RETENTION_DAYS})
+
+@admin_bp.route('/scheduler/<name>/run', methods=['POST'])
+@authenticate_token
+@require_admin
+def run_scheduler_job_now(name):
+    """Make a job due immediately; the next scheduler poll runs it."""
+    db = get_db()
+    result = db.scheduler_jobs.update_one({"_id": name}, {"$set": {"nextRunAt": utc_now()}})
+    if result.matched_count == 0:
+        return jsonify({"error": "Scheduled job not found"}), 404
+    log_audit(db, "SCHEDULER_JOB_TRIGGERED", g.user.get('userId'), g.user.get('username', 'Unknown'), {"job": name})
+    return jsonify({"success": True, "message": f"{name} will run on the next scheduler poll"})
+
+
 # ==================== PAYMENT REQUESTS (ADMIN) ====================
 
 @admin_bp.route('/payment-requests', methods=['GET'])
@@ -559,40 +553,21 @@ def handle_payment_request(request_id):
             
             elif req['type'] == 'emi_payment':
                 # Logic to record EMI payment
+                from routes.emi import record_installment_payment
                 emi_id = req['targetId']
                 inst_no = int(req.get('data', {}).get('installmentNo', 0))
                 paid_amount = float(req['amount'])
                 
-                emi_plan = db.emi_plans.find_one({"_id": emi_id})
-                if not emi_plan:
+                if not db.emi_plans.find_one({"_id": emi_id}, {"_id": 1}):
                     logger.error(f"[handle_payment_request] ❌ EMI Plan not found: {emi_id}")
                     return jsonify({"error": "Target EMI plan not found in database."}), 404
                     
-                installments = emi_plan.get('installments', [])
-                found_inst = False
-                for inst in installments:
-                    if int(inst.get('installmentNo', 0)) == inst_no:
-                        inst['paidAmount'] = min(float(inst.get('paidAmount', 0)) + paid_amount, float(inst['amount']))
-                        inst['paidDate'] = utc_now()
-                        # Use 'paid' status to match customer portal and other parts of system
-                        inst['status'] = 'paid' if inst['paidAmount'] >= inst['amount'] else 'partial'
-                        found_inst = True
-                        break
-                
-                if not found_inst:
+                try:
+                    recorded = record_installment_payment(db, emi_id, inst_no, paid_amount)
+                except RuntimeError as e:
+                    return jsonify({"error": str(e)}), 409
+                if not recorded:
                     logger.warning(f"[handle_payment_request] ⚠️ Installment #{inst_no} not found in EMI Plan {emi_id}")
-                
-                all_paid = all(str(i.get('status')).lower() == 'paid' for i in installments)
-                db.emi_plans.update_one(
-                    {"_id": emi_id},
-                    {
-                        "$set": {
-                            "installments": installments,
-                            "status": "closed" if all_paid else "active",
-                            "updatedAt": utc_now()
-                        }
-                    }
-                )
 
         # Update request status
         db.payment_requests.update_one(
@@ -12,6 +12,9 @@ from database import get_db
 from utils.auth_middleware import authenticate_token, require_customer
 from utils.constants import COMPANY_NAME, COMPANY_PHONE, COMPANY_ADDRESS, COMPANY_EMAIL, COMPANY_GSTIN
 from services.customer_service import build_vcard, build_pvc_card_pdf
+from services.customer_keys import customer_match_keys
+from services.emi_installments import load_installments
+from services.emi_schedule import PAID_STATUSES
 from utils.tzutils import utc_now, to_iso_string, days_until, is_expired
 
 logger = logging.getLogger(__name__)
@@ -1155,16 +1158,13 @@ def get_customer_emi_plans():
         emi_plans = []
         for emi in emi_cursor:
             try:
-                installments = emi.get('installments', [])
-
-                # Calculate totals
-                total_paid = sum(inst.get('paidAmount', 0) for inst in installments if inst.get('paidAmount'))
+                # Totals and status counts are the plan's summary counters; installments are not read
+                total_paid = emi.get('totalPaid', 0) or 0
                 total_pending = emi.get('totalAmount', 0) - total_paid
-
-                # Count installment statuses
-                paid_count = len([i for i in installments if i.get('status') == 'paid'])
-                partial_count = len([i for i in installments if i.get('status') == 'partial'])
-                pending_count = len([i for i in installments if i.get('status') == 'pending'])
+                installment_count = emi.get('installmentCount', 0)
+                paid_count = emi.get('paidInstallments', 0)
+                partial_count = emi.get('partialInstallments', 0)
+                pending_count = installment_count - paid_count - partial_count - emi.get('overdueInstallments', 0)
 
                 # Safe date formatting
                 start_date_str = emi.get('startDate').isoformat() if emi.get('startDate') and hasattr(emi.get('startDate'), 'isoformat') else None
@@ -1183,7 +1183,7 @@ def get_customer_emi_plans():
                     "endDate": end_date_str,
                     "status": str(emi.get('status', 'active')),
                     "installmentStats": {
-                        "total": len(installments),
+                        "total": installment_count,
                         "paid": paid_count,
                         "partial": partial_count,
                         "pending": pending_count
@@ -1247,14 +1247,14 @@ def get_emi_details(emi_id):
             logger.warning(f"[get_emi_details] ❌ EMI plan not found: {emi_id}")
             return jsonify({"error": "EMI plan not found"}), 404
 
-        installments = emi.get('installments', [])
+        installments = load_installments(db, emi['_id'])
 
         # Calculate totals
         total_paid = sum(inst.get('paidAmount', 0) for inst in installments if inst.get('paidAmount'))
         total_pending = emi.get('totalAmount', 0) - total_paid
 
         # Count installment statuses
-        paid_count = len([i for i in installments if i.get('status') == 'paid'])
+        paid_count = len([i for i in installments if i.get('status') in PAID_STATUSES])
         partial_count = len([i for i in installments if i.get('status') == 'partial'])
         pending_count = len([i for i in installments if i.get('status') == 'pending'])
 
@@ -1376,9 +1376,15 @@ def update_customer_profile():
             return jsonify({"error": "No valid fields to update"}), 400
 
         db = get_db()
+        update_data['updatedAt'] = utc_now()
+        if 'phone' in update_data:
+            update_data.update(customer_match_keys(update_data['phone'], None))
+        update = {"$set": update_data}
+        if 'phone' in update_data and 'phoneNormalized' not in update_data:
+            update["$unset"] = {"phoneNormalized": ""}
         db.customers.update_one(
             {"_id": customer['_id']},
-            {"$set": update_data}
+            update
         )
 
         return jsonify({
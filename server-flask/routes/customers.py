@@ -2,16 +2,21 @@ import io
 import logging
 import re
 import secrets
+import tempfile
 import urllib.parse
 from datetime import datetime, timedelta
 from bson import ObjectId
-from flask import Blueprint, request, jsonify, g, send_file, current_app
+from flask import Blueprint, request, jsonify, g, send_file, current_app, Response
 
 from database import get_db
 from utils.auth_middleware import authenticate_token, require_admin_password
 from services.audit_service import log_audit
+from services.change_feed import record_deletion
 from utils.constants import COMPANY_NAME, COMPANY_PHONE
-from services.customer_service import build_vcard, build_pvc_card_pdf
+from services.customer_service import build_vcard, build_pvc_card_pdf, build_pvc_card_sheet
+from services.customer_keys import customer_match_keys
+from services.customer_import import import_customers
+from services.tabular_import import read_table
 from utils.tzutils import utc_now, to_iso_string
 
 logger = logging.getLogger(__name__)
@@ -99,8 +104,10 @@ def add_customer():
         "purchasesCount": 0,
         "totalPurchases": 0,
         "createdAt": utc_now(),
+        "updatedAt": utc_now(),
         "createdBy": user_id,
-        "createdByUsername": username
+        "createdByUsername": username,
+        **customer_match_keys(phone, email)
     }
 
     result = db.customers.insert_one(customer)
@@ -121,6 +128,41 @@ def add_customer():
 
     return jsonify(customer)
 
+@customers_bp.route('/import', methods=['POST'])
+@authenticate_token
+def import_customers_file():
+    """
+    Bulk import customers from a CSV/XLSX upload (multipart field 'file').
+    Rows are matched to existing customers by normalised phone, then email.
+    Form/query options: onConflict=merge|overwrite|skip (default merge), dryRun=true to validate only.
+    """
+    file = request.files.get('file')
+    on_conflict = (request.form.get('onConflict') or request.args.get('onConflict') or 'merge').lower()
+    dry_run = (request.form.get('dryRun') or request.args.get('dryRun') or '').lower() in ('1', 'true')
+
+    try:
+        frame = read_table(file)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    try:
+        result = import_customers(db, frame, g.user, on_conflict=on_conflict, dry_run=dry_run)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Customer import failed: {e}", exc_info=True)
+        return jsonify({"error": "Customer import failed"}), 500
+
+    if not dry_run:
+        log_audit(db, "CUSTOMERS_IMPORTED", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+            "fileName": file.filename,
+            "onConflict": on_conflict,
+            **{k: v for k, v in result['summary'].items() if k != 'dryRun'}
+        })
+
+    return jsonify(result)
+
 @customers_bp.route('/<id>', methods=['PUT'])
 @authenticate_token
 def update_customer(id):
@@ -166,8 +208,14 @@ def update_customer(id):
         "updatedBy": user_id,
         "updatedByUsername": username
     }
+    match_keys = customer_match_keys(phone, email)
+    updated_data.update(match_keys)
+    cleared_keys = {k: "" for k in ('phoneNormalized', 'emailNormalized') if k not in match_keys}
 
-    db.customers.update_one({"_id": ObjectId(id)}, {"$set": updated_data})
+    update = {"$set": updated_data}
+    if cleared_keys:
+        update["$unset"] = cleared_keys
+    db.customers.update_one({"_id": ObjectId(id)}, update)
 
     log_audit(db, "CUSTOMER_UPDATED", user_id, username, {
         "customerId": id,
@@ -204,6 +252,7 @@ def delete_customer(id):
         return jsonify({"error": f"Cannot delete customer with {bill_count} existing bills. Archive customer instead."}), 400
 
     db.customers.delete_one({"_id": ObjectId(id)})
+    record_deletion(db, 'customers', customer['_id'])
 
     log_audit(db, "CUSTOMER_DELETED", user_id, username, {
         "customerId": id,
@@ -341,6 +390,71 @@ def get_pvc_card_pdf(id):
         download_name=f"{safe_name}_card.pdf"
     )
 
+PVC_SHEET_MAX_CARDS = 1000
+PVC_SHEET_STREAM_CHUNK = 64 * 1024
+PVC_CARD_FIELDS = {
+    "name": 1, "phone": 1, "email": 1, "company": 1, "position": 1, "website": 1,
+    "address": 1, "place": 1, "city": 1, "pincode": 1, "country": 1, "gstin": 1,
+}
+
+@customers_bp.route('/pvc-cards', methods=['POST'])
+@authenticate_token
+def get_pvc_card_sheet():
+    """Generate PVC cards for many customers, imposed onto A4 sheets, as one streamed PDF.
+
+    Body: {"customerIds": [...]} for a selection, or {"all": true} for every customer (by name).
+    """
+    data = request.get_json() or {}
+    db = get_db()
+
+    if data.get('all'):
+        query = {}
+    else:
+        customer_ids = data.get('customerIds') or []
+        if not isinstance(customer_ids, list) or not customer_ids:
+            return jsonify({"error": "customerIds must be a non-empty list (or pass all: true)"}), 400
+        invalid = [cid for cid in customer_ids if not ObjectId.is_valid(str(cid))]
+        if invalid:
+            return jsonify({"error": "Invalid customer ID", "invalid": invalid}), 400
+        query = {"_id": {"$in": [ObjectId(str(cid)) for cid in customer_ids]}}
+
+    customers = list(db.customers.find(query, PVC_CARD_FIELDS).sort("name", 1).limit(PVC_SHEET_MAX_CARDS + 1))
+    if not customers:
+        return jsonify({"error": "No customers found"}), 404
+    if len(customers) > PVC_SHEET_MAX_CARDS:
+        return jsonify({"error": f"Too many cards requested; limit is {PVC_SHEET_MAX_CARDS} per sheet run"}), 400
+
+    # Render to a spooled temp file: small runs stay in memory, large ones spill to disk
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        build_pvc_card_sheet(customers, spool, COMPANY_NAME, COMPANY_PHONE)
+    except Exception as e:
+        spool.close()
+        logger.error(f"PVC card sheet generation error: {e}")
+        return jsonify({"error": "Failed to generate card sheet"}), 500
+    size = spool.tell()
+    spool.seek(0)
+
+    def generate():
+        try:
+            while True:
+                chunk = spool.read(PVC_SHEET_STREAM_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            spool.close()
+
+    filename = f"customer_cards_{utc_now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return Response(
+        generate(),
+        mimetype='application/pdf',
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(size),
+        }
+    )
+
 @customers_bp.route('/<id>/purchases', methods=['GET'])
 @authenticate_token
 def get_customer_purchases(id):
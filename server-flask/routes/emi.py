@@ -1,11 +1,22 @@
+import copy
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
 from flask import Blueprint, request, jsonify, g
 from database import get_db
 from utils.auth_middleware import authenticate_token, require_admin
 from services.audit_service import log_audit
+from services.emi_forecast import emi_forecast, FORECAST_DEFAULT_MONTHS, FORECAST_MAX_MONTHS
 from utils.tzutils import utc_now, to_iso_string
+from services.emi_schedule import (
+    INTEREST_FLAT, INTEREST_METHODS, PAID_STATUSES, PREPAY_MODES, PREPAY_REDUCE_EMI,
+    build_installments, schedule_totals, outstanding_principal, recompute_after_prepayment, plan_summary
+)
+from services.emi_installments import (
+    INSTALLMENT_PROJECTION, create_plan, load_installments, installments_by_plan, status_snapshot,
+    status_update_ops, replace_open_installments, lock_open_installments, unlock_installments, unlocked_filter
+)
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +24,7 @@ emi_bp = Blueprint('emi', __name__)
 
 # Constants
 EMI_TENURES = [3, 6, 12, 24]  # months
-EMI_INTEREST_PERCENT = 0  # Zero interest EMI
+EMI_INTEREST_PERCENT = 0  # Default annual rate; plans may set interestRate/interestMethod
 EMI_MIN_AMOUNT = 5000  # Minimum amount to offer EMI
 
 
@@ -77,31 +88,248 @@ def _sync_emi_plan_status(emi_plan, now=None):
     return changed
 
 
+def _next_transition_at(emi_plan, now=None):
+    """
+    When the plan's statuses next change without a write: `now` if a sync would change something
+    already, else the earliest due date of an unpaid installment not yet overdue, else None.
+    """
+    now = now or utc_now()
+    if _sync_emi_plan_status(copy.deepcopy(emi_plan), now=now):
+        return now
+
+    upcoming = []
+    for installment in emi_plan.get('installments', []):
+        due_date = _ensure_aware_datetime(installment.get('dueDate'))
+        if not due_date or installment.get('status') in ('overdue', 'completed'):
+            continue
+        if float(installment.get('paidAmount', 0) or 0) < float(installment.get('amount', 0) or 0):
+            upcoming.append(due_date)
+    return min(upcoming) if upcoming else None
+
+
+def _plan_status_fields(emi_plan, now=None):
+    """$set fields for a plan whose installments/status were just (re)computed."""
+    now = now or utc_now()
+    return {
+        "status": emi_plan.get('status', 'active'),
+        "nextTransitionAt": _next_transition_at(emi_plan, now),
+        **plan_summary(emi_plan.get('installments', [])),
+        "updatedAt": now
+    }
+
+
+def _load_plan(db, query):
+    """A plan with its installments attached, or None."""
+    emi_plan = db.emi_plans.find_one(query)
+    if emi_plan:
+        emi_plan['installments'] = load_installments(db, emi_plan['_id'])
+    return emi_plan
+
+
+def _sync_and_save(db, emi_plan, now=None, refresh=False):
+    """
+    Sync a loaded plan's statuses and write back only the installment rows that changed.
+    With refresh, the plan's summary counters are rewritten even if no status changed.
+    """
+    now = now or utc_now()
+    snapshot = status_snapshot(emi_plan['installments'])
+    if not _sync_emi_plan_status(emi_plan, now=now) and not refresh:
+        return False
+    ops = status_update_ops(emi_plan['installments'], snapshot, now)
+    if ops:
+        db.emi_installments.bulk_write(ops, ordered=False)
+    db.emi_plans.update_one({"_id": emi_plan['_id']}, {"$set": _plan_status_fields(emi_plan, now)})
+    return True
+
+
+EMI_SYNC_BATCH_SIZE = 500
+
+
+def _sync_batch(db, plans, now):
+    """Sync one batch of plans: one read of their installments, one bulk_write per collection."""
+    rows = installments_by_plan(db, [p['_id'] for p in plans])
+    installment_ops, plan_ops, changed_plans = [], [], 0
+    for emi_plan in plans:
+        emi_plan['installments'] = rows.get(emi_plan['_id'], [])
+        snapshot = status_snapshot(emi_plan['installments'])
+        if _sync_emi_plan_status(emi_plan, now=now):
+            changed_plans += 1
+            installment_ops.extend(status_update_ops(emi_plan['installments'], snapshot, now))
+        # Guard on updatedAt so a payment recorded meanwhile is not overwritten; it is retried next run
+        plan_ops.append(UpdateOne(
+            {"_id": emi_plan['_id'], "updatedAt": emi_plan.get('updatedAt')},
+            {"$set": _plan_status_fields(emi_plan, now)}
+        ))
+    if installment_ops:
+        db.emi_installments.bulk_write(installment_ops, ordered=False)
+    if plan_ops:
+        db.emi_plans.bulk_write(plan_ops, ordered=False)
+    return changed_plans, len(installment_ops)
+
+
 def sync_all_emi_statuses(db=None):
+    """
+    Bring due plans up to date. Only plans whose nextTransitionAt has passed (or that were never
+    stamped) are read; each batch reads its installments in one indexed query and writes back
+    only the rows whose status changed, so the cost follows the number of installments changing
+    rather than the size of either collection.
+    """
     db = db or get_db()
     now = utc_now()
     updated_plans = 0
     updated_installments = 0
 
-    for emi_plan in db.emi_plans.find({}):
-        original_installments = len(emi_plan.get('installments', []))
-        if _sync_emi_plan_status(emi_plan, now=now):
-            db.emi_plans.update_one(
-                {"_id": emi_plan['_id']},
-                {"$set": {
-                    "installments": emi_plan.get('installments', []),
-                    "status": emi_plan.get('status', 'active'),
-                    "updatedAt": now
-                }}
-            )
-            updated_plans += 1
-            updated_installments += original_installments
+    due = db.emi_plans.find({"$or": [
+        {"nextTransitionAt": {"$lte": now}},
+        {"nextTransitionAt": {"$exists": False}},
+    ]}).batch_size(EMI_SYNC_BATCH_SIZE)
+
+    batch = []
+    for emi_plan in due:
+        batch.append(emi_plan)
+        if len(batch) >= EMI_SYNC_BATCH_SIZE:
+            plans, installments = _sync_batch(db, batch, now)
+            updated_plans += plans
+            updated_installments += installments
+            batch = []
+    if batch:
+        plans, installments = _sync_batch(db, batch, now)
+        updated_plans += plans
+        updated_installments += installments
 
     return {
         "updatedPlans": updated_plans,
         "updatedInstallments": updated_installments
     }
 
+
+def record_installment_payment(db, plan_id, installment_no, amount, payment_method=None, notes=None):
+    """
+    Add *amount* to one installment (capped at its amount) with a single-row update, then refresh
+    the plan's status and summary counters. Returns (installment, plan) or None if the installment
+    does not exist.
+    """
+    for _ in range(3):
+        installment = db.emi_installments.find_one({"planId": plan_id, "installmentNo": installment_no})
+        if not installment:
+            return None
+        due_amount = float(installment.get('amount', 0) or 0)
+        paid_before = installment.get('paidAmount', 0)
+        paid = min(float(paid_before or 0) + amount, due_amount)
+        now = utc_now()
+        fields = {
+            "paidAmount": paid,
+            "paidDate": now,
+            "status": 'completed' if paid >= due_amount else 'partial',
+            "updatedAt": now,
+        }
+        if payment_method is not None:
+            fields['paymentMethod'] = payment_method
+        if notes is not None:
+            fields['notes'] = notes
+        # Guarded on the amount read above; a concurrent payment to the same installment retries.
+        # Rows a prepayment is rebuilding are locked and refused.
+        installment = db.emi_installments.find_one_and_update(
+            {"_id": installment['_id'], "paidAmount": paid_before, **unlocked_filter(now)},
+            {"$set": fields},
+            projection=INSTALLMENT_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if installment:
+            break
+    else:
+        raise RuntimeError(f"Installment {installment_no} kept changing while recording the payment")
+
+    emi_plan = _load_plan(db, {"_id": plan_id})
+    _sync_and_save(db, emi_plan, now, refresh=True)
+    return installment, emi_plan
+
+EMI_BILL_PAYMENT_MODES = ['emi', 'EMI', 'Emi']
+
+
+def _plan_from_bill(bill):
+    """EMI plan document for an EMI bill, or None if the bill carries no usable EMI details."""
+    emi_details = bill.get('emiDetails') or {}
+    try:
+        months = int(emi_details.get('months', 0) or 0)
+        down_payment = float(emi_details.get('downPayment', 0) or 0)
+        grand_total = float(bill.get('grandTotal', 0) or 0)
+        principal = float(emi_details.get('principalAmount') or grand_total - down_payment)
+        interest_rate = float(emi_details.get('interestRate', 0) or 0)
+    except (ValueError, TypeError):
+        return None
+    if months < 1 or principal <= 0:
+        return None
+
+    interest_method = emi_details.get('interestMethod', INTEREST_FLAT)
+    if interest_method not in INTEREST_METHODS:
+        interest_method = INTEREST_FLAT
+    bill_date = _ensure_aware_datetime(bill.get('billDate')) or _ensure_aware_datetime(bill.get('createdAt')) or utc_now()
+    installments = build_installments(principal, months, bill_date, interest_rate, interest_method)
+
+    return {
+        "billId": bill['_id'],
+        "billNumber": bill.get('billNumber'),
+        "customerId": bill.get('customerId'),
+        "customerName": bill.get('customerName'),
+        "customerPhone": bill.get('customerPhone'),
+        "totalAmount": grand_total,
+        "downPayment": down_payment,
+        "principalAmount": principal,
+        "monthlyEmi": installments[0]['amount'],
+        "tenure": months,
+        "interestRate": interest_rate,
+        "interestMethod": interest_method,
+        "totalInterest": schedule_totals(installments)['totalInterest'],
+        "startDate": bill_date,
+        "endDate": installments[-1]['dueDate'],
+        "status": "active",
+        "installments": installments,
+        "createdAt": bill.get('createdAt') or utc_now(),
+    }
+
+
+def reconcile_emi_plans(db=None):
+    """
+    Scheduled repair for the EMI listing: create plans for EMI bills that have none, and stamp
+    status/summary counters on plans written before they existed. The admin listing only reads.
+    """
+    db = db or get_db()
+    now = utc_now()
+    missing = db.bills.aggregate([
+        {"$match": {"paymentMode": {"$in": EMI_BILL_PAYMENT_MODES}}},
+        {"$lookup": {"from": "emi_plans", "localField": "_id", "foreignField": "billId", "as": "plan"}},
+        {"$match": {"plan": {"$size": 0}}},
+        {"$project": {"plan": 0, "items": 0}},
+    ])
+    created = 0
+    for bill in missing:
+        plan = _plan_from_bill(bill)
+        if not plan:
+            continue
+        _sync_emi_plan_status(plan, now=now)
+        plan.update(_plan_status_fields(plan, now))
+        create_plan(db, plan, plan['installments'])
+        created += 1
+
+    stamped = 0
+    batch = []
+    unstamped = db.emi_plans.find({"installmentCount": {"$exists": False}}).batch_size(EMI_SYNC_BATCH_SIZE)
+    for emi_plan in unstamped:
+        batch.append(emi_plan)
+        if len(batch) >= EMI_SYNC_BATCH_SIZE:
+            _sync_batch(db, batch, now)
+            stamped += len(batch)
+            batch = []
+    if batch:
+        _sync_batch(db, batch, now)
+        stamped += len(batch)
+
+    if created or stamped:
+        logger.info(f"[emi-reconcile] Created {created} missing plans, stamped {stamped} plans")
+    return {"createdPlans": created, "stampedPlans": stamped}
+
+
 @emi_bp.route('/', methods=['POST'])
 @authenticate_token
 def create_emi():
@@ -120,8 +348,15 @@ def create_emi():
         total_amount = float(data['amount'])
         down_payment = float(data.get('downPayment', 0))  # Can be 0 or higher
         tenure = int(data['tenure'])
+        interest_rate = float(data.get('interestRate', EMI_INTEREST_PERCENT))
     except (ValueError, TypeError) as e:
         return jsonify({"error": f"Invalid data format: {str(e)}"}), 400
+    interest_method = data.get('interestMethod', INTEREST_FLAT)
+
+    if interest_rate < 0:
+        return jsonify({"error": "Interest rate cannot be negative"}), 400
+    if interest_method not in INTEREST_METHODS:
+        return jsonify({"error": f"interestMethod must be one of: {', '.join(INTEREST_METHODS)}"}), 400
 
     # Validate down payment
     if down_payment < 0:
@@ -153,29 +388,11 @@ def create_emi():
     if not bill:
         return jsonify({"error": "Bill not found"}), 404
 
-    # Calculate EMI with 0% interest
-    # Monthly amount = Principal / Tenure months
-    monthly_emi = round(principal_amount / tenure, 2)
-    last_emi = round(principal_amount - (monthly_emi * (tenure - 1)), 2)
-
-    # Generate installments
-    installments = []
     start_date = utc_now()
-
-    for i in range(tenure):
-        due_date = start_date + timedelta(days=30 * (i + 1))
-        amount = last_emi if i == tenure - 1 else monthly_emi
-
-        installments.append({
-            "installmentNo": i + 1,
-            "dueDate": due_date,
-            "amount": amount,
-            "paidAmount": 0,
-            "status": "pending",  # pending, partial, completed, overdue
-            "paidDate": None,
-            "paymentMethod": None,
-            "notes": None
-        })
+    installments = build_installments(principal_amount, tenure, start_date, interest_rate, interest_method)
+    totals = schedule_totals(installments)
+    monthly_emi = totals['monthlyEmi']
+    end_date = installments[-1]['dueDate']
 
     # Create EMI plan document
     emi_plan = {
@@ -189,27 +406,29 @@ def create_emi():
         "principalAmount": principal_amount,  # Amount to be financed
         "tenure": tenure,
         "monthlyEmi": monthly_emi,
-        "totalInterest": 0,  # Zero interest
+        "interestRate": interest_rate,
+        "interestMethod": interest_method,
+        "totalInterest": totals['totalInterest'],
         "startDate": start_date,
-        "endDate": start_date + timedelta(days=30 * tenure),
+        "endDate": end_date,
         "status": "active",  # active, closed, defaulted
-        "installments": installments,
+        "nextTransitionAt": installments[0]['dueDate'] if installments else None,
         "createdBy": g.user.get('userId'),
         "createdAt": utc_now(),
         "updatedAt": utc_now(),
         "notes": data.get('notes', '')
     }
 
-    # Insert EMI plan
-    result = db.emi_plans.insert_one(emi_plan)
-    emi_plan['_id'] = result.inserted_id
+    # Insert EMI plan and its installment rows
+    emi_plan['_id'] = create_plan(db, emi_plan, installments)
 
     # Update bill with EMI reference
     db.bills.update_one(
         {"_id": bill_id},
         {"$set": {
-            "emiPlanId": result.inserted_id,
+            "emiPlanId": emi_plan['_id'],
             "emiEnabled": True,
+            "updatedAt": utc_now(),
             "emiDownPayment": down_payment,
             "emiTotalAmount": total_amount,
             "emiMonthlyAmount": monthly_emi,
@@ -222,14 +441,14 @@ def create_emi():
     log_audit(
         action="create_emi",
         entity="EMI Plan",
-        entity_id=str(result.inserted_id),
+        entity_id=str(emi_plan['_id']),
         details=f"Created EMI plan for bill {bill.get('billNumber')} - {tenure} months, Down payment: ₹{down_payment}"
     )
 
     down_payment_msg = f" (Down payment: ₹{down_payment})" if down_payment > 0 else ""
     return jsonify({
         "success": True,
-        "emiPlanId": str(result.inserted_id),
+        "emiPlanId": str(emi_plan['_id']),
         "message": f"EMI plan created: {tenure} months @ ₹{monthly_emi}/month{down_payment_msg}",
         "emiPlan": {
             "_id": str(emi_plan['_id']),
@@ -238,12 +457,44 @@ def create_emi():
             "principalAmount": principal_amount,
             "monthlyEmi": monthly_emi,
             "tenure": tenure,
+            "interestRate": interest_rate,
+            "interestMethod": interest_method,
+            "totalInterest": totals['totalInterest'],
             "startDate": start_date.isoformat(),
-            "endDate": (start_date + timedelta(days=30 * tenure)).isoformat()
+            "endDate": end_date.isoformat()
         }
     }), 201
 
 
+@emi_bp.route('/forecast', methods=['GET'])
+@authenticate_token
+@require_admin
+def get_emi_forecast():
+    """
+    EMI collections due per IST week and month, plus overdue totals and a per-customer breakdown.
+    Query: months (horizon, default 3), customerId (drill-down with per-plan detail), refresh=true.
+    """
+    try:
+        months = int(request.args.get('months', FORECAST_DEFAULT_MONTHS))
+    except ValueError:
+        return jsonify({"error": "months must be a number"}), 400
+    if not 1 <= months <= FORECAST_MAX_MONTHS:
+        return jsonify({"error": f"months must be between 1 and {FORECAST_MAX_MONTHS}"}), 400
+
+    customer_id = request.args.get('customerId', '').strip() or None
+    if customer_id:
+        if not ObjectId.is_valid(customer_id):
+            return jsonify({"error": "Invalid customer ID"}), 400
+        customer_id = ObjectId(customer_id)
+
+    try:
+        report = emi_forecast(get_db(), months, customer_id, refresh=request.args.get('refresh') == 'true')
+    except Exception as e:
+        logger.error(f"EMI forecast error: {e}", exc_info=True)
+        return jsonify({"error": "Failed to build EMI forecast"}), 500
+    return jsonify({"success": True, **report}), 200
+
+
 @emi_bp.route('/<emi_id>', methods=['GET'])
 @authenticate_token
 def get_emi(emi_id):
@@ -254,20 +505,12 @@ def get_emi(emi_id):
         return jsonify({"error": "Invalid EMI ID"}), 400
 
     db = get_db()
-    emi_plan = db.emi_plans.find_one({"_id": emi_id_obj})
+    emi_plan = _load_plan(db, {"_id": emi_id_obj})
 
     if not emi_plan:
         return jsonify({"error": "EMI plan not found"}), 404
 
-    if _sync_emi_plan_status(emi_plan):
-        db.emi_plans.update_one(
-            {"_id": emi_id_obj},
-            {"$set": {
-                "installments": emi_plan.get('installments', []),
-                "status": emi_plan.get('status', 'active'),
-                "updatedAt": utc_now()
-            }}
-        )
+    _sync_and_save(db, emi_plan)
 
     emi_plan['_id'] = str(emi_plan['_id'])
     emi_plan['billId'] = str(emi_plan['billId'])
@@ -279,10 +522,13 @@ def get_emi(emi_id):
 
     # Format installments
     for inst in emi_plan['installments']:
+        inst.pop('_id', None)
         inst['dueDate'] = inst['dueDate'].isoformat()
         if inst['paidDate']:
             inst['paidDate'] = inst['paidDate'].isoformat()
 
+    emi_plan['nextDueDate'] = to_iso_string(emi_plan.get('nextDueDate'))
+    emi_plan['nextTransitionAt'] = to_iso_string(emi_plan.get('nextTransitionAt'))
     return jsonify(emi_plan), 200
 
 
@@ -312,18 +558,12 @@ def get_customer_emi_plans(customer_id):
     # Get EMI plans
     emi_plans = list(db.emi_plans.find(query).sort("createdAt", -1).skip(skip).limit(limit))
     total = db.emi_plans.count_documents(query)
+    installments = installments_by_plan(db, [plan['_id'] for plan in emi_plans])
 
     # Format response
     for plan in emi_plans:
-        if _sync_emi_plan_status(plan):
-            db.emi_plans.update_one(
-                {"_id": plan['_id']},
-                {"$set": {
-                    "installments": plan.get('installments', []),
-                    "status": plan.get('status', 'active'),
-                    "updatedAt": utc_now()
-                }}
-            )
+        plan['installments'] = installments.get(plan['_id'], [])
+        _sync_and_save(db, plan)
 
         plan['_id'] = str(plan['_id'])
         plan['billId'] = str(plan['billId'])
@@ -348,9 +588,12 @@ def get_customer_emi_plans(customer_id):
 
         # Format installments
         for inst in plan['installments']:
+            inst.pop('_id', None)
             inst['dueDate'] = inst['dueDate'].isoformat()
             if inst['paidDate']:
                 inst['paidDate'] = inst['paidDate'].isoformat()
+        plan['nextDueDate'] = to_iso_string(plan.get('nextDueDate'))
+        plan['nextTransitionAt'] = to_iso_string(plan.get('nextTransitionAt'))
 
     return jsonify({
         "success": True,
@@ -385,60 +628,31 @@ def record_emi_payment(emi_id):
     notes = data.get('notes', '')
 
     db = get_db()
-    emi_plan = db.emi_plans.find_one({"_id": emi_id_obj})
-
-    if not emi_plan:
+    if not db.emi_plans.find_one({"_id": emi_id_obj}, {"_id": 1}):
         return jsonify({"error": "EMI plan not found"}), 404
 
-    # Find installment
-    installment_idx = None
-    for idx, inst in enumerate(emi_plan['installments']):
-        if inst['installmentNo'] == installment_no:
-            installment_idx = idx
-            break
-
-    if installment_idx is None:
+    installment = db.emi_installments.find_one({"planId": emi_id_obj, "installmentNo": installment_no},
+                                               {"amount": 1})
+    if not installment:
         return jsonify({"error": "Installment not found"}), 404
 
-    installment = emi_plan['installments'][installment_idx]
-    due_amount = installment['amount']
-
     # Validate amount
+    due_amount = installment['amount']
     if paid_amount > due_amount:
         return jsonify({"error": f"Payment exceeds due amount (₹{due_amount})"}), 400
 
-    # Update installment
-    installment['paidAmount'] = min(installment['paidAmount'] + paid_amount, due_amount)
-    installment['paidDate'] = utc_now()
-    installment['paymentMethod'] = payment_method
-    installment['notes'] = notes
-
-    if installment['paidAmount'] >= due_amount:
-        installment['status'] = 'completed'
-    else:
-        installment['status'] = 'partial'
-
-    # Check if all installments are paid
-    all_paid = all(inst['status'] == 'completed' for inst in emi_plan['installments'])
-    new_status = 'closed' if all_paid else 'active'
-
-    # Update EMI plan
-    db.emi_plans.update_one(
-        {"_id": emi_id_obj},
-        {"$set": {
-            "installments": emi_plan['installments'],
-            "status": new_status,
-            "updatedAt": utc_now()
-        }}
-    )
+    try:
+        installment, emi_plan = record_installment_payment(
+            db, emi_id_obj, installment_no, paid_amount, payment_method, notes
+        )
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    new_status = emi_plan['status']
 
     # Log audit
-    log_audit(
-        action="emi_payment",
-        entity="EMI Payment",
-        entity_id=str(emi_id_obj),
-        details=f"Installment {installment_no} payment: ₹{paid_amount}"
-    )
+    log_audit(db, "EMI_PAYMENT", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+        "emiPlanId": emi_id, "installmentNo": installment_no, "amount": paid_amount
+    })
 
     return jsonify({
         "success": True,
@@ -453,6 +667,105 @@ def record_emi_payment(emi_id):
     }), 200
 
 
+@emi_bp.route('/<emi_id>/prepayment', methods=['POST'])
+@authenticate_token
+@require_admin
+def record_emi_prepayment(emi_id):
+    """
+    Apply a part-prepayment to the outstanding principal and rebuild the open installments.
+    Body: {"amount", "mode": "reduce_emi" | "reduce_tenure", "paymentMethod", "notes"}
+    """
+    try:
+        emi_id_obj = ObjectId(emi_id)
+    except Exception:
+        return jsonify({"error": "Invalid EMI ID"}), 400
+
+    data = request.get_json() or {}
+    mode = data.get('mode', PREPAY_REDUCE_EMI)
+    if mode not in PREPAY_MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(PREPAY_MODES)}"}), 400
+    try:
+        amount = round(float(data.get('amount')), 2)
+    except (TypeError, ValueError):
+        return jsonify({"error": "A numeric amount is required"}), 400
+
+    db = get_db()
+    emi_plan = _load_plan(db, {"_id": emi_id_obj})
+    if not emi_plan:
+        return jsonify({"error": "EMI plan not found"}), 404
+    if emi_plan.get('status') == 'closed':
+        return jsonify({"error": "EMI plan is already closed"}), 400
+
+    stored_open = [i for i in emi_plan.get('installments', []) if i.get('status') not in PAID_STATUSES]
+    outstanding_before = outstanding_principal(emi_plan.get('installments', []))
+    try:
+        installments = recompute_after_prepayment(emi_plan, amount, mode)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    now = utc_now()
+    prepayment = {
+        "amount": amount,
+        "mode": mode,
+        "outstandingBefore": outstanding_before,
+        "paymentMethod": data.get('paymentMethod', 'unknown'),
+        "notes": data.get('notes', ''),
+        "paidDate": now,
+        "recordedBy": g.user.get('userId'),
+    }
+    emi_plan['installments'] = installments
+    snapshot = status_snapshot(installments)
+    _sync_emi_plan_status(emi_plan, now=now)
+    open_installments = [i for i in installments if i.get('status') not in PAID_STATUSES]
+    if not open_installments:
+        emi_plan['status'] = 'closed'
+    fields = _plan_status_fields(emi_plan, now)
+    fields.update({
+        "monthlyEmi": open_installments[0]['amount'] if open_installments else emi_plan.get('monthlyEmi', 0),
+        "totalInterest": schedule_totals(installments)['totalInterest'],
+        "endDate": installments[-1]['dueDate'] if installments else now,
+    })
+
+    # Lock the open rows first: a payment that already landed on one fails the lock, and payments
+    # arriving later are refused until the rebuilt rows replace them. The updatedAt guard then
+    # keeps a concurrent prepayment or plan update from being overwritten.
+    token = ObjectId()
+    conflict = jsonify({"error": "EMI plan changed while recording the prepayment, please retry"}), 409
+    if not lock_open_installments(db, emi_id_obj, stored_open, token, now):
+        return conflict
+    result = db.emi_plans.update_one(
+        {"_id": emi_id_obj, "updatedAt": emi_plan.get('updatedAt')},
+        {"$set": fields, "$push": {"prepayments": prepayment}}
+    )
+    if result.matched_count == 0:
+        unlock_installments(db, token)
+        return conflict
+    replace_open_installments(db, emi_plan, installments, token)
+    status_ops = status_update_ops(installments, snapshot, now)
+    if status_ops:
+        db.emi_installments.bulk_write(status_ops, ordered=False)
+
+    log_audit(db, "EMI_PREPAYMENT", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+        "emiPlanId": emi_id, "amount": amount, "mode": mode, "outstandingBefore": outstanding_before
+    })
+
+    return jsonify({
+        "success": True,
+        "message": f"Prepayment of ₹{amount} recorded",
+        "emiStatus": fields['status'],
+        "monthlyEmi": fields['monthlyEmi'],
+        "outstandingPrincipal": outstanding_principal(installments),
+        "installments": [{
+            "installmentNo": i['installmentNo'],
+            "dueDate": to_iso_string(i['dueDate']),
+            "amount": i['amount'],
+            "principal": i.get('principal'),
+            "interest": i.get('interest'),
+            "status": i.get('status'),
+        } for i in installments]
+    }), 200
+
+
 @emi_bp.route('/cleanup/statuses', methods=['POST'])
 @authenticate_token
 @require_admin
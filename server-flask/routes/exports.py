@@ -1,218 +1,383 @@
-import csv
-import io
+import json
 import logging
-from datetime import datetime
-from flask import Blueprint, request, send_file, jsonify
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from flask import Blueprint, request, jsonify, Response, send_file, g
 from database import get_db
 from utils.auth_middleware import authenticate_token
 from utils.tzutils import utc_now, to_iso_string
+from services.export_service import (
+    EXPORT_FORMATS, resolve_columns, build_query, date_range_query, iter_rows, iter_csv,
+    write_export, iter_file, export_filename
+)
+from services.change_feed import (
+    CHANGE_FEED_COLLECTIONS, TokenExpired, current_high_water, decode_token, encode_token, iter_changes
+)
+from services.export_jobs import (
+    enqueue_export_job, get_job, serialize_job, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_CANCELLED
+)
+from services.pdf_service import (
+    default_company_info, get_cached_invoice_pdf, render_invoice_pdf_job, prune_invoice_pdf_cache
+)
 
 logger = logging.getLogger(__name__)
 
 exports_bp = Blueprint('exports', __name__)
 
+PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS', min(4, os.cpu_count() or 1)))
+# Renders allowed in flight per worker; bounds how many PDFs sit in memory at once
+PDF_EXPORT_QUEUE_FACTOR = 2
+# Columnar exports stay in memory up to this size before spilling to disk
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# One render pool per web process, started on the first archive request and shared by later ones
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_EXPORT_WORKERS)
+        return _pdf_pool
+
+
+def _discard_pdf_pool(pool):
+    """Drop a pool whose worker died so the next request starts a fresh one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _ZipStreamBuffer:
+    """Write-only sink for zipfile; the archive is drained chunk by chunk instead of kept whole."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_name(bill_number, bill_id, used):
+    """Entry name for one invoice; a bill number already in the archive gets the bill id appended."""
+    safe = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(bill_number))
+    name = f"Invoice_{safe}.pdf"
+    if name in used:
+        name = f"Invoice_{safe}_{bill_id}.pdf"
+    used.add(name)
+    return name
+
+def _stream_export(name):
+    """
+    Shared handler for tabular exports.
+    Query params: format=csv|xlsx|parquet, columns=key1,key2 (subset and order),
+    startDate/endDate (YYYY-MM-DD) for dated datasets.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+
+    keys = [key.strip() for key in request.args.get('columns', '').split(',') if key.strip()]
+    try:
+        columns = resolve_columns(name, keys)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        query = build_query(name, request.args.get('startDate'), request.args.get('endDate'))
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    filename = export_filename(name, fmt, utc_now().strftime('%Y%m%d'))
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    mimetype = EXPORT_FORMATS[fmt]['mimetype']
+
+    if fmt == 'csv':
+        return Response(iter_csv(iter_rows(name, query, columns), columns), mimetype=mimetype, headers=headers)
+
+    # XLSX and Parquet need their footer written before the first byte is usable,
+    # so they are built in a spooled temp file (disk-backed past a few MB) and then streamed
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    try:
+        write_export(name, fmt, query, columns, spool)
+    except Exception as e:
+        spool.close()
+        logger.error(f"{fmt} export of {name} failed: {e}")
+        return jsonify({"error": f"Failed to build {fmt} export"}), 500
+    headers['Content-Length'] = str(spool.tell())
+    spool.seek(0)
+    return Response(iter_file(spool), mimetype=mimetype, headers=headers)
+
 @exports_bp.route('/products', methods=['GET'])
 @authenticate_token
 def export_products():
     """Export all products to CSV"""
-    db = get_db()
-    products = list(db.products.find().sort("name", 1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header row
-    writer.writerow(['Product Name', 'Category', 'Price (Inclusive)', 'Cost Price', 'Stock Quantity', 'HSN/SKU', 'Status'])
-    
-    for p in products:
-        writer.writerow([
-            p.get('name', 'N/A'),
-            p.get('category', 'General'),
-            p.get('price', 0),
-            p.get('costPrice', 0),
-            p.get('quantity', 0),
-            p.get('hsnCode', 'N/A'),
-            'In Stock' if p.get('quantity', 0) > 0 else 'Out of Stock'
-        ])
-    
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"products_export_{utc_now().strftime('%Y%m%d')}.csv"
-    )
+    return _stream_export('products')
 
 @exports_bp.route('/customers', methods=['GET'])
 @authenticate_token
 def export_customers():
     """Export all customers to CSV"""
-    db = get_db()
-    customers = list(db.customers.find().sort("name", 1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header row
-    writer.writerow(['Name', 'Phone', 'Email', 'Address', 'Place', 'City', 'GSTIN', 'Member Since'])
-    
-    for c in customers:
-        created_at = c.get('createdAt')
-        date_str = created_at.strftime('%Y-%m-%d') if isinstance(created_at, datetime) else 'N/A'
-        
-        writer.writerow([
-            c.get('name', 'N/A'),
-            c.get('phone', 'N/A'),
-            c.get('email', 'N/A'),
-            c.get('address', 'N/A'),
-            c.get('place', 'N/A'),
-            c.get('city', 'N/A'),
-            c.get('gstin', 'N/A'),
-            date_str
-        ])
-    
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"customers_export_{utc_now().strftime('%Y%m%d')}.csv"
-    )
+    return _stream_export('customers')
 
 @exports_bp.route('/invoices', methods=['GET'])
 @authenticate_token
 def export_invoices():
-    """Export invoice history to CSV with date range filtering"""
-    db = get_db()
-    start_date = request.args.get('startDate')
-    end_date = request.args.get('endDate')
-    
-    query = {}
-    if start_date or end_date:
-        query['billDate'] = {}
-        if start_date:
-            query['billDate']['$gte'] = datetime.strptime(start_date, '%Y-%m-%d')
-        if end_date:
-            # End of day for the end_date
-            query['billDate']['$lte'] = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-            
-    bills = list(db.bills.find(query).sort("billDate", -1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header row
-    writer.writerow(['Invoice No', 'Date', 'Customer Name', 'Subtotal', 'Tax (GST)', 'Grand Total', 'Profit', 'Payment Mode'])
-    
-    for b in bills:
-        bill_date = b.get('billDate')
-        date_str = bill_date.strftime('%Y-%m-%d %H:%M') if isinstance(bill_date, datetime) else str(bill_date)
-        
-        writer.writerow([
-            b.get('billNumber', 'N/A'),
-            date_str,
-            b.get('customerName', 'Walk-in'),
-            round(b.get('subtotal', 0), 2),
-            round(b.get('gstAmount', 0), 2),
-            round(b.get('grandTotal', 0), 2),
-            round(b.get('totalProfit', 0), 2),
-            b.get('paymentMode', 'cash')
-        ])
-    
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"invoices_export_{utc_now().strftime('%Y%m%d')}.csv"
-    )
+    """Export invoice history with date range filtering (?level=line for one row per item)"""
+    level = request.args.get('level', 'invoice').lower()
+    if level not in ('invoice', 'line'):
+        return jsonify({"error": "level must be invoice or line"}), 400
+    return _stream_export('invoice_lines' if level == 'line' else 'invoices')
 
 @exports_bp.route('/expenses', methods=['GET'])
 @authenticate_token
 def export_expenses():
     """Export business expenses to CSV"""
-    db = get_db()
-    start_date = request.args.get('startDate')
-    end_date = request.args.get('endDate')
-    
-    query = {}
-    if start_date or end_date:
-        query['date'] = {}
-        if start_date:
-            query['date']['$gte'] = datetime.strptime(start_date, '%Y-%m-%d')
-        if end_date:
-            query['date']['$lte'] = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-            
-    expenses = list(db.expenses.find(query).sort("date", -1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header row
-    writer.writerow(['Date', 'Description', 'Category', 'Amount', 'Mode'])
-    
-    for e in expenses:
-        exp_date = e.get('date')
-        date_str = exp_date.strftime('%Y-%m-%d') if isinstance(exp_date, datetime) else str(exp_date)
-        
-        writer.writerow([
-            date_str,
-            e.get('description', 'N/A'),
-            e.get('category', 'General'),
-            round(e.get('amount', 0), 2),
-            e.get('mode', 'cash')
-        ])
-    
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"expenses_export_{utc_now().strftime('%Y%m%d')}.csv"
-    )
+    return _stream_export('expenses')
 
 @exports_bp.route('/returns', methods=['GET'])
 @authenticate_token
 def export_returns():
     """Export product returns to CSV"""
+    return _stream_export('returns')
+
+@exports_bp.route('/invoices/pdf-archive', methods=['GET'])
+@authenticate_token
+def export_invoice_pdf_archive():
+    """
+    Stream every invoice PDF in a date range as a ZIP archive.
+    PDFs are rendered in this process's shared render pool and written to the response as they
+    finish; renders already in the disk cache are reused without touching the pool.
+    """
+    try:
+        query = date_range_query('billDate', request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+
+    db = get_db()
+    company_info = default_company_info()
+    max_in_flight = max(1, PDF_EXPORT_WORKERS * PDF_EXPORT_QUEUE_FACTOR)
+
+    def generate():
+        sink = _ZipStreamBuffer()
+        archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED)
+        pool = None
+        pending = {}
+        used_names = set()
+        failures = []
+        written = 0
+
+        def add(bill_id, bill_number, pdf_bytes, error):
+            nonlocal written
+            if error or pdf_bytes is None:
+                failures.append(f"{bill_number}: {error or 'render failed'}")
+                return
+            archive.writestr(_archive_name(bill_number, bill_id, used_names), pdf_bytes)
+            written += 1
+
+        def collect():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                add(pending.pop(future), *future.result())
+
+        try:
+            cursor = db.bills.find(query).sort("billDate", 1).batch_size(50)
+            for invoice in cursor:
+                cached = get_cached_invoice_pdf(invoice, company_info)
+                if cached is not None:
+                    add(invoice['_id'], invoice.get('billNumber') or invoice['_id'], cached, None)
+                    yield sink.drain()
+                    continue
+
+                if pool is None:
+                    pool = _get_pdf_pool()
+                pending[pool.submit(render_invoice_pdf_job, invoice, company_info)] = invoice['_id']
+
+                if len(pending) >= max_in_flight:
+                    collect()
+                    yield sink.drain()
+
+            while pending:
+                collect()
+                yield sink.drain()
+
+            if failures:
+                archive.writestr('errors.txt', "\n".join(failures) + "\n")
+            archive.close()
+            yield sink.drain()
+
+            logger.info(f"[pdf-archive] Streamed {written} invoice PDFs ({len(failures)} failed)")
+        except BrokenProcessPool:
+            _discard_pdf_pool(pool)
+            raise
+        finally:
+            # The pool outlives this request; only this archive's queued renders are dropped
+            for future in pending:
+                future.cancel()
+            prune_invoice_pdf_cache()
+
+    label = f"{request.args.get('from') or 'start'}_{request.args.get('to') or utc_now().strftime('%Y-%m-%d')}"
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="invoices_{label}.zip"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+# ==================== INCREMENTAL CHANGE FEED ====================
+
+@exports_bp.route('/changes', methods=['GET'])
+@authenticate_token
+def export_changes():
+    """
+    Stream records inserted, updated or deleted since a sync token, as NDJSON.
+    Without ?since= the first run returns a full snapshot. The last line is a
+    checkpoint carrying nextToken; a response without it was cut off and should be retried.
+    Optional ?collections=products,customers,bills narrows the feed.
+    """
+    collections = [c.strip() for c in request.args.get('collections', '').split(',') if c.strip()]
+    collections = collections or list(CHANGE_FEED_COLLECTIONS)
+    unknown = [c for c in collections if c not in CHANGE_FEED_COLLECTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown collection(s): {', '.join(unknown)}. Available: {', '.join(CHANGE_FEED_COLLECTIONS)}"}), 400
+
+    since = None
+    token = request.args.get('since')
+    if token:
+        try:
+            since = decode_token(token)
+        except TokenExpired:
+            return jsonify({"error": "Sync token is older than the tombstone retention window; run a full sync without since"}), 410
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    until = current_high_water()
     db = get_db()
-    start_date = request.args.get('startDate')
-    end_date = request.args.get('endDate')
-    
-    query = {}
-    if start_date or end_date:
-        query['returnDate'] = {}
-        if start_date:
-            query['returnDate']['$gte'] = datetime.strptime(start_date, '%Y-%m-%d')
-        if end_date:
-            query['returnDate']['$lte'] = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-            
-    returns = list(db.returns.find(query).sort("returnDate", -1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header row
-    writer.writerow(['Return ID', 'Date', 'Invoice No', 'Product Name', 'Quantity', 'Refund Amount', 'Reason'])
-    
-    for r in returns:
-        return_date = r.get('returnDate')
-        date_str = return_date.strftime('%Y-%m-%d') if isinstance(return_date, datetime) else str(return_date)
-        
-        writer.writerow([
-            str(r.get('_id')),
-            date_str,
-            r.get('billNumber', 'N/A'),
-            r.get('productName', 'N/A'),
-            r.get('quantity', 0),
-            round(r.get('refundAmount', 0), 2),
-            r.get('reason', 'N/A')
-        ])
-    
-    output.seek(0)
+
+    def generate():
+        counts = {}
+        for event in iter_changes(db, since, until, collections, counts):
+            yield json.dumps(event, default=str) + '\n'
+        yield json.dumps({
+            "op": "checkpoint",
+            "fullSync": since is None,
+            "since": to_iso_string(since),
+            "until": to_iso_string(until),
+            "counts": counts,
+            "nextToken": encode_token(until),
+        }) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+# ==================== BACKGROUND EXPORT JOBS ====================
+
+def _can_access_job(job):
+    return g.user.get('role') == 'admin' or job.get('createdBy') == g.user.get('userId')
+
+
+@exports_bp.route('/jobs', methods=['POST'])
+@authenticate_token
+def create_export_job():
+    """
+    Queue an export to be built by the export worker.
+    Body: {dataset, format, columns, startDate, endDate}; datasets match the direct export
+    endpoints, plus invoice_lines for line-level invoices.
+    """
+    db = get_db()
+    try:
+        job = enqueue_export_job(db, request.get_json() or {}, g.user)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(serialize_job(job)), 202
+
+
+@exports_bp.route('/jobs', methods=['GET'])
+@authenticate_token
+def list_export_jobs():
+    db = get_db()
+    query = {} if g.user.get('role') == 'admin' else {"createdBy": g.user.get('userId')}
+    jobs = db.export_jobs.find(query).sort("createdAt", -1).limit(50)
+    return jsonify([serialize_job(job) for job in jobs])
+
+
+@exports_bp.route('/jobs/<job_id>', methods=['GET'])
+@authenticate_token
+def get_export_job(job_id):
+    """Job status and progress; ?download=true serves the artifact once the job is done."""
+    job = get_job(get_db(), job_id)
+    if not job or not _can_access_job(job):
+        return jsonify({"error": "Export job not found"}), 404
+    if request.args.get('download', '').lower() in ('1', 'true'):
+        return download_export_job(job_id)
+    return jsonify(serialize_job(job))
+
+
+@exports_bp.route('/jobs/<job_id>/download', methods=['GET'])
+@authenticate_token
+def download_export_job(job_id):
+    job = get_job(get_db(), job_id)
+    if not job or not _can_access_job(job):
+        return jsonify({"error": "Export job not found"}), 404
+    if job.get('status') != JOB_DONE:
+        return jsonify({"error": f"Export is not ready (status: {job.get('status')})"}), 409
+
+    artifact = job.get('artifact') or {}
+    path = artifact.get('path')
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Export file is no longer available"}), 410
     return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
+        path,
+        mimetype=artifact.get('mimetype'),
         as_attachment=True,
-        download_name=f"returns_export_{utc_now().strftime('%Y%m%d')}.csv"
+        download_name=artifact.get('filename')
     )
+
+
+@exports_bp.route('/jobs/<job_id>', methods=['DELETE'])
+@authenticate_token
+def cancel_export_job(job_id):
+    """Cancel a queued/running job, or delete a finished job and its file."""
+    db = get_db()
+    job = get_job(db, job_id)
+    if not job or not _can_access_job(job):
+        return jsonify({"error": "Export job not found"}), 404
+
+    now = utc_now()
+    if job.get('status') == JOB_QUEUED:
+        db.export_jobs.update_one(
+            {"_id": job['_id'], "status": JOB_QUEUED},
+            {"$set": {"status": JOB_CANCELLED, "finishedAt": now, "updatedAt": now}}
+        )
+        return jsonify({"message": "Export job cancelled"})
+    if job.get('status') == JOB_RUNNING:
+        db.export_jobs.update_one({"_id": job['_id']}, {"$set": {"cancelRequested": True, "updatedAt": now}})
+        return jsonify({"message": "Cancellation requested"}), 202
+
+    path = (job.get('artifact') or {}).get('path')
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    db.export_jobs.delete_one({"_id": job['_id']})
+    return jsonify({"message": "Export job deleted"})
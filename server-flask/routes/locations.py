@@ -0,0 +1,223 @@
+import logging
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from flask import Blueprint, request, jsonify, g
+
+from database import get_db
+from utils.auth_middleware import authenticate_token, require_admin
+from services.audit_service import log_audit
+from services.locations import (
+    LOCATION_TYPES, InsufficientStock, resolve_location, transfer_stock, availability, serialize_location
+)
+from services.stock_ledger import record_movements, REASON_TRANSFER_OUT, REASON_TRANSFER_IN
+from utils.tzutils import utc_now, to_iso_string
+
+logger = logging.getLogger(__name__)
+
+locations_bp = Blueprint('locations', __name__)
+
+TRANSFER_MAX_ITEMS = 500
+AVAILABILITY_MAX_PRODUCTS = 500
+
+@locations_bp.route('/', methods=['GET'])
+@authenticate_token
+def get_locations():
+    db = get_db()
+    query = {} if request.args.get('includeInactive') == 'true' else {"active": True}
+    locations = db.locations.find(query).sort([("isDefault", -1), ("name", 1)])
+    return jsonify([serialize_location(l) for l in locations])
+
+@locations_bp.route('/', methods=['POST'])
+@authenticate_token
+@require_admin
+def add_location():
+    data = request.get_json() or {}
+    code = str(data.get('code', '')).strip().upper()
+    name = str(data.get('name', '')).strip()
+    location_type = data.get('type', 'store')
+
+    if not code or not name:
+        return jsonify({"error": "Location code and name are required"}), 400
+    if location_type not in LOCATION_TYPES:
+        return jsonify({"error": f"type must be one of: {', '.join(LOCATION_TYPES)}"}), 400
+
+    db = get_db()
+    location = {
+        "code": code,
+        "name": name,
+        "type": location_type,
+        "address": str(data.get('address', '')).strip(),
+        "isDefault": False,
+        "active": True,
+        "createdAt": utc_now(),
+        "updatedAt": utc_now()
+    }
+    try:
+        result = db.locations.insert_one(location)
+    except DuplicateKeyError:
+        return jsonify({"error": f"Location code {code} already exists"}), 409
+
+    log_audit(db, "LOCATION_CREATED", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+        "locationId": str(result.inserted_id), "code": code, "name": name
+    })
+    return jsonify(serialize_location(location)), 201
+
+@locations_bp.route('/<id>', methods=['PUT'])
+@authenticate_token
+@require_admin
+def update_location(id):
+    if not ObjectId.is_valid(id):
+        return jsonify({"error": "Invalid location ID"}), 400
+    data = request.get_json() or {}
+    db = get_db()
+    location = db.locations.find_one({"_id": ObjectId(id)})
+    if not location:
+        return jsonify({"error": "Location not found"}), 404
+
+    update = {"updatedAt": utc_now()}
+    if 'name' in data:
+        update['name'] = str(data['name']).strip()
+    if 'address' in data:
+        update['address'] = str(data['address']).strip()
+    if 'type' in data:
+        if data['type'] not in LOCATION_TYPES:
+            return jsonify({"error": f"type must be one of: {', '.join(LOCATION_TYPES)}"}), 400
+        update['type'] = data['type']
+    if 'active' in data:
+        if location.get('isDefault') and not data['active']:
+            return jsonify({"error": "The default location cannot be deactivated"}), 400
+        update['active'] = bool(data['active'])
+
+    db.locations.update_one({"_id": location['_id']}, {"$set": update})
+    log_audit(db, "LOCATION_UPDATED", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+        "locationId": id, "changes": list(update)
+    })
+    return jsonify(serialize_location({**location, **update}))
+
+@locations_bp.route('/availability', methods=['GET'])
+@authenticate_token
+def get_availability():
+    """
+    Stock per location for a set of products.
+    Query: productIds (comma-separated, required), locationIds (comma-separated ids or codes, optional).
+    """
+    raw_ids = [p for p in request.args.get('productIds', '').split(',') if p.strip()]
+    if not raw_ids:
+        return jsonify({"error": "productIds is required"}), 400
+    if len(raw_ids) > AVAILABILITY_MAX_PRODUCTS:
+        return jsonify({"error": f"At most {AVAILABILITY_MAX_PRODUCTS} products per request"}), 400
+    if not all(ObjectId.is_valid(p.strip()) for p in raw_ids):
+        return jsonify({"error": "Invalid product ID"}), 400
+
+    db = get_db()
+    try:
+        location_ids = [
+            resolve_location(db, l.strip()) for l in request.args.get('locationIds', '').split(',') if l.strip()
+        ]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    product_ids = [ObjectId(p.strip()) for p in raw_ids]
+    levels = availability(db, product_ids, location_ids)
+    return jsonify([{
+        "productId": str(product_id),
+        "total": levels.get(product_id, {}).get('total', 0),
+        "locations": {
+            str(location_id): quantity
+            for location_id, quantity in levels.get(product_id, {}).get('locations', {}).items()
+        }
+    } for product_id in product_ids])
+
+@locations_bp.route('/transfers', methods=['POST'])
+@authenticate_token
+@require_admin
+def create_transfer():
+    """
+    Move stock between locations; all lines move or none do.
+    Body: {"fromLocationId", "toLocationId", "items": [{"productId", "quantity"}], "note"}
+    """
+    data = request.get_json() or {}
+    if not data.get('fromLocationId') or not data.get('toLocationId'):
+        return jsonify({"error": "fromLocationId and toLocationId are required"}), 400
+    db = get_db()
+    try:
+        from_location = resolve_location(db, data.get('fromLocationId'))
+        to_location = resolve_location(db, data.get('toLocationId'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if from_location == to_location:
+        return jsonify({"error": "Source and destination must differ"}), 400
+
+    items = data.get('items') or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "At least one item is required"}), 400
+    if len(items) > TRANSFER_MAX_ITEMS:
+        return jsonify({"error": f"At most {TRANSFER_MAX_ITEMS} items per transfer"}), 400
+
+    merged = {}
+    for item in items:
+        product_id = str(item.get('productId', ''))
+        try:
+            quantity = float(item.get('quantity') or 0)
+        except (TypeError, ValueError):
+            quantity = 0
+        if not ObjectId.is_valid(product_id) or quantity <= 0:
+            return jsonify({"error": "Each item needs a valid productId and a positive quantity"}), 400
+        merged[ObjectId(product_id)] = merged.get(ObjectId(product_id), 0) + quantity
+    lines = list(merged.items())
+
+    transfer_id = ObjectId()
+    try:
+        transfer_stock(db, transfer_id, from_location, to_location, lines)
+    except InsufficientStock as e:
+        return jsonify({"error": "Insufficient stock at source location", "shortages": e.shortages}), 409
+
+    note = str(data.get('note', '')).strip() or None
+    record_movements(db, [(pid, -qty) for pid, qty in lines], REASON_TRANSFER_OUT, 'transfer', transfer_id,
+                     g.user, note=note, location_id=from_location)
+    record_movements(db, lines, REASON_TRANSFER_IN, 'transfer', transfer_id, g.user, note=note, location_id=to_location)
+
+    transfer = {
+        "_id": transfer_id,
+        "fromLocationId": from_location,
+        "toLocationId": to_location,
+        "items": [{"productId": pid, "quantity": qty} for pid, qty in lines],
+        "note": note,
+        "createdAt": utc_now(),
+        "createdBy": g.user.get('userId'),
+        "createdByUsername": g.user.get('username')
+    }
+    db.stock_transfers.insert_one(transfer)
+
+    log_audit(db, "STOCK_TRANSFERRED", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+        "transferId": str(transfer_id),
+        "fromLocationId": str(from_location),
+        "toLocationId": str(to_location),
+        "itemCount": len(lines)
+    })
+    return jsonify(_format_transfer(transfer)), 201
+
+@locations_bp.route('/transfers', methods=['GET'])
+@authenticate_token
+def get_transfers():
+    db = get_db()
+    query = {}
+    if request.args.get('locationId'):
+        try:
+            location_id = resolve_location(db, request.args['locationId'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query["$or"] = [{"fromLocationId": location_id}, {"toLocationId": location_id}]
+    transfers = db.stock_transfers.find(query).sort("createdAt", -1).limit(100)
+    return jsonify([_format_transfer(t) for t in transfers])
+
+def _format_transfer(t):
+    return {
+        "id": str(t['_id']),
+        "fromLocationId": str(t['fromLocationId']),
+        "toLocationId": str(t['toLocationId']),
+        "items": [{"productId": str(i['productId']), "quantity": i['quantity']} for i in t.get('items', [])],
+        "note": t.get('note'),
+        "createdAt": to_iso_string(t.get('createdAt')),
+        "createdByUsername": t.get('createdByUsername')
+    }
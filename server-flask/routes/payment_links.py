@@ -4,14 +4,12 @@ Handles UPI payment link generation and tracking
 """
 
 import logging
-import qrcode
-import io
-import base64
 from datetime import datetime, timedelta
 from bson import ObjectId
 from flask import Blueprint, request, jsonify, current_app, g
 
 from database import get_db
+from services import barcode_service
 from utils.auth_middleware import authenticate_token, require_admin
 from utils.tzutils import utc_now, to_iso_string
 
@@ -47,24 +45,7 @@ def generate_upi_string(upi, name, amount, transaction_id):
 def generate_qr_code(upi_string):
     """Generate QR code from UPI string and return as base64"""
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=2
-        )
-        qr.add_data(upi_string)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        # Convert to base64
-        img_io = io.BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
-        qr_base64 = base64.b64encode(img_io.getvalue()).decode()
-
-        return f"data:image/png;base64,{qr_base64}"
+        return barcode_service.generate_qr_code(upi_string, fmt='png', box_size=10, border=2, error='L')
     except Exception as e:
         logger.error(f"QR code generation error: {e}")
         return None
@@ -342,26 +323,28 @@ def delete_payment_link(payment_link_id):
 
 # ==================== AUTO-EXPIRY ====================
 
+def expire_payment_links(db):
+    """Mark pending links past their expiry date as expired. Returns how many changed."""
+    result = db.payment_links.update_many(
+        {
+            "expiryDate": {"$lt": utc_now()},
+            "status": {"$in": ["pending"]}
+        },
+        {
+            "$set": {"status": "expired"}
+        }
+    )
+    return result.modified_count
+
 @payment_links_bp.route('/cleanup/expired', methods=['POST'])
 def cleanup_expired_links():
     """Mark expired payment links as expired (can be called by scheduler)"""
     try:
-        db = get_db()
-
-        # Find and update expired links
-        result = db.payment_links.update_many(
-            {
-                "expiryDate": {"$lt": utc_now()},
-                "status": {"$in": ["pending"]}
-            },
-            {
-                "$set": {"status": "expired"}
-            }
-        )
+        expired = expire_payment_links(get_db())
 
         return jsonify({
             "success": True,
-            "message": f"Marked {result.modified_count} payment links as expired"
+            "message": f"Marked {expired} payment links as expired"
         })
 
     except Exception as e:
@@ -9,6 +9,13 @@ from flask import Blueprint, request, jsonify, g, url_for, current_app
 from database import get_db
 from utils.auth_middleware import authenticate_token, require_admin_password
 from services.audit_service import log_audit
+from services.change_feed import record_deletion
+from services.stock_ledger import apply_stock_changes, REASON_SALE, REASON_SALE_REVERSAL
+from services.locations import resolve_location
+from services.emi_schedule import (
+    INTEREST_FLAT, INTEREST_METHODS, add_months, build_installments, schedule_totals
+)
+from services.emi_installments import create_plan, delete_plans
 from utils.constants import COMPANY_NAME, COMPANY_PHONE, COMPANY_ADDRESS, COMPANY_EMAIL, COMPANY_GSTIN
 from utils.tzutils import utc_now, to_iso_string, format_ist_datetime, utc_to_ist, format_ist_date
 
@@ -44,6 +51,10 @@ def checkout():
             }
 
         db = get_db()
+        try:
+            location_id = resolve_location(db, data.get('locationId'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Get customer details
         customer_name = "Walk-in Customer"
@@ -94,6 +105,7 @@ def checkout():
             "discountPercent": discount_percent,
             "paymentMode": payment_mode,
             "paymentStatus": "Paid",
+            "locationId": location_id,
             "billDate": bill_date,
             "items": [],
             "createdBy": user_id,
@@ -107,26 +119,27 @@ def checkout():
             emi_data = data.get('emiDetails', {})
             months = int(emi_data.get('months', 0))
             down_payment = float(emi_data.get('downPayment', 0))
-            emi_amount = float(emi_data.get('emiAmount', 0))
             interest_rate = float(emi_data.get('interestRate', 0))
+            interest_method = emi_data.get('interestMethod', INTEREST_FLAT)
+            if months < 1:
+                return jsonify({"error": "EMI months must be at least 1"}), 400
+            if interest_method not in INTEREST_METHODS:
+                return jsonify({"error": f"interestMethod must be one of: {', '.join(INTEREST_METHODS)}"}), 400
 
-            # Calculate total amount from items (will be set later)
-            # EMI start date is bill date, end date is months later
-            emi_start = bill_date
-            emi_end = bill_date + timedelta(days=30 * months)
-
+            # Amounts and the end date are set from the schedule once the total is known
             bill["emiDetails"] = {
                 "months": months,
-                "emiAmount": emi_amount,
                 "downPayment": down_payment,
                 "interestRate": interest_rate,
-                "startDate": emi_start,
-                "endDate": emi_end
+                "interestMethod": interest_method,
+                "startDate": bill_date,
+                "endDate": add_months(bill_date, months)
             }
 
         # Calculate item aggregates
         # discount_factor is applied proportionally to each item's subtotal for per-item GST
         discount_factor = 1.0 - (discount_percent / 100.0)
+        renewal_prices = {}  # productId -> warranty renewal price, stamped on the warranties below
 
         for it in items:
             prod_id = it.get('productId')
@@ -138,6 +151,7 @@ def checkout():
             qty = float(it.get('quantity', 0))
             unit_price = float(it.get('price', 0)) # Inclusive of GST
             prod_cost = float(product.get('costPrice', 0))
+            renewal_prices[product['_id']] = float(product.get('warrantyRenewalPrice', 0) or 0)
             line_gst_percent = float(product.get('gstPercent', 18) or 18)
 
             # Extract base price by removing GST component
@@ -172,12 +186,6 @@ def checkout():
             subtotal += line_subtotal_inclusive
             total_cost += line_cost
 
-            # Deduct inventory
-            db.products.update_one(
-                {"_id": ObjectId(prod_id)},
-                {"$inc": {"quantity": -qty}}
-            )
-
         # Tax & Discount Math (subtotal is inclusive of GST)
         discount_amount = (subtotal * discount_percent) / 100
         after_discount = subtotal - discount_amount
@@ -214,30 +222,33 @@ def checkout():
         bill["totalCost"] = round(total_cost, 2)
         bill["totalProfit"] = round(total_profit, 2)
 
-        # Add total amount to EMI details
+        # Add total amount to EMI details and price the schedule
+        emi_installments = []
         if payment_mode == 'emi' and "emiDetails" in bill:
-            bill["emiDetails"]["totalAmount"] = bill["grandTotal"]
+            emi_details = bill["emiDetails"]
+            emi_details["totalAmount"] = bill["grandTotal"]
+            emi_details["principalAmount"] = round(bill["grandTotal"] - emi_details["downPayment"], 2)
+            if emi_details["principalAmount"] <= 0:
+                return jsonify({"error": "Down payment must be less than the bill total"}), 400
+            emi_installments = build_installments(
+                emi_details["principalAmount"], emi_details["months"], bill_date,
+                emi_details["interestRate"], emi_details["interestMethod"]
+            )
+            totals = schedule_totals(emi_installments)
+            emi_details["emiAmount"] = totals["monthlyEmi"]
+            emi_details["totalInterest"] = totals["totalInterest"]
 
+        bill["createdAt"] = bill["updatedAt"] = utc_now()
         result = db.bills.insert_one(bill)
         bill_id = result.inserted_id
 
+        # Deduct inventory (one bulk $inc plus the matching ledger movements)
+        apply_stock_changes(db, [(i["productId"], -i["quantity"]) for i in bill["items"]],
+                            REASON_SALE, 'bill', bill_id, g.user, location_id=location_id)
+
         # Create EMI Plan if applicable
         if payment_mode == 'emi' and "emiDetails" in bill:
             emi_details = bill["emiDetails"]
-            
-            # Generate installment schedule
-            installments = []
-            for m in range(1, int(emi_details['months']) + 1):
-                due_date = bill_date + timedelta(days=30 * m)
-                installments.append({
-                    "installmentNo": m,
-                    "dueDate": due_date,
-                    "amount": float(emi_details['emiAmount']),
-                    "status": "pending",
-                    "paidAmount": 0,
-                    "paidDate": None
-                })
-            
             emi_plan = {
                 "billId": bill_id,
                 "billNumber": bill_number,
@@ -246,17 +257,19 @@ def checkout():
                 "customerPhone": customer_phone,
                 "totalAmount": bill["grandTotal"],
                 "downPayment": float(emi_details['downPayment']),
-                "principalAmount": float(emi_details.get('principalAmount', bill["grandTotal"] - float(emi_details['downPayment']))),
-                "monthlyEmi": float(emi_details['emiAmount']),
-                "tenure": int(emi_details['months']),
-                "interestRate": float(emi_details.get('interestRate', 0)),
+                "principalAmount": emi_details['principalAmount'],
+                "monthlyEmi": emi_details['emiAmount'],
+                "tenure": emi_details['months'],
+                "interestRate": emi_details['interestRate'],
+                "interestMethod": emi_details['interestMethod'],
+                "totalInterest": emi_details['totalInterest'],
                 "startDate": bill_date,
-                "endDate": emi_details.get('endDate') if isinstance(emi_details.get('endDate'), datetime) else (bill_date + timedelta(days=30 * int(emi_details['months']))),
+                "endDate": emi_installments[-1]["dueDate"],
                 "status": "active",
-                "installments": installments,
+                "nextTransitionAt": emi_installments[0]["dueDate"],
                 "createdAt": utc_now()
             }
-            db.emi_plans.insert_one(emi_plan)
+            create_plan(db, emi_plan, emi_installments)
 
         # Auto-generate warranties for registered customers
         if customer_id:
@@ -285,6 +298,8 @@ def checkout():
                     "expiryDate": expiry_date,
                     "status": "active",
                     "invoiceNo": bill_number,
+                    "renewalPrice": renewal_prices.get(i.get("productId"), 0),
+                    "renewalPriceAt": utc_now(),
                     "createdAt": utc_now()
                 })
 
@@ -375,6 +390,7 @@ def get_invoices():
             "profit": b.get("totalProfit", 0),
             "paymentMode": b.get("paymentMode", "cash"),
             "paymentStatus": b.get("paymentStatus", "Paid"),
+            "locationId": str(b["locationId"]) if b.get("locationId") else None,
             "splitPaymentDetails": spd,
             "emiDetails": b.get("emiDetails"),
             "items": [{
@@ -698,25 +714,24 @@ def delete_invoice(id):
 
         # 2. Restore inventory for all items in the invoice
         items = invoice.get('items', [])
-        restored_count = 0
-        for item in items:
-            product_id = item.get('productId')
-            quantity = float(item.get('quantity', 0))
-            if product_id and quantity > 0:
-                db.products.update_one(
-                    {"_id": ObjectId(product_id)},
-                    {"$inc": {"quantity": quantity}}
-                )
-                restored_count += 1
+        restored = [
+            (item.get('productId'), float(item.get('quantity', 0)))
+            for item in items
+            if item.get('productId') and float(item.get('quantity', 0)) > 0
+        ]
+        apply_stock_changes(db, restored, REASON_SALE_REVERSAL, 'bill', invoice['_id'], g.user,
+                            location_id=invoice.get('locationId'))
+        restored_count = len(restored)
 
         # 3. Delete linked warranties
         db.warranties.delete_many({"invoiceNo": bill_number})
 
-        # 4. Delete linked EMI plans
-        db.emi_plans.delete_many({"billNumber": bill_number})
+        # 4. Delete linked EMI plans and their installments
+        delete_plans(db, {"billNumber": bill_number})
 
         # 5. Delete the invoice itself
         db.bills.delete_one({"_id": ObjectId(id)})
+        record_deletion(db, 'bills', ObjectId(id))
 
         # 6. Log the action
         log_audit(db, "INVOICE_DELETED", user_id, username, {
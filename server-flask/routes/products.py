@@ -1,94 +1,195 @@
 import logging
-import re
 from datetime import datetime
 from bson import ObjectId
-from flask import Blueprint, request, jsonify, redirect, g
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from flask import Blueprint, request, jsonify, redirect, g, send_file, current_app
 
 from database import get_db
 from utils.auth_middleware import authenticate_token, require_admin, require_admin_password
 from services.audit_service import log_audit
-from services.barcode_service import generate_product_barcode, generate_barcode_image, generate_qr_code
-from services.cloudinary_service import upload_product_photo, delete_cloudinary_asset, is_configured
+from services.change_feed import record_deletion
+from services.barcode_service import generate_product_barcode, generate_barcode_image, generate_qr_code, barcode_error
+from services.label_service import build_label_sheet_pdf
+from services.product_import import import_products
+from services.product_search import search_products, build_search_terms, count_search_matches, name_key
+from services.catalog_cache import catalog_cache
+from services.count_cache import cached_count, bump_generation
+from services.pagination import keyset_page
+from services.warranty_service import stamp_renewal_prices
+from services.export_service import date_range_query
+from services.stock_ledger import (
+    record_movements, record_stock_changes, serialize_movement, reconcile_stock, serialize_reconciliation,
+    MOVEMENT_REASONS, REASON_OPENING, REASON_ADJUSTMENT
+)
+from services.locations import resolve_location, set_stock_level, availability
+from services.tabular_import import read_table
+from services import pdf_layout
+from services.cloudinary_service import delete_cloudinary_asset, is_configured
+from services.photo_pipeline import stage_photo_upload, delete_photo_assets, GRID_VARIANT
+from services.photo_proxy import get_resized_photo, photo_version, proxy_url, PHOTO_PROXY_WIDTHS
 from utils.tzutils import utc_now, to_iso_string
 
 logger = logging.getLogger(__name__)
 
 products_bp = Blueprint('products', __name__)
 
+PRODUCT_SEARCH_MAX_RESULTS = 1000
+
+def _format_product(p):
+    try:
+        cost_price = float(p.get('costPrice', 0) or 0)
+    except (ValueError, TypeError):
+        cost_price = 0.0
+        
+    try:
+        price = float(p.get('price', 0) or 0)
+    except (ValueError, TypeError):
+        price = 0.0
+        
+    try:
+        quantity = int(p.get('quantity', 0) or 0)
+    except (ValueError, TypeError):
+        quantity = 0
+
+    try:
+        gst_percent = float(p.get('gstPercent', 18) or 18)
+    except (ValueError, TypeError):
+        gst_percent = 18.0
+
+    gst_factor = 1 + (gst_percent / 100.0)
+    base_price = price / gst_factor if price > 0 else 0
+    
+    profit = base_price - cost_price
+    # Margin calculated against cost price as per standard UI
+    profit_percent = round(((profit / cost_price) * 100), 2) if cost_price > 0 else 0
+
+    return {
+        "id": str(p['_id']),
+        "_id": str(p['_id']),
+        "name": p.get('name'),
+        "quantity": quantity,
+        "price": price,
+        "costPrice": cost_price,
+        "gstPercent": gst_percent,
+        "hsnCode": p.get('hsnCode', '9999'),
+        "minStock": p.get('minStock', 10),
+        "barcode": p.get('barcode'),
+        "photo": p.get('photo'),
+        "thumbnail": p.get('thumbnail') or (
+            proxy_url(p['_id'], p['photo']) if str(p.get('photo') or '').startswith('http') else None
+        ),
+        "photos": p.get('photos', []),
+        "warrantyRenewalPrice": float(p.get('warrantyRenewalPrice', 0) or 0),
+        "profit": profit,
+        "profitPercent": profit_percent
+    }
+
+# fields= names (as returned by the API) -> stored fields they are computed from
+PRODUCT_LIST_FIELDS = {
+    "id": [], "name": ["name"], "quantity": ["quantity"], "price": ["price"], "costPrice": ["costPrice"],
+    "gstPercent": ["gstPercent"], "hsnCode": ["hsnCode"], "minStock": ["minStock"], "barcode": ["barcode"],
+    "photo": ["photo"], "thumbnail": ["thumbnail", "photo"], "photos": ["photos"], "warrantyRenewalPrice": ["warrantyRenewalPrice"],
+    "profit": ["price", "costPrice", "gstPercent"], "profitPercent": ["price", "costPrice", "gstPercent"],
+}
+
+def _list_fields_projection(fields_param):
+    """Parse fields=a,b into (output keys or None, find() projection). Raises ValueError on unknown names."""
+    if not fields_param:
+        return None, {"searchTerms": 0, "nameLower": 0}
+    fields = [f.strip() for f in fields_param.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in PRODUCT_LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PRODUCT_LIST_FIELDS)}")
+    projection = {source: 1 for f in fields for source in PRODUCT_LIST_FIELDS[f]}
+    return set(fields) | {"id", "_id"}, projection or {"_id": 1}
+
 @products_bp.route('/', methods=['GET'])
 @authenticate_token
 def get_products():
+    """
+    List products sorted by name.
+    Paging: pass cursor= (empty for the first page) for keyset paging on (name, _id); the next page's
+    cursor is returned in X-Next-Cursor. page= (skip/limit) is still accepted for older clients.
+    fields=name,price,... trims both the database read and the response.
+    """
     db = get_db()
     
-    page = max(1, int(request.args.get('page', 1)))
-    limit = min(max(1, int(request.args.get('limit', 500))), 1000)
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        limit = min(max(1, int(request.args.get('limit', 500))), 1000)
+        keys, projection = _list_fields_projection(request.args.get('fields', '').strip())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     skip = (page - 1) * limit
     search = request.args.get('search', '').strip()
+    next_cursor = None
 
-    filter_query = {}
     if search:
-        regex = re.compile(search, re.IGNORECASE)
-        filter_query = {
-            "$or": [
-                {"name": regex},
-                {"barcode": regex},
-                {"hsnCode": regex}
-            ]
-        }
-
-    products_cursor = db.products.find(filter_query).sort("name", 1).skip(skip).limit(limit)
-    total = db.products.count_documents(filter_query)
+        # Ranked, index-backed search; pages (and total) reach at most PRODUCT_SEARCH_MAX_RESULTS matches
+        ranked = search_products(db, search, limit=min(skip + limit, PRODUCT_SEARCH_MAX_RESULTS),
+                                 projection=None if keys is None else projection)
+        total = min(count_search_matches(db, search), PRODUCT_SEARCH_MAX_RESULTS)
+        products = ranked[skip:skip + limit]
+    elif 'cursor' in request.args:
+        try:
+            products, next_cursor = keyset_page(db.products, {}, "name", limit,
+                                                cursor=request.args.get('cursor') or None, projection=projection)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        total = cached_count(db, 'products')
+    else:
+        products = db.products.find({}, projection).sort([("name", 1), ("_id", 1)]).skip(skip).limit(limit)
+        total = cached_count(db, 'products')
 
     formatted = []
-    for p in products_cursor:
-        try:
-            cost_price = float(p.get('costPrice', 0) or 0)
-        except (ValueError, TypeError):
-            cost_price = 0.0
-            
-        try:
-            price = float(p.get('price', 0) or 0)
-        except (ValueError, TypeError):
-            price = 0.0
-            
-        try:
-            quantity = int(p.get('quantity', 0) or 0)
-        except (ValueError, TypeError):
-            quantity = 0
+    for p in products:
+        item = _format_product(p)
+        if keys is not None:
+            item = {k: v for k, v in item.items() if k in keys}
+        formatted.append(item)
 
-        try:
-            gst_percent = float(p.get('gstPercent', 18) or 18)
-        except (ValueError, TypeError):
-            gst_percent = 18.0
+    response = jsonify(formatted)
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
-        gst_factor = 1 + (gst_percent / 100.0)
-        base_price = price / gst_factor if price > 0 else 0
-        
-        profit = base_price - cost_price
-        # Margin calculated against cost price as per standard UI
-        profit_percent = round(((profit / cost_price) * 100), 2) if cost_price > 0 else 0
+PRODUCT_SEARCH_FIELDS = {"name": 1, "barcode": 1, "sku": 1, "hsnCode": 1, "price": 1, "quantity": 1,
+                         "gstPercent": 1, "photo": 1, "thumbnail": 1}
 
-        formatted.append({
+@products_bp.route('/search', methods=['GET'])
+@authenticate_token
+def search_products_ranked():
+    """
+    POS search-as-you-type. Query: q (required), limit (default 20, max 100).
+    Results are ranked exact barcode/SKU, name prefix, word prefix, then fuzzy; each carries matchType.
+    """
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(1, int(request.args.get('limit', 20))), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if not query:
+        return jsonify([])
+
+    db = get_db()
+    results = []
+    for p in search_products(db, query, limit=limit, projection=PRODUCT_SEARCH_FIELDS):
+        results.append({
             "id": str(p['_id']),
-            "_id": str(p['_id']),
             "name": p.get('name'),
-            "quantity": quantity,
-            "price": price,
-            "costPrice": cost_price,
-            "gstPercent": gst_percent,
-            "hsnCode": p.get('hsnCode', '9999'),
-            "minStock": p.get('minStock', 10),
             "barcode": p.get('barcode'),
+            "sku": p.get('sku'),
+            "hsnCode": p.get('hsnCode', '9999'),
+            "price": float(p.get('price', 0) or 0),
+            "quantity": p.get('quantity', 0),
+            "gstPercent": p.get('gstPercent', 18),
             "photo": p.get('photo'),
-            "photos": p.get('photos', []),
-            "warrantyRenewalPrice": float(p.get('warrantyRenewalPrice', 0) or 0),
-            "profit": profit,
-            "profitPercent": profit_percent
+            "thumbnail": p.get('thumbnail'),
+            "matchType": p['_matchType'],
         })
-
-    response = jsonify(formatted)
-    response.headers['X-Total-Count'] = str(total)
-    return response
+    return jsonify(results)
 
 @products_bp.route('/', methods=['POST'])
 @authenticate_token
@@ -114,6 +215,7 @@ def add_product():
     
     product = {
         "name": name,
+        "nameLower": name_key(name),
         "quantity": quantity,
         "price": price,
         "costPrice": cost_price,
@@ -126,16 +228,32 @@ def add_product():
         "photo": None,
         "photos": [],
         "createdAt": utc_now(),
+        "updatedAt": utc_now(),
+        "ledgerOpenedAt": utc_now(),
+        "stockLevelsOpenedAt": utc_now(),
         "createdBy": user_id,
         "createdByUsername": username
     }
 
     result = db.products.insert_one(product)
     product_id = str(result.inserted_id)
+    bump_generation(db, 'products')
+    record_stock_changes(db, [(result.inserted_id, quantity)], REASON_OPENING, 'product', result.inserted_id, g.user)
 
     # Auto generate barcode
     barcode_value = generate_product_barcode(name, product_id)
-    db.products.update_one({"_id": result.inserted_id}, {"$set": {"barcode": barcode_value}})
+    try:
+        db.products.update_one({"_id": result.inserted_id}, {"$set": {
+            "barcode": barcode_value,
+            "searchTerms": build_search_terms(name, barcode_value, None, hsn_code)
+        }})
+    except DuplicateKeyError:
+        # The short form only keeps 8 hex digits of the id; the full id is always unique
+        barcode_value = f"PROD{product_id}"
+        db.products.update_one({"_id": result.inserted_id}, {"$set": {
+            "barcode": barcode_value,
+            "searchTerms": build_search_terms(name, barcode_value, None, hsn_code)
+        }})
 
     log_audit(db, "PRODUCT_ADDED", user_id, username, {
         "productId": product_id,
@@ -161,34 +279,62 @@ def add_product():
 @products_bp.route('/<id>', methods=['PATCH'])
 @authenticate_token
 def update_stock(id):
+    """Set counted stock. With locationId the quantity is that location's level and the total moves by the difference."""
     data = request.get_json()
     new_quantity = int(data.get('quantity') or 0)
     user_id = g.user.get('userId')
     username = g.user.get('username')
 
     db = get_db()
-    product = db.products.find_one({"_id": ObjectId(id)})
-    if not product:
-        return jsonify({"error": "Product not found"}), 404
-
     try:
-        old_quantity = int(product.get('quantity', 0) or 0)
-    except (ValueError, TypeError):
-        old_quantity = 0
-    
-    db.products.update_one(
-        {"_id": ObjectId(id)},
-        {"$set": {
-            "quantity": new_quantity,
-            "lastModifiedBy": user_id,
-            "lastModifiedByUsername": username,
-            "lastModified": utc_now()
-        }}
-    )
+        location_id = resolve_location(db, data.get('locationId'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if data.get('locationId'):
+        product = db.products.find_one({"_id": ObjectId(id)}, {"name": 1})
+        if not product:
+            return jsonify({"error": "Product not found"}), 404
+        old_quantity = set_stock_level(db, product['_id'], location_id, new_quantity)
+        db.products.update_one({"_id": product['_id']}, {
+            "$inc": {"quantity": new_quantity - old_quantity},
+            "$set": {
+                "lastModifiedBy": user_id,
+                "lastModifiedByUsername": username,
+                "lastModified": utc_now(),
+                "updatedAt": utc_now()
+            }
+        })
+        record_movements(db, [(product['_id'], new_quantity - old_quantity)], REASON_ADJUSTMENT, 'product',
+                         product['_id'], g.user, location_id=location_id)
+    else:
+        # Read the previous quantity in the same write so the ledger delta is exact
+        product = db.products.find_one_and_update(
+            {"_id": ObjectId(id)},
+            {"$set": {
+                "quantity": new_quantity,
+                "lastModifiedBy": user_id,
+                "lastModifiedByUsername": username,
+                "lastModified": utc_now(),
+                "updatedAt": utc_now()
+            }},
+            projection={"name": 1, "quantity": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not product:
+            return jsonify({"error": "Product not found"}), 404
+
+        try:
+            old_quantity = int(product.get('quantity', 0) or 0)
+        except (ValueError, TypeError):
+            old_quantity = 0
+        record_stock_changes(db, [(product['_id'], new_quantity - old_quantity)], REASON_ADJUSTMENT, 'product',
+                             product['_id'], g.user, location_id=location_id)
 
     log_audit(db, "PRODUCT_STOCK_UPDATED", user_id, username, {
         "productId": id,
         "productName": product.get('name'),
+        "locationId": str(location_id),
         "oldQuantity": old_quantity,
         "newQuantity": new_quantity,
         "change": new_quantity - old_quantity
@@ -221,6 +367,7 @@ def full_update_product(id):
 
     update_data = {
         "name": name,
+        "nameLower": name_key(name),
         "quantity": quantity,
         "price": price,
         "costPrice": cost_price,
@@ -231,12 +378,30 @@ def full_update_product(id):
         "warrantyRenewalPrice": warranty_renewal_price,
         "lastModifiedBy": user_id,
         "lastModifiedByUsername": username,
-        "lastModified": utc_now()
+        "lastModified": utc_now(),
+        "updatedAt": utc_now()
     }
     if barcode:
         update_data['barcode'] = barcode
+    update_data['searchTerms'] = build_search_terms(
+        name, barcode or old_product.get('barcode'), old_product.get('sku'), hsn_code
+    )
 
-    db.products.update_one({"_id": ObjectId(id)}, {"$set": update_data})
+    try:
+        before = db.products.find_one_and_update(
+            {"_id": ObjectId(id)}, {"$set": update_data},
+            projection={"quantity": 1}, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        return jsonify({"error": f"Barcode {barcode} is already used by another product"}), 409
+    if before:
+        try:
+            old_quantity = float(before.get('quantity', 0) or 0)
+        except (ValueError, TypeError):
+            old_quantity = 0.0
+        record_stock_changes(db, [(before['_id'], quantity - old_quantity)], REASON_ADJUSTMENT, 'product', before['_id'], g.user)
+    if float(old_product.get('warrantyRenewalPrice', 0) or 0) != warranty_renewal_price:
+        stamp_renewal_prices(db, {old_product['_id']: warranty_renewal_price})
 
     log_audit(db, "PRODUCT_UPDATED", user_id, username, {"productId": id, "productName": name})
     return jsonify({"success": True})
@@ -255,30 +420,138 @@ def delete_product(id):
 
     # Delete all specific photos mapping to this product
     for photo in product.get('photos', []):
-        if photo.get('storage') == 'cloudinary' and photo.get('cloudinaryPublicId'):
-            delete_cloudinary_asset(photo['cloudinaryPublicId'])
+        delete_photo_assets(db, photo)
             
     if product.get('cloudinaryPublicId'):
         delete_cloudinary_asset(product['cloudinaryPublicId'])
         
     db.products.delete_one({"_id": ObjectId(id)})
+    record_deletion(db, 'products', product['_id'])
+    bump_generation(db, 'products')
 
     log_audit(db, "PRODUCT_DELETED", user_id, username, {"productId": id, "productName": product.get('name')})
     return jsonify({"success": True})
 
+STOCK_MOVEMENTS_MAX_LIMIT = 200
+
+@products_bp.route('/<id>/movements', methods=['GET'])
+@authenticate_token
+def get_stock_movements(id):
+    """
+    Stock ledger for one product, newest first.
+    Query: limit (default 50), cursor (from X-Next-Cursor / nextCursor), reason, startDate, endDate (YYYY-MM-DD).
+    """
+    if not ObjectId.is_valid(id):
+        return jsonify({"error": "Invalid product ID"}), 400
+    try:
+        limit = min(max(1, int(request.args.get('limit', 50))), STOCK_MOVEMENTS_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    db = get_db()
+    product = db.products.find_one({"_id": ObjectId(id)}, {"name": 1, "quantity": 1})
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+
+    query = {"productId": product['_id']}
+    reason = request.args.get('reason')
+    if reason:
+        if reason not in MOVEMENT_REASONS:
+            return jsonify({"error": f"reason must be one of: {', '.join(MOVEMENT_REASONS)}"}), 400
+        query['reason'] = reason
+    try:
+        query.update(date_range_query('at', request.args.get('startDate'), request.args.get('endDate')))
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    try:
+        movements, next_cursor = keyset_page(db.stock_movements, query, 'at', limit,
+                                             cursor=request.args.get('cursor') or None, direction=-1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify({
+        "productId": id,
+        "name": product.get('name'),
+        "quantity": product.get('quantity', 0),
+        "movements": [serialize_movement(m) for m in movements],
+        "nextCursor": next_cursor
+    })
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@products_bp.route('/<id>/stock', methods=['GET'])
+@authenticate_token
+def get_stock_by_location(id):
+    """Per-location stock for one product."""
+    if not ObjectId.is_valid(id):
+        return jsonify({"error": "Invalid product ID"}), 400
+    db = get_db()
+    product = db.products.find_one({"_id": ObjectId(id)}, {"name": 1, "quantity": 1})
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+
+    levels = availability(db, [product['_id']]).get(product['_id'], {"total": 0, "locations": {}})
+    names = {l['_id']: l for l in db.locations.find({"_id": {"$in": list(levels['locations'])}}, {"code": 1, "name": 1})}
+    return jsonify({
+        "productId": id,
+        "name": product.get('name'),
+        "quantity": product.get('quantity', 0),
+        "locations": [{
+            "locationId": str(location_id),
+            "code": names.get(location_id, {}).get('code'),
+            "name": names.get(location_id, {}).get('name'),
+            "quantity": quantity
+        } for location_id, quantity in levels['locations'].items()]
+    })
+
+@products_bp.route('/stock/reconcile', methods=['POST'])
+@authenticate_token
+@require_admin
+def reconcile_stock_levels():
+    """Compare product quantities with the stock ledger. Body: {"fix": true} to record aligning movements."""
+    data = request.get_json(silent=True) or {}
+    db = get_db()
+    try:
+        run = reconcile_stock(db, g.user, fix=bool(data.get('fix')))
+    except Exception as e:
+        logger.error(f"Stock reconciliation failed: {e}", exc_info=True)
+        return jsonify({"error": "Stock reconciliation failed"}), 500
+
+    log_audit(db, "STOCK_RECONCILED", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+        "checkedProducts": run['checkedProducts'],
+        "driftCount": run['driftCount'],
+        "fixed": run['fixed']
+    })
+    return jsonify(serialize_reconciliation(run))
+
+@products_bp.route('/stock/reconcile', methods=['GET'])
+@authenticate_token
+@require_admin
+def get_latest_reconciliation():
+    db = get_db()
+    run = db.stock_reconciliations.find_one(sort=[("createdAt", -1)])
+    if not run:
+        return jsonify({"error": "No reconciliation has run yet"}), 404
+    return jsonify(serialize_reconciliation(run))
+
 @products_bp.route('/barcode/<barcode>', methods=['GET'])
 @authenticate_token
 def search_barcode(barcode):
+    """
+    Counter scan lookup: exact barcode, then exact SKU (in-process catalog map when warm, else unique indexes).
+    Pass ?fallback=name to fall back to ranked name search when nothing matches exactly.
+    """
     db = get_db()
-    regex = re.compile(barcode, re.IGNORECASE)
-    product = db.products.find_one({
-        "$or": [
-            {"barcode": barcode},
-            {"sku": barcode},
-            {"name": regex}
-        ]
-    })
-    
+    code = barcode.strip()
+    product, source = catalog_cache.lookup(db, code)
+    match_type = 'exact'
+
+    if not product and request.args.get('fallback', '').lower() == 'name':
+        matches = search_products(db, code, limit=1)
+        if matches:
+            product, source, match_type = matches[0], 'search', matches[0]['_matchType']
+
     if not product:
         return jsonify({"error": "Product not found"}), 404
         
@@ -289,13 +562,24 @@ def search_barcode(barcode):
         "costPrice": product.get('costPrice', 0),
         "quantity": product.get('quantity', 0),
         "barcode": product.get('barcode'),
-        "photo": product.get('photo')
+        "sku": product.get('sku'),
+        "photo": product.get('photo'),
+        "thumbnail": product.get('thumbnail'),
+        "matchType": match_type,
+        "source": source
     })
 
 @products_bp.route('/<id>/barcode', methods=['GET'])
 @authenticate_token
 def get_barcode_image(id):
     fmt = request.args.get('format', 'image')
+    output = request.args.get('output', 'svg').lower()
+    symbology = request.args.get('symbology', 'auto').lower()
+    if output not in ('svg', 'png'):
+        return jsonify({"error": "output must be svg or png"}), 400
+    if symbology not in ('auto', 'code128', 'ean13'):
+        return jsonify({"error": "symbology must be auto, code128 or ean13"}), 400
+
     db = get_db()
     product = db.products.find_one({"_id": ObjectId(id)})
     
@@ -312,17 +596,154 @@ def get_barcode_image(id):
                 "barcode": barcode_value,
                 "price": product.get('price')
             }
-            img = generate_qr_code(qr_data)
+            img = generate_qr_code(qr_data, fmt=output)
             return jsonify({"barcode": barcode_value, "qrCode": img})
         else:
-            img = generate_barcode_image(barcode_value)
+            img = generate_barcode_image(barcode_value, fmt=output, symbology=symbology)
             return jsonify({"barcode": barcode_value, "image": img})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@products_bp.route('/import', methods=['POST'])
+@authenticate_token
+def import_products_file():
+    """
+    Bulk import products from a CSV/XLSX upload (multipart field 'file').
+    Form/query options: quantityMode=set|add (default set), dryRun=true to validate only.
+    Rows are matched to existing products by barcode, then SKU, then name.
+    """
+    file = request.files.get('file')
+    quantity_mode = (request.form.get('quantityMode') or request.args.get('quantityMode') or 'set').lower()
+    dry_run = (request.form.get('dryRun') or request.args.get('dryRun') or '').lower() in ('1', 'true')
+
+    try:
+        frame = read_table(file)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    try:
+        result = import_products(db, frame, g.user, quantity_mode=quantity_mode, dry_run=dry_run)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Product import failed: {e}", exc_info=True)
+        return jsonify({"error": "Product import failed"}), 500
+
+    if not dry_run:
+        if result['summary']['created']:
+            bump_generation(db, 'products')
+        log_audit(db, "PRODUCTS_IMPORTED", g.user.get('userId'), g.user.get('username', 'Unknown'), {
+            "fileName": file.filename,
+            "quantityMode": quantity_mode,
+            **{k: v for k, v in result['summary'].items() if k != 'dryRun'}
+        })
+
+    return jsonify(result)
+
+LABEL_SHEET_MAX_LABELS = 5000
+
+def _parse_flag(value, default):
+    """JSON/form boolean: true/false, 1/0, "true"/"false", "yes"/"no". None when unparseable."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ('1', 'true', 'yes'):
+            return True
+        if text in ('0', 'false', 'no'):
+            return False
+    return None
+
+@products_bp.route('/labels', methods=['POST'])
+@authenticate_token
+def print_labels():
+    """Render an N-up A4 label sheet PDF for a list of {productId, quantity}."""
+    data = request.get_json() or {}
+    items = data.get('items') or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list of {productId, quantity}"}), 400
+
+    try:
+        columns = int(data.get('columns', pdf_layout.LABEL_DEFAULT_COLUMNS))
+        rows = int(data.get('rows', pdf_layout.LABEL_DEFAULT_ROWS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "columns and rows must be integers"}), 400
+    if not (1 <= columns <= pdf_layout.LABEL_MAX_COLUMNS and 1 <= rows <= pdf_layout.LABEL_MAX_ROWS):
+        return jsonify({"error": f"columns must be 1-{pdf_layout.LABEL_MAX_COLUMNS} and rows 1-{pdf_layout.LABEL_MAX_ROWS}"}), 400
+    show_price = _parse_flag(data.get('showPrice'), True)
+    if show_price is None:
+        return jsonify({"error": "showPrice must be true or false"}), 400
+
+    quantities = []
+    for item in items:
+        product_id = str((item or {}).get('productId', ''))
+        if not ObjectId.is_valid(product_id):
+            return jsonify({"error": f"Invalid product ID: {product_id}"}), 400
+        try:
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Invalid quantity for product {product_id}"}), 400
+        if quantity < 1:
+            return jsonify({"error": f"Quantity must be at least 1 for product {product_id}"}), 400
+        quantities.append((product_id, quantity))
+
+    total_labels = sum(q for _, q in quantities)
+    if total_labels > LABEL_SHEET_MAX_LABELS:
+        return jsonify({"error": f"Too many labels requested ({total_labels}); limit is {LABEL_SHEET_MAX_LABELS}"}), 400
+
+    db = get_db()
+    ids = list({ObjectId(pid) for pid, _ in quantities})
+    products = {
+        str(p['_id']): p
+        for p in db.products.find({"_id": {"$in": ids}}, {"name": 1, "price": 1, "barcode": 1})
+    }
+    missing = sorted({pid for pid, _ in quantities if pid not in products})
+    if missing:
+        return jsonify({"error": "Product not found", "missing": missing}), 404
+
+    barcodes = {
+        product_id: product.get('barcode') or generate_product_barcode(product.get('name'), product_id)
+        for product_id, product in products.items()
+    }
+    invalid = []
+    for product_id, barcode in barcodes.items():
+        problem = barcode_error(barcode)
+        if problem:
+            invalid.append({"productId": product_id, "name": products[product_id].get('name'),
+                            "barcode": barcode, "error": problem})
+    if invalid:
+        return jsonify({"error": "Some product barcodes cannot be printed", "invalid": invalid}), 400
+
+    labels = []
+    for product_id, quantity in quantities:
+        product = products[product_id]
+        label = {"name": product.get('name'), "price": product.get('price'), "barcode": barcodes[product_id]}
+        labels.extend([label] * quantity)
+
+    try:
+        pdf_buffer = build_label_sheet_pdf(labels, columns=columns, rows=rows, show_price=show_price)
+    except Exception as e:
+        logger.error(f"Label sheet generation error: {e}")
+        return jsonify({"error": "Failed to generate label sheet"}), 500
+
+    return send_file(
+        pdf_buffer,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"labels_{utc_now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    )
+
 @products_bp.route('/<id>/photo', methods=['POST'])
 @authenticate_token
 def upload_photo(id):
+    """Stage the photo locally and return 202; the photo worker renders thumbnails and uploads it."""
     if 'photo' not in request.files:
         return jsonify({"error": "No photo file uploaded"}), 400
         
@@ -337,69 +758,77 @@ def upload_photo(id):
     username = g.user.get('username')
     db = get_db()
     
-    product = db.products.find_one({"_id": ObjectId(id)})
+    product = db.products.find_one({"_id": ObjectId(id)}, {"name": 1})
     if not product:
         return jsonify({"error": "Product not found"}), 404
         
     try:
-        result = upload_product_photo(file, id)
-        photo_url = result['url']
-        public_id = result['publicId']
-        
-        photo_entry = {
-            "id": public_id,
-            "url": photo_url,
-            "storage": "cloudinary",
-            "cloudinaryPublicId": public_id,
-            "filename": file.filename,
-            "uploadedAt": utc_now(),
-            "uploadedBy": user_id,
-            "uploadedByUsername": username
-        }
-        
-        db.products.update_one(
-            {"_id": ObjectId(id)},
-            {
-                "$push": {"photos": photo_entry},
-                "$set": {
-                    "photo": photo_url,
-                    "lastModifiedBy": user_id,
-                    "lastModifiedByUsername": username,
-                    "lastModified": utc_now()
-                }
-            }
-        )
-        
-        log_audit(db, "PRODUCT_PHOTO_UPLOADED", user_id, username, {
-            "productId": id, "productName": product.get('name'), "cloudinaryPublicId": public_id
-        })
-        
-        return jsonify({
-            "success": True, 
-            "photo": {
-                "id": public_id,
-                "url": photo_url,
-                "storage": "cloudinary"
-            },
-            "message": "Product photo uploaded successfully"
-        })
+        entry = stage_photo_upload(db, product['_id'], file, g.user)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Failed photo upload: {e}")
+        logger.error(f"Failed to stage photo upload: {e}")
         return jsonify({"error": str(e)}), 500
 
+    log_audit(db, "PRODUCT_PHOTO_UPLOADED", user_id, username, {
+        "productId": id, "productName": product.get('name'), "photoId": entry['id']
+    })
+
+    return jsonify({
+        "success": True,
+        "photo": {
+            "id": entry['id'],
+            "url": None,
+            "storage": "cloudinary",
+            "status": entry['status']
+        },
+        "message": "Product photo received and is being processed"
+    }), 202
+
 @products_bp.route('/<id>/photo', methods=['GET'])
 def get_photo(id):
-    db = get_db()
-    product = db.products.find_one({"_id": ObjectId(id)})
+    """
+    Main product photo. With ?w= (one of PHOTO_PROXY_WIDTHS) a resized WebP is served from the local
+    photo cache with a strong ETag; ?v= from proxy_url() marks the URL immutable. Without w, redirects.
+    """
+    if not ObjectId.is_valid(id):
+        return jsonify({"error": "Invalid product ID"}), 400
+    product = catalog_cache.get(get_db(), ObjectId(id))
     
     if not product:
         return jsonify({"error": "Product not found"}), 404
         
     photo_url = product.get('photo')
-    if photo_url and photo_url.startswith('http'):
+    if not photo_url or not photo_url.startswith('http'):
+        return jsonify({"error": "Legacy file-system photos are not migrated to Python server. Please reupload."}), 404
+
+    width = request.args.get('w')
+    if not width:
         return redirect(photo_url, code=302)
-        
-    return jsonify({"error": "Legacy file-system photos are not migrated to Python server. Please reupload."}), 404
+    try:
+        width = int(width)
+    except ValueError:
+        width = 0
+    if width not in PHOTO_PROXY_WIDTHS:
+        return jsonify({"error": f"w must be one of: {', '.join(str(w) for w in PHOTO_PROXY_WIDTHS)}"}), 400
+
+    version = photo_version(photo_url, width)
+    if request.args.get('v') == version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=300"
+    if request.if_none_match.contains(version):
+        response = current_app.response_class(status=304)
+    else:
+        try:
+            data = get_resized_photo(photo_url, width)
+        except Exception as e:
+            logger.warning(f"Photo proxy failed for product {id}: {e}")
+            return redirect(photo_url, code=302)
+        response = current_app.response_class(data, mimetype='image/webp')
+    response.set_etag(version)
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 @products_bp.route('/<id>/photo/<photo_id>', methods=['DELETE'])
 @authenticate_token
@@ -425,18 +854,25 @@ def delete_photo(id, photo_id):
     if not photo_target:
         return jsonify({"error": "Photo not found"}), 404
 
-    if photo_target.get('storage') == 'cloudinary' and photo_target.get('cloudinaryPublicId'):
-        delete_cloudinary_asset(photo_target['cloudinaryPublicId'])
+    delete_photo_assets(db, photo_target)
+
+    update = {
+        "lastModifiedBy": user_id,
+        "lastModifiedByUsername": username,
+        "lastModified": utc_now(),
+        "updatedAt": utc_now()
+    }
+    if photo_target.get('url') and photo_target.get('url') == product.get('photo'):
+        # Fall back to the newest remaining ready photo for the main image and grid thumbnail
+        remaining = [p for p in product.get('photos', []) if p is not photo_target and p.get('url')]
+        update['photo'] = remaining[-1]['url'] if remaining else None
+        update['thumbnail'] = (remaining[-1].get('variants') or {}).get(GRID_VARIANT, {}).get('url') if remaining else None
 
     db.products.update_one(
         {"_id": ObjectId(id)},
         {
             "$pull": {"photos": {"id": photo_target.get('id', photo_id)}},
-            "$set": {
-                "lastModifiedBy": user_id,
-                "lastModifiedByUsername": username,
-                "lastModified": utc_now()
-            }
+            "$set": update
         }
     )
     
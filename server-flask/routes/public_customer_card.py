@@ -1,11 +1,10 @@
 from datetime import datetime
 from bson import ObjectId
 from flask import Blueprint, request, jsonify
-import qrcode
-import io
 import base64
 
 from database import get_db
+from services.barcode_service import render_qr
 from utils.constants import COMPANY_NAME, COMPANY_PHONE
 from utils.tzutils import utc_now, to_iso_string
 
@@ -111,16 +110,9 @@ TEL;TYPE=CELL:{customer.get('phone', '')}
 {"URL:" + customer.get('website') if customer.get('website') else ""}
 END:VCARD"""
 
-    # Generate QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=2)
-    qr.add_data(vcard_data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-
-    # Convert QR code to base64
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format='PNG')
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode()
+    # Generate QR code (cached per vCard payload)
+    qr_png = render_qr(vcard_data, fmt='png', box_size=10, border=2)
+    qr_base64 = base64.b64encode(qr_png).decode()
 
 
     # PVC Card Style HTML with flip feature
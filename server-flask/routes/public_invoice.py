@@ -1,8 +1,9 @@
+import io
 import logging
 from datetime import datetime
 from bson import ObjectId
 from flask import Blueprint, request, jsonify, send_file
-from services.pdf_service import generate_invoice_pdf
+from services.pdf_service import render_invoice_pdf_bytes
 
 from database import get_db
 from utils.constants import COMPANY_NAME, COMPANY_PHONE, COMPANY_ADDRESS, COMPANY_EMAIL, COMPANY_GSTIN
@@ -37,11 +38,11 @@ def public_invoice_pdf(token):
             "gstin": COMPANY_GSTIN
         })
 
-        pdf_buffer = generate_invoice_pdf(invoice, company_info)
+        pdf_bytes = render_invoice_pdf_bytes(invoice, company_info)
         bill_number = invoice.get('billNumber', 'invoice')
         
         return send_file(
-            pdf_buffer,
+            io.BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
             download_name=f"Invoice_{bill_number}.pdf"
@@ -260,10 +261,13 @@ def public_invoice_view(token):
         emi_installments_html = ''
         if emi_plan_id:
             try:
-                emi_plan = db.emi_plans.find_one({"_id": ObjectId(emi_plan_id)})
-                if emi_plan and emi_plan.get('installments'):
+                emi_plan = db.emi_plans.find_one({"_id": ObjectId(emi_plan_id)}, {"installmentCount": 1})
+                preview = list(db.emi_installments.find(
+                    {"planId": ObjectId(emi_plan_id)}, {"installmentNo": 1, "dueDate": 1, "amount": 1, "status": 1}
+                ).sort("installmentNo", 1).limit(3)) if emi_plan else []
+                if preview:
                     # Show first 3 installments as preview
-                    for inst in emi_plan['installments'][:3]:
+                    for inst in preview:
                         inst_no = inst.get('installmentNo', 0)
                         inst_due = inst.get('dueDate')
                         inst_amt = inst.get('amount', 0)
@@ -272,6 +276,7 @@ def public_invoice_view(token):
                         
                         status_badge = {
                             'paid': '<span style="color:#10b981;font-weight:600;">&#10003; Paid</span>',
+                            'completed': '<span style="color:#10b981;font-weight:600;">&#10003; Paid</span>',
                             'partial': '<span style="color:#f59e0b;font-weight:600;">&#9679; Partial</span>',
                             'pending': '<span style="color:#94a3b8;font-weight:600;">&#9679; Pending</span>'
                         }.get(inst_status, '<span style="color:#94a3b8;">Pending</span>')
@@ -285,8 +290,8 @@ def public_invoice_view(token):
                         </tr>
                         '''
                     
-                    if len(emi_plan['installments']) > 3:
-                        remaining = len(emi_plan['installments']) - 3
+                    if emi_plan.get('installmentCount', 0) > 3:
+                        remaining = emi_plan['installmentCount'] - 3
                         emi_installments_html += f'''
                         <tr>
                           <td colspan="4" style="text-align:center;color:#94a3b8;font-size:11px;padding:8px;">
@@ -7,6 +7,8 @@ from flask import Blueprint, request, jsonify, g
 from database import get_db
 from utils.auth_middleware import authenticate_token, require_admin_password
 from services.audit_service import log_audit
+from services.stock_ledger import apply_stock_changes, REASON_RETURN, REASON_RETURN_REVERSAL
+from services.locations import resolve_location
 from utils.tzutils import utc_now, to_iso_string
 
 logger = logging.getLogger(__name__)
@@ -46,6 +48,7 @@ def get_returns():
             "items": r.get('items', []),
             "refundAmount": r.get('refundAmount'),
             "reason": r.get('reason'),
+            "locationId": str(r['locationId']) if r.get('locationId') else None,
             "status": r.get('status'),
             "createdAt": r.get('createdAt').isoformat() if r.get('createdAt') and isinstance(r.get('createdAt'), datetime) else str(r.get('createdAt')) if r.get('createdAt') else None,
             "processedBy": r.get('processedBy'),
@@ -105,17 +108,10 @@ def process_return():
             return jsonify({"error": "Return reason is required"}), 400
 
         db = get_db()
-
-        for item in items:
-            pid = item.get('productId')
-            if pid:
-                try:
-                    db.products.update_one(
-                        {"_id": ObjectId(pid)},
-                        {"$inc": {"quantity": float(item.get('quantity', 0))}}
-                    )
-                except Exception:
-                    pass
+        try:
+            location_id = resolve_location(db, data.get('locationId'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Calculate total cost of returned items
         total_return_cost = sum(
@@ -139,6 +135,7 @@ def process_return():
             "refundAmount": refund_amount,
             "totalReturnCost": total_return_cost,
             "reason": reason,
+            "locationId": location_id,
             "status": 'completed',
             "createdAt": utc_now(),
             "processedBy": user_id,
@@ -146,6 +143,8 @@ def process_return():
         }
 
         result = db.returns.insert_one(return_doc)
+        apply_stock_changes(db, [(i['productId'], i['quantity']) for i in return_doc['items']],
+                            REASON_RETURN, 'return', result.inserted_id, g.user, location_id=location_id)
 
         log_audit(db, "RETURN_PROCESSED", user_id, username, {
             "returnId": str(result.inserted_id),
@@ -156,6 +155,7 @@ def process_return():
         })
 
         return_doc['id'] = str(result.inserted_id)
+        return_doc['locationId'] = str(location_id)
         created_at = return_doc.get('createdAt')
         return_doc['createdAt'] = created_at.isoformat() if created_at and hasattr(created_at, 'isoformat') else str(created_at)
         if '_id' in return_doc:
@@ -182,15 +182,14 @@ def delete_return(id):
     if not return_doc:
         return jsonify({"error": "Return record not found"}), 404
         
+    reversed_stock = []
     for item in return_doc.get('items', []):
-        pid = item.get('productId')
-        if pid:
-            try:
-                db.products.update_one(
-                    {"_id": ObjectId(pid)},
-                    {"$inc": {"quantity": -float(item.get('quantity', 0))}}
-                )
-            except: pass
+        try:
+            reversed_stock.append((item.get('productId'), -float(item.get('quantity', 0))))
+        except (TypeError, ValueError):
+            pass
+    apply_stock_changes(db, reversed_stock, REASON_RETURN_REVERSAL, 'return', return_doc['_id'], g.user,
+                        location_id=return_doc.get('locationId'))
             
     db.returns.delete_one({"_id": ObjectId(id)})
     
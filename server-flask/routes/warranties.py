@@ -1,8 +1,10 @@
 from flask import Blueprint, jsonify, request, g
 from database import get_db
 from utils.auth_middleware import authenticate_token, require_admin
+from services.pagination import keyset_aggregate
 from bson import ObjectId
 import logging
+import re
 from utils.tzutils import to_iso_string, utc_now
 from datetime import timedelta
 
@@ -10,74 +12,105 @@ logger = logging.getLogger(__name__)
 
 warranties_bp = Blueprint('warranties', __name__)
 
+def expire_warranties(db):
+    """Mark active warranties past their expiry date as expired. Returns how many changed."""
+    result = db.warranties.update_many(
+        {"status": "active", "expiryDate": {"$lt": utc_now()}},
+        {"$set": {"status": "expired"}}
+    )
+    return result.modified_count
+
+WARRANTY_LIST_DEFAULT_LIMIT = 50
+WARRANTY_LIST_MAX_LIMIT = 200
+WARRANTY_STATUSES = ('active', 'expired', 'claimed')
+WARRANTY_EXPIRING_SOON_DAYS = 30
+WARRANTY_LIST_FIELDS = {
+    "productId": 1, "customerId": 1, "customerName": 1, "customerPhone": 1, "productName": 1,
+    "serialNumber": 1, "productSku": 1, "startDate": 1, "expiryDate": 1, "status": 1,
+    "invoiceNo": 1, "renewalPrice": 1
+}
+
+def _expiring_query(now, days):
+    return {"status": "active", "expiryDate": {"$gte": now, "$lte": now + timedelta(days=days)}}
+
 @warranties_bp.route('/', methods=['GET'])
 @authenticate_token
 @require_admin
 def get_all_warranties():
-    """Fetch all warranties for admin dashboard."""
+    """
+    Warranties for the admin dashboard, newest purchase first, one keyset page at a time.
+    Renewal prices are stamped on the warranty; customer names missing from older warranties
+    are joined from customers for the page only.
+    Query: status, expiringWithinDays, search (customer / product / invoice / phone prefix), limit, cursor.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', WARRANTY_LIST_DEFAULT_LIMIT)), 1), WARRANTY_LIST_MAX_LIMIT)
+        expiring_days = request.args.get('expiringWithinDays')
+        expiring_days = int(expiring_days) if expiring_days not in (None, '') else None
+    except ValueError:
+        return jsonify({"error": "limit and expiringWithinDays must be numbers"}), 400
+    if expiring_days is not None and expiring_days < 1:
+        return jsonify({"error": "expiringWithinDays must be at least 1"}), 400
+
+    now = utc_now()
+    query = {}
+    status = request.args.get('status', '').strip().lower()
+    if status and status != 'all':
+        if status not in WARRANTY_STATUSES:
+            return jsonify({"error": f"status must be one of: {', '.join(WARRANTY_STATUSES)}"}), 400
+        query['status'] = status
+    if expiring_days is not None:
+        if query.get('status', 'active') != 'active':
+            return jsonify({"error": "expiringWithinDays only applies to active warranties"}), 400
+        query.update(_expiring_query(now, expiring_days))
+    search = request.args.get('search', '').strip()
+    if search:
+        prefix = {"$regex": f"^{re.escape(search)}", "$options": "i"}
+        query['$or'] = [{"customerName": prefix}, {"productName": prefix}, {"invoiceNo": prefix},
+                        {"customerPhone": prefix}]
+
     try:
         db = get_db()
-        # Fetch all warranties, sorted by purchase date (newest first)
-        warranties_cursor = db.warranties.find().sort("startDate", -1).limit(1000)
-        
-        # Pre-fetch all customers to avoid N+1 queries
-        customers_cursor = db.customers.find({}, {"name": 1})
-        customer_map = {str(c['_id']): c.get('name') for c in customers_cursor}
-        
-        # Pre-fetch all products to get renewal prices
-        products_cursor = db.products.find({}, {"name": 1, "warrantyRenewalPrice": 1})
-        product_map = {str(p['_id']): p for p in products_cursor}
-        
-        warranties_list = []
-        for w in warranties_cursor:
-            cust_id_str = str(w.get('customerId')) if w.get('customerId') else None
-            prod_id_str = str(w.get('productId')) if w.get('productId') else None
-            
-            # Use stored name or look up from our map
-            name = w.get('customerName')
-            if not name and cust_id_str in customer_map:
-                name = customer_map[cust_id_str]
-            
-            # Get renewal price from product map
-            renewal_price = 0
-            if prod_id_str in product_map:
-                renewal_price = product_map[prod_id_str].get('warrantyRenewalPrice', 0)
-            elif w.get('productName'):
-                # Fallback: Find by name if productId is missing (for old records)
-                prod_name = w.get('productName')
-                # Find first product with this name in our map
-                for p in product_map.values():
-                    if p.get('name') == prod_name:
-                        renewal_price = p.get('warrantyRenewalPrice', 0)
-                        break
-            # Final Fallback: If still 0, check w.get('renewalPrice')
-            if renewal_price == 0:
-                renewal_price = w.get('renewalPrice', 0)
-            
-            warranties_list.append({
-                "_id": str(w['_id']),
-                "id": str(w['_id']),
-                "productId": prod_id_str,
-                "customerId": cust_id_str,
-                "customerName": name or 'N/A',
-                "customerPhone": w.get('customerPhone', 'N/A'),
-                "productName": w.get('productName', 'N/A'),
-                "serialNumber": w.get('serialNumber') or w.get('productSku', 'N/A'),
-                "purchaseDate": to_iso_string(w.get('startDate')),
-                "expiryDate": to_iso_string(w.get('expiryDate')),
-                "status": w.get('status', 'active'),
-                "invoiceNumber": w.get('invoiceNo', 'N/A'),
-                "renewalPrice": renewal_price
-            })
-            
-        return jsonify({
-            "success": True,
-            "warranties": warranties_list
-        }), 200
+        warranties, next_cursor = keyset_aggregate(
+            db.warranties, query, "startDate", limit, cursor=request.args.get('cursor') or None, direction=-1,
+            stages=[
+                {"$project": WARRANTY_LIST_FIELDS},
+                {"$lookup": {"from": "customers", "localField": "customerId", "foreignField": "_id", "as": "customer"}},
+                {"$addFields": {"customerName": {"$ifNull": ["$customerName", {"$arrayElemAt": ["$customer.name", 0]}]}}},
+                {"$project": {"customer": 0}},
+            ]
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching warranties: {str(e)}", exc_info=True)
         return jsonify({"error": "Failed to fetch warranties", "message": str(e)}), 500
 
+    counts = {s: db.warranties.count_documents({"status": s}) for s in WARRANTY_STATUSES}
+    counts['total'] = db.warranties.estimated_document_count()
+    counts['expiringSoon'] = db.warranties.count_documents(_expiring_query(now, WARRANTY_EXPIRING_SOON_DAYS))
+
+    return jsonify({
+        "success": True,
+        "warranties": [{
+            "_id": str(w['_id']),
+            "id": str(w['_id']),
+            "productId": str(w.get('productId')) if w.get('productId') else None,
+            "customerId": str(w.get('customerId')) if w.get('customerId') else None,
+            "customerName": w.get('customerName') or 'N/A',
+            "customerPhone": w.get('customerPhone', 'N/A'),
+            "productName": w.get('productName', 'N/A'),
+            "serialNumber": w.get('serialNumber') or w.get('productSku', 'N/A'),
+            "purchaseDate": to_iso_string(w.get('startDate')),
+            "expiryDate": to_iso_string(w.get('expiryDate')),
+            "status": w.get('status', 'active'),
+            "invoiceNumber": w.get('invoiceNo', 'N/A'),
+            "renewalPrice": w.get('renewalPrice', 0)
+        } for w in warranties],
+        "nextCursor": next_cursor,
+        "counts": counts
+    }), 200
+
 @warranties_bp.route('/<id>', methods=['PATCH'])
 @authenticate_token
 @require_admin
@@ -205,6 +238,7 @@ def renew_warranty(id):
             "paymentStatus": "Paid",
             "isRenewal": True,
             "createdAt": now,
+            "updatedAt": now,
             "createdBy": g.user.get('userId'),
             "createdByUsername": g.user.get('username')
         }
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Standalone background scheduler.
+Runs the cron jobs defined in services/scheduler.py (EMI status sync and plan
+reconciliation, salary processing, warranty expiry, payment link cleanup, stock
+reconciliation). Safe
+to run next to web processes that also schedule: each due run is leased to one
+process. Set SCHEDULER_INLINE=false on the web service to schedule only here.
+
+Usage: python -m scheduler [--once]
+"""
+
+import logging
+import sys
+
+from flask import Flask
+
+from config import Config
+from database import connect_db
+from services.scheduler import run_scheduler, run_due_jobs, register_jobs, default_jobs
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    app = Flask('scheduler')
+    app.config.from_object(Config)
+    db = connect_db(app)
+    if db is None:
+        logger.error("Scheduler could not connect to MongoDB")
+        sys.exit(1)
+
+    jobs = default_jobs()
+    if '--once' in sys.argv:
+        register_jobs(db, jobs)
+        ran = run_due_jobs(db, jobs)
+        logger.info(f"[scheduler] Ran {len(ran)} due job(s): {', '.join(ran) or 'none'}")
+        return
+
+    run_scheduler(db, jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,65 @@
-import logging
+"""
+Barcode & QR Service
+Encodes Code128, EAN-13 and QR symbols and renders them as SVG or PNG.
+Rendered images are kept in a bounded in-process LRU cache keyed by
+symbology, payload, output format and size, so label sheets, customer
+cards and payment links never re-encode an identical payload.
+"""
+
 import base64
+import io
+import json
+import logging
+import os
+from functools import lru_cache
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
 
 logger = logging.getLogger(__name__)
 
+BARCODE_CACHE_SIZE = int(os.environ.get('BARCODE_CACHE_SIZE', '1024'))
+
+SYMBOLOGIES = ('code128', 'ean13', 'qr')
+OUTPUT_FORMATS = ('svg', 'png')
+
+# ==================== CODE 128 ====================
+
+# Bar/space module widths for symbol values 0-106 (106 is the stop pattern)
+CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232', '2331112',
+)
+CODE128_CODE_B = 100
+CODE128_CODE_C = 99
+CODE128_START_B = 104
+CODE128_START_C = 105
+CODE128_STOP = 106
+
+# ==================== EAN-13 ====================
+
+EAN_L = ('0001101', '0011001', '0010011', '0111101', '0100011', '0110001', '0101111', '0111011', '0110111', '0001011')
+EAN_G = ('0100111', '0110011', '0011011', '0100001', '0011101', '0111001', '0000101', '0010001', '0001001', '0010111')
+EAN_R = ('1110010', '1100110', '1101100', '1000010', '1011100', '1001110', '1010000', '1000100', '1001000', '1110100')
+EAN_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG', 'LGGLLG', 'LGGGLG', 'LGLGGL', 'LGLGLG', 'LGGLGL')
+
+QR_ERROR_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
 def generate_product_barcode(product_name, product_id):
     """
     Generate a simple textual barcode identifier based on product name and ID
@@ -10,44 +67,264 @@ def generate_product_barcode(product_name, product_id):
     prefix = 'PROD'
     id_part = str(product_id)[-8:] if len(str(product_id)) >= 8 else str(product_id)
     name_part = ''.join(e for e in str(product_name)[:3].upper() if e.isalnum())
-    
+
     result = f"{prefix}{name_part}{id_part}"
     return result[:20]
 
-def generate_barcode_image(barcode_value):
+
+# ==================== ENCODERS ====================
+
+def code128_values(data):
+    """Encode text into Code128 symbol values (start, data, checksum, stop) using sets B and C."""
+    data = str(data)
+    if not data:
+        raise ValueError('Code128 payload cannot be empty')
+    for ch in data:
+        if not 32 <= ord(ch) <= 126:
+            raise ValueError(f'Unsupported Code128 character: {ch!r}')
+
+    values = []
+    current = None
+    i = 0
+    n = len(data)
+    while i < n:
+        run = 0
+        while i + run < n and data[i + run].isdigit():
+            run += 1
+
+        # Set C packs digit pairs; only worth a switch for longer runs
+        use_c = run >= 4 and (i == 0 or i + run == n or run >= 6)
+        if use_c:
+            if current != 'C':
+                values.append(CODE128_START_C if current is None else CODE128_CODE_C)
+                current = 'C'
+            for _ in range(run // 2):
+                values.append(int(data[i:i + 2]))
+                i += 2
+        else:
+            if current != 'B':
+                values.append(CODE128_START_B if current is None else CODE128_CODE_B)
+                current = 'B'
+            values.append(ord(data[i]) - 32)
+            i += 1
+
+    checksum = values[0] + sum(pos * value for pos, value in enumerate(values[1:], 1))
+    values.append(checksum % 103)
+    values.append(CODE128_STOP)
+    return values
+
+
+def code128_modules(data):
+    """Return the Code128 symbol as a string of '1' (bar) and '0' (space) modules."""
+    modules = []
+    for value in code128_values(data):
+        bar = True
+        for width in CODE128_PATTERNS[value]:
+            modules.append(('1' if bar else '0') * int(width))
+            bar = not bar
+    return ''.join(modules)
+
+
+def ean13_checksum(digits12):
+    total = sum(int(d) * (3 if idx % 2 else 1) for idx, d in enumerate(digits12))
+    return (10 - total % 10) % 10
+
+
+def normalize_ean13(value):
+    """Accept 12 digits (checksum appended) or 13 digits (checksum verified)."""
+    value = str(value).strip()
+    if not value.isdigit() or len(value) not in (12, 13):
+        raise ValueError('EAN-13 requires 12 or 13 digits')
+    check = ean13_checksum(value[:12])
+    if len(value) == 13 and int(value[12]) != check:
+        raise ValueError('Invalid EAN-13 check digit')
+    return value[:12] + str(check)
+
+
+def ean13_modules(value):
+    code = normalize_ean13(value)
+    parity = EAN_PARITY[int(code[0])]
+    left = ''.join((EAN_L if p == 'L' else EAN_G)[int(d)] for p, d in zip(parity, code[1:7]))
+    right = ''.join(EAN_R[int(d)] for d in code[7:13])
+    return '101' + left + '01010' + right + '101'
+
+
+def is_ean13(value):
+    try:
+        normalize_ean13(value)
+        return True
+    except ValueError:
+        return False
+
+
+def qr_matrix(data, error='M', border=2):
+    """Return the QR module matrix (list of bool rows) including the quiet zone."""
+    qr = qrcode.QRCode(version=None, error_correction=QR_ERROR_LEVELS[error], border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+# ==================== RENDERERS ====================
+
+def _linear_svg(modules, module_width, height, text, quiet):
+    total_w = (len(modules) + 2 * quiet) * module_width
+    text_h = 14 if text else 0
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{total_w}" height="{height + text_h}" '
+        f'viewBox="0 0 {total_w} {height + text_h}" shape-rendering="crispEdges">',
+        f'<rect width="{total_w}" height="{height + text_h}" fill="#ffffff"/>'
+    ]
+    x = quiet
+    for run_start, run_len in _bar_runs(modules):
+        parts.append(
+            f'<rect x="{(x + run_start) * module_width}" y="0" width="{run_len * module_width}" height="{height}" fill="#000000"/>'
+        )
+    if text:
+        safe = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        parts.append(
+            f'<text x="{total_w / 2}" y="{height + 11}" font-family="monospace" font-size="11" text-anchor="middle">{safe}</text>'
+        )
+    parts.append('</svg>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _linear_png(modules, module_width, height, text, quiet):
+    total_w = (len(modules) + 2 * quiet) * module_width
+    text_h = 14 if text else 0
+    img = Image.new('L', (total_w, height + text_h), 255)
+    draw = ImageDraw.Draw(img)
+    for run_start, run_len in _bar_runs(modules):
+        x0 = (quiet + run_start) * module_width
+        draw.rectangle([x0, 0, x0 + run_len * module_width - 1, height - 1], fill=0)
+    if text:
+        font = ImageFont.load_default()
+        text_w = draw.textlength(text, font=font)
+        draw.text(((total_w - text_w) / 2, height + 1), text, fill=0, font=font)
+    out = io.BytesIO()
+    img.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+def _bar_runs(modules):
+    """Yield (start, length) for each consecutive run of bar modules."""
+    start = None
+    for idx, bit in enumerate(modules):
+        if bit == '1' and start is None:
+            start = idx
+        elif bit != '1' and start is not None:
+            yield start, idx - start
+            start = None
+    if start is not None:
+        yield start, len(modules) - start
+
+
+def _qr_svg(matrix, box_size):
+    size = len(matrix) * box_size
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">',
+        f'<rect width="{size}" height="{size}" fill="#ffffff"/>'
+    ]
+    for y, row in enumerate(matrix):
+        for start, length in _bar_runs(''.join('1' if cell else '0' for cell in row)):
+            parts.append(
+                f'<rect x="{start * box_size}" y="{y * box_size}" width="{length * box_size}" height="{box_size}" fill="#000000"/>'
+            )
+    parts.append('</svg>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _qr_png(matrix, box_size):
+    count = len(matrix)
+    img = Image.new('1', (count, count), 1)
+    img.putdata([0 if cell else 1 for row in matrix for cell in row])
+    img = img.resize((count * box_size, count * box_size), Image.NEAREST)
+    out = io.BytesIO()
+    img.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+@lru_cache(maxsize=BARCODE_CACHE_SIZE)
+def _render_cached(symbology, payload, fmt, size, height, border, error, text):
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f'Unsupported output format: {fmt}')
+
+    if symbology == 'qr':
+        matrix = qr_matrix(payload, error=error, border=border)
+        return _qr_svg(matrix, size) if fmt == 'svg' else _qr_png(matrix, size)
+
+    if symbology == 'ean13':
+        modules = ean13_modules(payload)
+        label = normalize_ean13(payload) if text else ''
+    elif symbology == 'code128':
+        modules = code128_modules(payload)
+        label = payload if text else ''
+    else:
+        raise ValueError(f'Unsupported symbology: {symbology}')
+
+    renderer = _linear_svg if fmt == 'svg' else _linear_png
+    return renderer(modules, size, height, label, border)
+
+
+def render_barcode(value, symbology='auto', fmt='svg', module_width=2, height=60, quiet_zone=10, show_text=True):
     """
-    Generate a base64 encoded SVG barcode placeholder (matching legacy JS behavior)
+    Render a linear barcode and return the image bytes.
+    symbology='auto' uses EAN-13 for valid 12/13 digit codes and Code128 otherwise.
     """
+    value = str(value).strip()
+    if symbology == 'auto':
+        symbology = 'ean13' if is_ean13(value) else 'code128'
+    return _render_cached(symbology, value, fmt, int(module_width), int(height), int(quiet_zone), '', bool(show_text))
+
+
+def barcode_error(value):
+    """Why render_barcode(value) with symbology='auto' would fail, or None if the value encodes."""
+    value = str(value).strip()
+    if is_ean13(value):
+        return None
     try:
-        logger.warning('Barcode generation not fully implemented - returning SVG placeholder')
-        svg_content = f"""<svg width="200" height="80" xmlns="http://www.w3.org/2000/svg">
-            <text x="10" y="40" font-family="monospace" font-size="14">{barcode_value}</text>
-        </svg>"""
-        
-        b64_encoded = base64.b64encode(svg_content.encode('utf-8')).decode('utf-8')
-        return f"data:image/svg+xml;base64,{b64_encoded}"
+        code128_values(value)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def render_qr(data, fmt='png', box_size=10, border=2, error='M'):
+    """Render a QR code and return the image bytes. Dict payloads are encoded as compact JSON."""
+    if not isinstance(data, str):
+        data = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return _render_cached('qr', data, fmt, int(box_size), 0, int(border), error.upper(), False)
+
+
+def to_data_uri(image_bytes, fmt):
+    mime = 'image/svg+xml' if fmt == 'svg' else 'image/png'
+    return f"data:{mime};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+
+def cache_info():
+    return _render_cached.cache_info()
+
+
+def generate_barcode_image(barcode_value, fmt='svg', symbology='auto'):
+    """
+    Generate a base64 data URI for a product barcode (Code128 or EAN-13)
+    """
+    try:
+        return to_data_uri(render_barcode(barcode_value, symbology=symbology, fmt=fmt), fmt)
+    except ValueError:
+        raise
     except Exception as e:
         logger.error(f'Barcode generation error: {e}')
         raise Exception('Failed to generate barcode')
 
-def generate_qr_code(data):
+
+def generate_qr_code(data, fmt='svg', box_size=6, border=2, error='M'):
     """
-    Generate a base64 encoded SVG QR placeholder (matching legacy JS behavior)
+    Generate a base64 data URI QR code for a string or JSON-serialisable payload
     """
     try:
-        logger.warning('QR code generation not fully implemented - returning SVG placeholder')
-        
-        # Simple string representation of dict
-        import json
-        data_str = json.dumps(data)[:30]
-        
-        svg_content = f"""<svg width="200" height="200" xmlns="http://www.w3.org/2000/svg">
-            <rect width="200" height="200" fill="white"/>
-            <text x="10" y="100" font-family="monospace" font-size="10">{data_str}</text>
-        </svg>"""
-        
-        b64_encoded = base64.b64encode(svg_content.encode('utf-8')).decode('utf-8')
-        return f"data:image/svg+xml;base64,{b64_encoded}"
+        return to_data_uri(render_qr(data, fmt=fmt, box_size=box_size, border=border, error=error), fmt)
     except Exception as e:
         logger.error(f'QR code generation error: {e}')
         raise Exception('Failed to generate QR code')
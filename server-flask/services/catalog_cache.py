@@ -0,0 +1,158 @@
+"""
+Catalog Cache
+In-process map of barcode/SKU/_id -> product summary for counter scans and
+photo requests. The first lookup warms it in a background thread; until then
+lookups go straight to the unique barcode/sku and _id indexes. Once warm it is
+kept current by pulling products whose `updatedAt` moved (and tombstones) at
+most every CATALOG_REFRESH_SECONDS, so edits made through any worker show up
+within that window.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from utils.tzutils import utc_now
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_ENABLED = os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CATALOG_REFRESH_SECONDS = float(os.environ.get('CATALOG_REFRESH_SECONDS', '5'))
+# Above this many products the map is not built (memory per worker); lookups stay on the indexes
+CATALOG_CACHE_MAX_PRODUCTS = int(os.environ.get('CATALOG_CACHE_MAX_PRODUCTS', '100000'))
+# Re-read a little behind the last high-water mark so writes stamped just before it are not missed
+CATALOG_REFRESH_OVERLAP_SECONDS = 5
+
+CATALOG_FIELDS = {
+    "name": 1, "price": 1, "costPrice": 1, "quantity": 1, "barcode": 1, "sku": 1,
+    "gstPercent": 1, "hsnCode": 1, "photo": 1, "thumbnail": 1, "warrantyMonths": 1, "updatedAt": 1,
+}
+
+
+class CatalogCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_barcode = {}
+        self._by_sku = {}
+        self._warm = False
+        self._warming = False
+        self._oversized = False
+        self._high_water = None
+        self._checked_at = 0.0
+
+    @property
+    def warm(self):
+        return self._warm
+
+    def _index(self, product):
+        old = self._by_id.get(product['_id'])
+        if old:
+            self._unindex(old)
+        self._by_id[product['_id']] = product
+        if product.get('barcode'):
+            self._by_barcode[product['barcode']] = product
+        if product.get('sku'):
+            self._by_sku[product['sku']] = product
+
+    def _unindex(self, product):
+        if product.get('barcode') and self._by_barcode.get(product['barcode']) is product:
+            del self._by_barcode[product['barcode']]
+        if product.get('sku') and self._by_sku.get(product['sku']) is product:
+            del self._by_sku[product['sku']]
+
+    def _load(self, db):
+        started = utc_now()
+        if db.products.estimated_document_count() > CATALOG_CACHE_MAX_PRODUCTS:
+            logger.info("[catalog-cache] Catalog larger than CATALOG_CACHE_MAX_PRODUCTS; staying on index lookups")
+            self._oversized = True
+            return
+        products = list(db.products.find({}, CATALOG_FIELDS).batch_size(5000))
+        with self._lock:
+            self._by_id, self._by_barcode, self._by_sku = {}, {}, {}
+            for product in products:
+                self._index(product)
+            self._high_water = started
+            self._checked_at = time.monotonic()
+            self._warm = True
+        logger.info(f"[catalog-cache] Warmed with {len(products)} products")
+
+    def _warm_in_background(self, db):
+        def _worker():
+            try:
+                self._load(db)
+            except Exception as e:
+                logger.error(f"[catalog-cache] Warm-up failed: {e}")
+            finally:
+                self._warming = False
+
+        with self._lock:
+            if self._warm or self._warming or self._oversized:
+                return
+            self._warming = True
+        threading.Thread(target=_worker, name='catalog-cache-warm', daemon=True).start()
+
+    def _refresh(self, db):
+        """Apply products changed (and deleted) since the last refresh."""
+        with self._lock:
+            if time.monotonic() - self._checked_at < CATALOG_REFRESH_SECONDS:
+                return
+            self._checked_at = time.monotonic()
+            since = self._high_water - timedelta(seconds=CATALOG_REFRESH_OVERLAP_SECONDS)
+
+        now = utc_now()
+        changed = list(db.products.find({"updatedAt": {"$gt": since}}, CATALOG_FIELDS))
+        deleted = [t['docId'] for t in db.tombstones.find(
+            {"collection": "products", "deletedAt": {"$gt": since}}, {"docId": 1}
+        )]
+        with self._lock:
+            for product in changed:
+                self._index(product)
+            for doc_id in deleted:
+                old = self._by_id.pop(doc_id, None)
+                if old:
+                    self._unindex(old)
+            self._high_water = now
+
+    def lookup(self, db, code):
+        """
+        Return (product summary or None, source) for an exact barcode/SKU.
+        source is 'cache' or 'index'. Cache misses still check the indexes (the product may be seconds old).
+        """
+        if CATALOG_CACHE_ENABLED:
+            if self._warm:
+                try:
+                    self._refresh(db)
+                except Exception as e:
+                    logger.warning(f"[catalog-cache] Refresh failed, serving last snapshot: {e}")
+                product = self._by_barcode.get(code) or self._by_sku.get(code)
+                if product:
+                    return product, 'cache'
+            else:
+                self._warm_in_background(db)
+
+        product = db.products.find_one({"barcode": code}, CATALOG_FIELDS)
+        if not product:
+            product = db.products.find_one({"sku": code}, CATALOG_FIELDS)
+        return product, 'index'
+
+
+    def get(self, db, product_id):
+        """Product summary by ObjectId, from the map when warm (falls back to the _id index)."""
+        if CATALOG_CACHE_ENABLED:
+            if self._warm:
+                try:
+                    self._refresh(db)
+                except Exception as e:
+                    logger.warning(f"[catalog-cache] Refresh failed, serving last snapshot: {e}")
+                product = self._by_id.get(product_id)
+                if product:
+                    return product
+            else:
+                self._warm_in_background(db)
+        return db.products.find_one({"_id": product_id}, CATALOG_FIELDS)
+
+
+catalog_cache = CatalogCache()
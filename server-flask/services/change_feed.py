@@ -0,0 +1,133 @@
+"""
+Change Feed
+Incremental sync support for products, customers and bills. Every write path
+stamps `updatedAt`; deletes leave a tombstone. A sync token is an opaque
+high-water mark, so each run only reads what changed since the previous one.
+"""
+
+import base64
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from utils.tzutils import utc_now, to_iso_string
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FEED_COLLECTIONS = ('products', 'customers', 'bills')
+# Tombstones older than this are dropped by a TTL index; older tokens must resync in full
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', '90'))
+# Writes stamped just before a sync may still be in flight; the high-water mark trails "now" by this much
+CHANGE_FEED_SAFETY_SECONDS = 5
+CHANGE_FEED_BATCH_SIZE = 500
+
+# Never leave the server through the feed (secrets, internal search index terms)
+_HIDDEN_FIELDS = {
+    'products': {'searchTerms': 0, 'nameLower': 0},
+    'customers': {'accountPassword': 0, 'sessionVersion': 0, 'otp': 0, 'otpExpiry': 0},
+}
+
+TOKEN_VERSION = 1
+
+
+class TokenExpired(Exception):
+    pass
+
+
+def record_deletion(db, collection, doc_id):
+    """Leave a tombstone so incremental syncs learn about the delete."""
+    try:
+        db.tombstones.insert_one({
+            "collection": collection,
+            "docId": doc_id,
+            "deletedAt": utc_now(),
+        })
+    except Exception as e:
+        logger.error(f"Failed to record tombstone for {collection}/{doc_id}: {e}")
+
+
+def encode_token(high_water):
+    payload = json.dumps({"v": TOKEN_VERSION, "t": int(high_water.timestamp() * 1000)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    """Return the UTC datetime a token marks. Raises ValueError if malformed, TokenExpired if too old."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload.get('v') != TOKEN_VERSION:
+            raise ValueError('unsupported token version')
+        since = datetime.fromtimestamp(payload['t'] / 1000.0, tz=timezone.utc)
+    except Exception:
+        raise ValueError('Invalid sync token')
+
+    if since < utc_now() - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        raise TokenExpired()
+    return since
+
+
+def _json_safe(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return to_iso_string(value)
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _as_aware(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def current_high_water():
+    return utc_now() - timedelta(seconds=CHANGE_FEED_SAFETY_SECONDS)
+
+
+def iter_changes(db, since, until, collections=CHANGE_FEED_COLLECTIONS, counts=None):
+    """
+    Yield change events between *since* (exclusive, None for a full snapshot) and *until* (inclusive).
+    Upserts come from the updatedAt index; deletes from tombstones. *counts* is filled per collection.
+    """
+    counts = counts if counts is not None else {}
+    for name in collections:
+        if since is None:
+            query = {}
+        else:
+            query = {"updatedAt": {"$gt": since, "$lte": until}}
+        projection = _HIDDEN_FIELDS.get(name)
+        cursor = db[name].find(query, projection).sort([("updatedAt", 1), ("_id", 1)]).batch_size(CHANGE_FEED_BATCH_SIZE)
+
+        upserts = 0
+        try:
+            for doc in cursor:
+                created = _as_aware(doc.get('createdAt'))
+                op = 'insert' if since is None or (isinstance(created, datetime) and created > since) else 'update'
+                yield {"op": op, "collection": name, "id": str(doc['_id']), "doc": _json_safe(doc)}
+                upserts += 1
+        finally:
+            cursor.close()
+
+        deletes = 0
+        if since is not None:
+            tombstones = db.tombstones.find(
+                {"collection": name, "deletedAt": {"$gt": since, "$lte": until}}
+            ).sort("deletedAt", 1)
+            for tomb in tombstones:
+                yield {
+                    "op": "delete",
+                    "collection": name,
+                    "id": str(tomb['docId']),
+                    "deletedAt": to_iso_string(tomb.get('deletedAt')),
+                }
+                deletes += 1
+
+        counts[name] = {"upserts": upserts, "deletes": deletes}
@@ -84,6 +84,24 @@ def upload_buffer(file, folder, public_id=None, overwrite=True, width=800, heigh
         logger.error(f"Cloudinary upload error: {e}")
         raise Exception(f"Cloudinary upload failed: {e}")
 
+def upload_image_bytes(data, folder, public_id):
+    """Upload an already-processed image as-is (no Cloudinary transformation)."""
+    if not is_configured():
+        raise ValueError('Cloudinary is not configured. Missing API keys.')
+    try:
+        result = cloudinary.uploader.upload(data, folder=folder, public_id=public_id, resource_type="image", overwrite=True)
+        return {
+            "url": result.get("secure_url"),
+            "publicId": result.get("public_id"),
+            "width": result.get("width"),
+            "height": result.get("height"),
+            "bytes": result.get("bytes"),
+            "format": result.get("format")
+        }
+    except Exception as e:
+        logger.error(f"Cloudinary upload error: {e}")
+        raise Exception(f"Cloudinary upload failed: {e}")
+
 def upload_user_photo(file, user_id):
     validate_file(file)
     return upload_buffer(file, folder="inventory/users", public_id=user_id, overwrite=True, width=400, height=400)
@@ -0,0 +1,54 @@
+"""
+Count Cache
+Per-process cache for list totals (X-Total-Count). Writers bump a shared
+generation number in `cache_versions`; readers reuse a cached count while the
+generation is unchanged, so every worker sees an insert or delete immediately
+and a list request costs one _id lookup instead of a collection count.
+"""
+
+import json
+import logging
+import threading
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+_counts = {}
+
+
+def current_generation(db, name):
+    doc = db.cache_versions.find_one({"_id": name}, {"generation": 1})
+    return doc.get('generation', 0) if doc else 0
+
+
+def bump_generation(db, name):
+    """Invalidate cached counts for *name* in every worker. Call after inserts and deletes."""
+    try:
+        db.cache_versions.find_one_and_update(
+            {"_id": name}, {"$inc": {"generation": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        logger.warning(f"Could not bump cache generation for {name}: {e}")
+
+
+def cached_count(db, name, query=None):
+    """count_documents(query) on collection *name*, reused until the collection's generation changes."""
+    query = query or {}
+    key = (name, json.dumps(query, sort_keys=True, default=str))
+    generation = current_generation(db, name)
+
+    with _lock:
+        hit = _counts.get(key)
+    if hit and hit[0] == generation:
+        return hit[1]
+
+    total = db[name].count_documents(query)
+    with _lock:
+        if len(_counts) >= COUNT_CACHE_MAX_ENTRIES:
+            _counts.clear()
+        _counts[key] = (generation, total)
+    return total
@@ -0,0 +1,241 @@
+"""
+Customer Import Service
+Bulk-loads customer lists exported from other billing software or WhatsApp.
+Phones are normalised to their last 10 digits (the same rule the portal uses to
+match bills), emails are lower-cased, and both are looked up through indexed
+keys one chunk at a time. New customers are inserted; matches are merged.
+"""
+
+import logging
+
+import numpy as np
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.tabular_import import map_columns, row_numbers, chunked
+from utils.tzutils import utc_now
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_IMPORT_ALIASES = {
+    'name': ['name', 'customername', 'customer', 'fullname', 'contactname', 'displayname'],
+    'phone': ['phone', 'mobile', 'mobileno', 'mobilenumber', 'phonenumber', 'phoneno', 'contact',
+              'contactnumber', 'whatsapp', 'whatsappnumber', 'phone1value'],
+    'email': ['email', 'emailid', 'emailaddress', 'mail', 'email1value'],
+    'company': ['company', 'companyname', 'organization', 'organisation', 'organization1name', 'business'],
+    'position': ['position', 'designation', 'title', 'jobtitle', 'organization1title'],
+    'website': ['website', 'web', 'url'],
+    'address': ['address', 'street', 'address1street'],
+    'place': ['place', 'area', 'locality'],
+    'city': ['city', 'town', 'address1city'],
+    'country': ['country', 'address1country'],
+    'pincode': ['pincode', 'pin', 'zip', 'zipcode', 'postalcode', 'address1postalcode'],
+    'gstin': ['gstin', 'gst', 'gstno', 'gstnumber'],
+}
+
+TEXT_FIELDS = tuple(CUSTOMER_IMPORT_ALIASES)
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+CONFLICT_MODES = ('merge', 'overwrite', 'skip')
+
+
+def validate_customers(frame):
+    """
+    Vectorised validation of a mapped customer frame.
+    Returns (phone keys, email keys, list of error lists aligned with rows).
+    """
+    errors = [[] for _ in range(len(frame))]
+
+    def flag(mask, message):
+        for pos in np.flatnonzero(np.asarray(mask, dtype=bool)):
+            errors[pos].append(message)
+
+    digits = frame['phone'].str.replace(r'\D', '', regex=True)
+    phone_keys = digits.str[-10:]
+    email_keys = frame['email'].str.lower()
+
+    flag(frame['name'] == '', "name is required")
+    flag((frame['phone'] != '') & (digits.str.len() < 10), "phone must have at least 10 digits")
+    flag((email_keys != '') & ~email_keys.str.match(EMAIL_PATTERN), "email is not valid")
+
+    # A later row sharing a phone or email with an earlier one is the same person twice
+    rows = row_numbers(frame)
+    for keys in (phone_keys, email_keys):
+        duplicated = keys.duplicated(keep='first') & (keys != '')
+        if duplicated.any():
+            first_row = rows.groupby(keys).transform('min')
+            for pos in np.flatnonzero(duplicated.to_numpy()):
+                message = f"duplicate of row {int(first_row.iloc[pos])} in this file"
+                if message not in errors[pos]:
+                    errors[pos].append(message)
+
+    return phone_keys.tolist(), email_keys.tolist(), errors
+
+
+def _find_existing(db, phone_keys, email_keys):
+    """Return ({phone key: customer}, {email key: customer}) for one chunk, using one indexed $or query."""
+    clauses = []
+    if phone_keys:
+        clauses.append({"phoneNormalized": {"$in": phone_keys}})
+    if email_keys:
+        clauses.append({"emailNormalized": {"$in": email_keys}})
+    if not clauses:
+        return {}, {}
+
+    by_phone, by_email = {}, {}
+    projection = {field: 1 for field in TEXT_FIELDS}
+    projection.update(phoneNormalized=1, emailNormalized=1)
+    for customer in db.customers.find({"$or": clauses}, projection):
+        if customer.get('phoneNormalized'):
+            by_phone.setdefault(customer['phoneNormalized'], customer)
+        if customer.get('emailNormalized'):
+            by_email.setdefault(customer['emailNormalized'], customer)
+    return by_phone, by_email
+
+
+def _merge_update(row, existing, mode, user, now):
+    """
+    Decide what to write onto an existing customer.
+    Blank fields are always filled; differing values are reported and only replaced in overwrite mode.
+    Returns (update or None, changed fields, conflicts).
+    """
+    changes, conflicts = {}, []
+    for field in TEXT_FIELDS:
+        incoming = row[field]
+        current = str(existing.get(field) or '').strip()
+        if not incoming or incoming == current:
+            continue
+        if field == 'email' and incoming.lower() == current.lower():
+            continue
+        if field == 'phone' and existing.get('phoneNormalized') == row['phoneKey']:
+            continue
+        if current:
+            conflicts.append({"field": field, "existing": current, "incoming": incoming})
+            if mode != 'overwrite':
+                continue
+        changes[field] = incoming
+
+    if not changes:
+        return None, [], conflicts
+
+    if 'phone' in changes:
+        changes['phoneNormalized'] = row['phoneKey']
+    if 'email' in changes:
+        changes['emailNormalized'] = row['emailKey']
+    update = {"$set": {**changes, "updatedAt": now, "updatedBy": user.get('userId'),
+                       "updatedByUsername": user.get('username')}}
+    return UpdateOne({"_id": existing['_id']}, update), [f for f in changes if f in TEXT_FIELDS], conflicts
+
+
+def _new_customer(row, user, now):
+    """Document shaped like customers.add_customer. Blank email is omitted to stay clear of the unique index."""
+    customer = {"_id": ObjectId(), **{field: row[field] for field in TEXT_FIELDS}}
+    if not customer['email']:
+        del customer['email']
+    customer.update({
+        "purchasesCount": 0,
+        "totalPurchases": 0,
+        "createdAt": now,
+        "updatedAt": now,
+        "createdBy": user.get('userId'),
+        "createdByUsername": user.get('username'),
+        "importedAt": now,
+    })
+    if row['phoneKey']:
+        customer['phoneNormalized'] = row['phoneKey']
+    if row['emailKey']:
+        customer['emailNormalized'] = row['emailKey']
+    return customer
+
+
+def import_customers(db, frame, user, on_conflict='merge', dry_run=False):
+    """
+    Validate, dedupe and write a raw (unmapped) customer frame.
+    on_conflict: merge (fill blanks only), overwrite (incoming values win) or skip (leave matches untouched).
+    Returns {"summary": {...}, "rows": [per-row report]}.
+    """
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"onConflict must be one of: {', '.join(CONFLICT_MODES)}")
+
+    mapped = map_columns(frame, CUSTOMER_IMPORT_ALIASES)
+    if not ((mapped['name'] != '') | (mapped['phone'] != '')).any():
+        raise ValueError("No customer name or phone column found (expected headers like 'Name' and 'Phone')")
+
+    phone_keys, email_keys, errors = validate_customers(mapped)
+    rows = row_numbers(mapped).tolist()
+    report = [
+        {"row": rows[pos], "name": mapped['name'].iat[pos], "status": "error" if errors[pos] else "pending",
+         "errors": errors[pos]}
+        for pos in range(len(mapped))
+    ]
+
+    now = utc_now()
+    records = mapped.to_dict('records')
+    valid_positions = [pos for pos in range(len(mapped)) if not errors[pos]]
+    for chunk in chunked(valid_positions):
+        by_phone, by_email = _find_existing(
+            db,
+            sorted({phone_keys[pos] for pos in chunk if phone_keys[pos]}),
+            sorted({email_keys[pos] for pos in chunk if email_keys[pos]}),
+        )
+        ops, op_positions = [], []
+        for pos in chunk:
+            row = {**records[pos], 'phoneKey': phone_keys[pos], 'emailKey': email_keys[pos]}
+            phone_match = by_phone.get(row['phoneKey']) if row['phoneKey'] else None
+            email_match = by_email.get(row['emailKey']) if row['emailKey'] else None
+            entry = report[pos]
+
+            if phone_match and email_match and phone_match['_id'] != email_match['_id']:
+                entry.update(status="conflict", errors=[
+                    f"phone matches customer {phone_match.get('name') or phone_match['_id']} but email matches "
+                    f"customer {email_match.get('name') or email_match['_id']}"
+                ])
+                continue
+
+            match = phone_match or email_match
+            if not match:
+                customer = _new_customer(row, user, now)
+                ops.append(InsertOne(customer))
+                op_positions.append(pos)
+                entry.update(status="created", id=str(customer['_id']))
+                continue
+
+            entry['id'] = str(match['_id'])
+            entry['matchedOn'] = 'phone' if phone_match else 'email'
+            if on_conflict == 'skip':
+                entry['status'] = "skipped"
+                continue
+
+            op, changed, conflicts = _merge_update(row, match, on_conflict, user, now)
+            if conflicts:
+                entry['conflicts'] = conflicts
+            if not op:
+                entry['status'] = "unchanged"
+                continue
+            entry.update(status="merged", updatedFields=changed)
+            ops.append(op)
+            op_positions.append(pos)
+
+        if dry_run or not ops:
+            continue
+
+        try:
+            db.customers.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                pos = op_positions[write_error['index']]
+                report[pos].update(status="error", errors=[write_error.get('errmsg', 'write failed')])
+                report[pos].pop('id', None)
+
+    summary = {"rows": len(report), "created": 0, "merged": 0, "unchanged": 0, "skipped": 0,
+               "conflicts": 0, "errors": 0, "dryRun": dry_run}
+    for entry in report:
+        if entry['status'] == 'conflict':
+            summary['conflicts'] += 1
+        elif entry['status'] in ('created', 'merged', 'unchanged', 'skipped'):
+            summary[entry['status']] += 1
+        else:
+            summary['errors'] += 1
+    summary['fieldConflicts'] = sum(len(entry.get('conflicts', [])) for entry in report)
+    return {"summary": summary, "rows": report}
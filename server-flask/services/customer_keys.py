@@ -0,0 +1,28 @@
+"""
+Customer Match Keys
+Normalised phone and email stored on every customer (phoneNormalized,
+emailNormalized) so duplicate checks and imports match on an index. Kept free
+of PDF/imaging imports so database startup and the import path stay light.
+"""
+
+
+def normalize_phone(phone) -> str:
+    """Digits only, last 10 kept, so '+91 98765-43210', '919876543210' and '9876543210' agree."""
+    digits = ''.join(ch for ch in str(phone or '') if ch.isdigit())
+    return digits[-10:]
+
+
+def normalize_email(email) -> str:
+    return str(email or '').strip().lower()
+
+
+def customer_match_keys(phone, email) -> dict:
+    """Indexed dedupe keys stored on every customer (blank keys are left unset)."""
+    keys = {}
+    phone_key = normalize_phone(phone)
+    if phone_key:
+        keys['phoneNormalized'] = phone_key
+    email_key = normalize_email(email)
+    if email_key:
+        keys['emailNormalized'] = email_key
+    return keys
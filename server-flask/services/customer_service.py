@@ -1,7 +1,12 @@
 """Customer service – business logic helpers."""
 
 import io
-import qrcode
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas as rl_canvas
+
+from services import pdf_layout as layout
+from services.barcode_service import render_qr
 
 
 def build_vcard(customer: dict) -> str:
@@ -53,95 +58,97 @@ def build_pvc_card_pdf(customer: dict, company_name: str = '', company_phone: st
 
     Card dimensions: 85.6 mm × 54 mm (standard ISO 7810 ID-1 / credit card size).
     In points (1 pt = 1/72 inch ≈ 0.353 mm): 242.5 pt × 153.1 pt
+    Colours and layout constants are precompiled in services.pdf_layout.
     """
-    from reportlab.lib.units import mm
-    from reportlab.lib import colors
-    from reportlab.lib.colors import HexColor
-    from reportlab.platypus import SimpleDocTemplate
-    from reportlab.graphics.shapes import Drawing, Rect, String, Circle, Line
-    from reportlab.graphics import renderPDF
-    from reportlab.pdfgen import canvas as rl_canvas
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-
-    CARD_W = 85.6 * mm
-    CARD_H = 54.0 * mm
-
     buffer = io.BytesIO()
-    c = rl_canvas.Canvas(buffer, pagesize=(CARD_W, CARD_H))
+    c = rl_canvas.Canvas(buffer, pagesize=(layout.CARD_W, layout.CARD_H))
+    draw_pvc_card(c, customer, company_name, company_phone)
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def draw_pvc_card(c, customer: dict, company_name: str = '', company_phone: str = '') -> None:
+    """Draw one card onto canvas *c* with its origin at the current (0, 0).
+
+    The vCard QR comes from barcode_service's LRU cache, so reprinting a sheet re-encodes nothing.
+    """
+    card_w = layout.CARD_W
+    card_h = layout.CARD_H
+    margin = layout.CARD_MARGIN
 
     # ── Background gradient simulation (white → light blue tint) ──
     # Draw a light background
-    c.setFillColor(HexColor('#f0f4ff'))
-    c.rect(0, 0, CARD_W, CARD_H, fill=1, stroke=0)
+    c.setFillColor(layout.CARD_BACKGROUND)
+    c.rect(0, 0, card_w, card_h, fill=1, stroke=0)
 
     # Accent bar at top (brand colour)
-    c.setFillColor(HexColor('#2563eb'))
-    c.rect(0, CARD_H - 8 * mm, CARD_W, 8 * mm, fill=1, stroke=0)
+    c.setFillColor(layout.CARD_ACCENT)
+    c.rect(0, card_h - layout.CARD_ACCENT_BAR_H, card_w, layout.CARD_ACCENT_BAR_H, fill=1, stroke=0)
 
     # White card body below bar
-    c.setFillColor(HexColor('#ffffff'))
-    c.rect(0, 0, CARD_W, CARD_H - 8 * mm, fill=1, stroke=0)
+    c.setFillColor(layout.CARD_BODY)
+    c.rect(0, 0, card_w, card_h - layout.CARD_ACCENT_BAR_H, fill=1, stroke=0)
 
     # Subtle bottom accent strip
-    c.setFillColor(HexColor('#1e40af'))
-    c.rect(0, 0, CARD_W, 2 * mm, fill=1, stroke=0)
+    c.setFillColor(layout.CARD_ACCENT_DARK)
+    c.rect(0, 0, card_w, layout.CARD_BOTTOM_STRIP_H, fill=1, stroke=0)
 
     # ── Company name in accent bar ──
-    c.setFillColor(HexColor('#ffffff'))
+    c.setFillColor(layout.CARD_BODY)
     c.setFont("Helvetica-Bold", 7)
-    c.drawString(4 * mm, CARD_H - 5 * mm, (company_name or 'Company').upper()[:30])
+    c.drawString(margin, card_h - 5 * mm, (company_name or 'Company').upper()[:30])
 
     if company_phone:
         c.setFont("Helvetica", 5.5)
-        c.setFillColor(HexColor('#bfdbfe'))
-        c.drawRightString(CARD_W - 4 * mm, CARD_H - 5 * mm, company_phone)
+        c.setFillColor(layout.CARD_ACCENT_TEXT)
+        c.drawRightString(card_w - margin, card_h - 5 * mm, company_phone)
 
     # ── Customer name ──
     name = customer.get('name', 'Customer')
-    c.setFillColor(HexColor('#0f172a'))
+    c.setFillColor(layout.CARD_NAME_TEXT)
     c.setFont("Helvetica-Bold", 9)
     # Truncate long names
-    max_name = 24
+    max_name = layout.CARD_NAME_MAX
     display_name = name if len(name) <= max_name else name[:max_name - 1] + '…'
-    c.drawString(4 * mm, CARD_H - 15 * mm, display_name)
+    c.drawString(margin, card_h - 15 * mm, display_name)
 
     # Position / title
-    y_pos = CARD_H - 20 * mm
+    y_pos = card_h - 20 * mm
     if customer.get('position'):
         c.setFont("Helvetica-Oblique", 6.5)
-        c.setFillColor(HexColor('#2563eb'))
-        c.drawString(4 * mm, y_pos, customer['position'][:30])
-        y_pos -= 4.5 * mm
+        c.setFillColor(layout.CARD_ACCENT)
+        c.drawString(margin, y_pos, customer['position'][:30])
+        y_pos -= layout.CARD_TITLE_STEP
 
     # Company / business name
     if customer.get('company'):
         c.setFont("Helvetica", 6.5)
-        c.setFillColor(HexColor('#334155'))
-        c.drawString(4 * mm, y_pos, customer['company'][:30])
-        y_pos -= 4.5 * mm
+        c.setFillColor(layout.CARD_VALUE_TEXT)
+        c.drawString(margin, y_pos, customer['company'][:30])
+        y_pos -= layout.CARD_TITLE_STEP
 
     # Separator line
     sep_y = y_pos + 1 * mm
-    c.setStrokeColor(HexColor('#e2e8f0'))
+    c.setStrokeColor(layout.CARD_SEPARATOR)
     c.setLineWidth(0.4)
-    c.line(4 * mm, sep_y, CARD_W - 4 * mm, sep_y)
+    c.line(margin, sep_y, card_w - margin, sep_y)
     y_pos -= 1.5 * mm
 
     # ── Contact details ──
     c.setFont("Helvetica", 6)
-    c.setFillColor(HexColor('#475569'))
+    c.setFillColor(layout.CARD_BODY_TEXT)
 
     def draw_contact(label: str, value: str, y: float) -> float:
         if not value:
             return y
         c.setFont("Helvetica-Bold", 5.5)
-        c.setFillColor(HexColor('#94a3b8'))
-        c.drawString(4 * mm, y, label + ':')
+        c.setFillColor(layout.CARD_LABEL_TEXT)
+        c.drawString(margin, y, label + ':')
         c.setFont("Helvetica", 6)
-        c.setFillColor(HexColor('#334155'))
-        c.drawString(18 * mm, y, str(value)[:32])
-        return y - 4 * mm
+        c.setFillColor(layout.CARD_VALUE_TEXT)
+        c.drawString(layout.CARD_VALUE_X, y, str(value)[:32])
+        return y - layout.CARD_LINE_STEP
 
     y_pos = draw_contact('Ph', customer.get('phone', ''), y_pos)
     y_pos = draw_contact('Email', customer.get('email', ''), y_pos)
@@ -154,32 +161,64 @@ def build_pvc_card_pdf(customer: dict, company_name: str = '', company_phone: st
         y_pos = draw_contact('GSTIN', customer['gstin'], y_pos)
 
     # ── QR code (vCard) – right side ──
-    vcard_data = build_vcard(customer)
     try:
-        qr = qrcode.QRCode(version=None, box_size=4, border=1, error_correction=qrcode.constants.ERROR_CORRECT_M)
-        qr.add_data(vcard_data)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = io.BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-
-        qr_size = 22 * mm
-        qr_x = CARD_W - qr_size - 4 * mm
-        qr_y = 4 * mm
+        qr_png = _vcard_qr_png(build_vcard(customer))
+        qr_image = ImageReader(io.BytesIO(qr_png))
+
+        qr_size = layout.CARD_QR_SIZE
+        qr_x = card_w - qr_size - margin
+        qr_y = margin
         c.drawImage(
-            qr_buffer,  # type: ignore[arg-type]
+            qr_image,
             qr_x, qr_y,
             width=qr_size, height=qr_size,
             preserveAspectRatio=True
         )
         # Label under QR
         c.setFont("Helvetica", 4.5)
-        c.setFillColor(HexColor('#94a3b8'))
+        c.setFillColor(layout.CARD_LABEL_TEXT)
         c.drawCentredString(qr_x + qr_size / 2, qr_y - 3 * mm, 'Scan to save')
     except Exception:
         pass  # QR generation is optional
 
+
+def _vcard_qr_png(vcard_data: str) -> bytes:
+    # One pixel per module: drawImage scales it to CARD_QR_SIZE without interpolation, and
+    # ReportLab's pure-Python ASCII85 pass over the image data is most of the card's cost.
+    return render_qr(vcard_data, fmt='png', box_size=1, border=1, error='M')
+
+
+def build_pvc_card_sheet(customers: list, out, company_name: str = '', company_phone: str = '') -> None:
+    """Impose PVC cards for *customers* onto A4 sheets and write the PDF to file object *out*.
+
+    Each sheet holds PVC_SHEET_COLUMNS × PVC_SHEET_ROWS cards at true CR80 size, with
+    hairline cut guides around every card.
+    """
+    c = rl_canvas.Canvas(out, pagesize=(layout.PVC_SHEET_W, layout.PVC_SHEET_H))
+    c.setTitle("Customer Cards")
+
+    columns, rows = layout.PVC_SHEET_COLUMNS, layout.PVC_SHEET_ROWS
+    per_page = columns * rows
+    gap = layout.PVC_SHEET_GAP
+    grid_w = columns * layout.CARD_W + (columns - 1) * gap
+    grid_h = rows * layout.CARD_H + (rows - 1) * gap
+    left = (layout.PVC_SHEET_W - grid_w) / 2
+    top = (layout.PVC_SHEET_H + grid_h) / 2
+
+    for index, customer in enumerate(customers):
+        slot = index % per_page
+        if index and slot == 0:
+            c.showPage()
+        col, row = slot % columns, slot // columns
+        x = left + col * (layout.CARD_W + gap)
+        y = top - (row + 1) * layout.CARD_H - row * gap
+
+        c.saveState()
+        c.translate(x, y)
+        draw_pvc_card(c, customer, company_name, company_phone)
+        c.setStrokeColor(layout.PVC_SHEET_CUT_GUIDE)
+        c.setLineWidth(0.25)
+        c.rect(0, 0, layout.CARD_W, layout.CARD_H, fill=0, stroke=1)
+        c.restoreState()
+
     c.save()
-    buffer.seek(0)
-    return buffer
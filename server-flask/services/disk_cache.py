@@ -0,0 +1,99 @@
+"""
+Local Disk Cache
+Small content-addressed file cache for rendered artifacts (PDFs, images).
+Entries live under CACHE_DIR/<namespace>/ and are pruned oldest-first
+when a namespace grows past its byte budget.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'inventory-cache'))
+
+
+def make_key(*parts):
+    """Build a stable cache key from arbitrary string-able parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def _namespace_dir(namespace):
+    path = os.path.join(CACHE_DIR, namespace)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_path(namespace, key, suffix=''):
+    """Absolute path of a cache entry (the file may not exist yet)."""
+    return os.path.join(_namespace_dir(namespace), f"{key}{suffix}")
+
+
+def read(namespace, key, suffix=''):
+    """Return cached bytes or None. Touches the entry so pruning is LRU."""
+    path = cache_path(namespace, key, suffix)
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        os.utime(path, None)
+        return data
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Disk cache read failed for {namespace}/{key}: {e}")
+        return None
+
+
+def write(namespace, key, data, suffix=''):
+    """Atomically store bytes for a key and return the entry path."""
+    path = cache_path(namespace, key, suffix)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Disk cache write failed for {namespace}/{key}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return path
+
+
+def prune(namespace, max_bytes):
+    """Delete least-recently-used entries until the namespace fits in max_bytes."""
+    directory = _namespace_dir(namespace)
+    entries = []
+    total = 0
+    for name in os.listdir(directory):
+        if name.endswith('.tmp'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            continue
+        if total <= max_bytes:
+            break
+    return removed
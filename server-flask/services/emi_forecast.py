@@ -0,0 +1,176 @@
+"""
+EMI Collections Forecast
+How much EMI money falls due in each coming IST week and month, and how much is
+already overdue, from one aggregation over open installments (read through the
+emi_installments (status, dueDate) index). Results are cached per
+process for EMI_FORECAST_CACHE_SECONDS; the report is a planning view, so a few
+minutes of staleness is fine and repeated dashboard loads cost nothing.
+"""
+
+import os
+import threading
+import time
+
+from utils.tzutils import utc_now, utc_to_ist, to_iso_string
+from services.emi_schedule import add_months
+from services.emi_installments import OPEN_INSTALLMENT_STATUSES
+
+FORECAST_TIMEZONE = 'Asia/Kolkata'
+EMI_FORECAST_CACHE_SECONDS = int(os.environ.get('EMI_FORECAST_CACHE_SECONDS', '300'))
+FORECAST_DEFAULT_MONTHS = 3
+FORECAST_MAX_MONTHS = 12
+FORECAST_TOP_CUSTOMERS = 50
+_CACHE_MAX_ENTRIES = 128
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def forecast_horizon(months, now=None):
+    """Start of the IST month *months* after the current one (returned in UTC)."""
+    local = utc_to_ist(now or utc_now())
+    return add_months(local.replace(day=1, hour=0, minute=0, second=0, microsecond=0), months)
+
+
+def _week_start(date_field):
+    # Monday of the IST ISO week containing the date
+    return {"$dateToString": {"format": "%Y-%m-%d", "timezone": FORECAST_TIMEZONE, "date": {"$dateFromParts": {
+        "isoWeekYear": {"$isoWeekYear": {"date": date_field, "timezone": FORECAST_TIMEZONE}},
+        "isoWeek": {"$isoWeek": {"date": date_field, "timezone": FORECAST_TIMEZONE}},
+        "isoDayOfWeek": 1,
+        "timezone": FORECAST_TIMEZONE,
+    }}}}
+
+
+def _bucket(key):
+    return [
+        {"$match": {"overdue": False}},
+        {"$group": {"_id": key, "amount": {"$sum": "$remaining"}, "installments": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def forecast_pipeline(now, horizon, customer_id=None):
+    match = {"status": {"$in": OPEN_INSTALLMENT_STATUSES}, "dueDate": {"$lt": horizon}}
+    if customer_id is not None:
+        match["customerId"] = {"$in": [customer_id, str(customer_id)]}
+
+    facets = {
+        "overdue": [
+            {"$match": {"overdue": True}},
+            {"$group": {"_id": None, "amount": {"$sum": "$remaining"}, "installments": {"$sum": 1},
+                        "plans": {"$addToSet": "$planId"}}},
+            {"$project": {"_id": 0, "amount": 1, "installments": 1, "plans": {"$size": "$plans"}}},
+        ],
+        "weeks": _bucket(_week_start("$dueDate")),
+        "months": _bucket({"$dateToString": {"format": "%Y-%m", "date": "$dueDate", "timezone": FORECAST_TIMEZONE}}),
+        "customers": [
+            {"$group": {
+                "_id": "$customerId",
+                "customerName": {"$first": "$customerName"},
+                "customerPhone": {"$first": "$customerPhone"},
+                "due": {"$sum": {"$cond": ["$overdue", 0, "$remaining"]}},
+                "overdue": {"$sum": {"$cond": ["$overdue", "$remaining", 0]}},
+                "nextDueDate": {"$min": {"$cond": ["$overdue", None, "$dueDate"]}},
+                "plans": {"$addToSet": "$planId"},
+            }},
+            {"$sort": {"overdue": -1, "due": -1}},
+            {"$limit": FORECAST_TOP_CUSTOMERS},
+        ],
+    }
+    if customer_id is not None:
+        facets["plans"] = [
+            {"$group": {
+                "_id": "$planId",
+                "billNumber": {"$first": "$billNumber"},
+                "due": {"$sum": {"$cond": ["$overdue", 0, "$remaining"]}},
+                "overdue": {"$sum": {"$cond": ["$overdue", "$remaining", 0]}},
+                "nextDueDate": {"$min": {"$cond": ["$overdue", None, "$dueDate"]}},
+                "installments": {"$push": {"installmentNo": "$installmentNo", "dueDate": "$dueDate",
+                                           "remaining": "$remaining", "overdue": "$overdue"}},
+            }},
+            {"$sort": {"overdue": -1, "nextDueDate": 1}},
+        ]
+
+    return [
+        {"$match": match},
+        {"$project": {
+            "planId": 1, "customerId": 1, "customerName": 1, "customerPhone": 1, "billNumber": 1,
+            "installmentNo": 1, "dueDate": 1,
+            "remaining": {"$subtract": [{"$ifNull": ["$amount", 0]}, {"$ifNull": ["$paidAmount", 0]}]},
+            "overdue": {"$lt": ["$dueDate", now]},
+        }},
+        {"$match": {"remaining": {"$gt": 0}}},
+        {"$facet": facets},
+    ]
+
+
+def _money(value):
+    return round(float(value or 0), 2)
+
+
+def _format(result, now, horizon, months):
+    overdue = (result.get('overdue') or [{}])[0]
+    weeks = [{"weekStart": w['_id'], "amount": _money(w['amount']), "installments": w['installments']}
+             for w in result.get('weeks', [])]
+    month_rows = [{"month": m['_id'], "amount": _money(m['amount']), "installments": m['installments']}
+                  for m in result.get('months', [])]
+    report = {
+        "generatedAt": to_iso_string(now),
+        "timezone": FORECAST_TIMEZONE,
+        "months": months,
+        "horizonEnd": to_iso_string(horizon),
+        "overdue": {
+            "amount": _money(overdue.get('amount')),
+            "installments": overdue.get('installments', 0),
+            "plans": overdue.get('plans', 0),
+        },
+        "totalDue": _money(sum(m['amount'] for m in month_rows)),
+        "weekly": weeks,
+        "monthly": month_rows,
+        "customers": [{
+            "customerId": str(c['_id']) if c.get('_id') else None,
+            "customerName": c.get('customerName') or 'N/A',
+            "customerPhone": c.get('customerPhone') or 'N/A',
+            "due": _money(c['due']),
+            "overdue": _money(c['overdue']),
+            "nextDueDate": to_iso_string(c.get('nextDueDate')),
+            "plans": len(c.get('plans', [])),
+        } for c in result.get('customers', [])],
+    }
+    if 'plans' in result:
+        report["plans"] = [{
+            "planId": str(p['_id']),
+            "billNumber": p.get('billNumber'),
+            "due": _money(p['due']),
+            "overdue": _money(p['overdue']),
+            "nextDueDate": to_iso_string(p.get('nextDueDate')),
+            "installments": [{
+                "installmentNo": i.get('installmentNo'),
+                "dueDate": to_iso_string(i.get('dueDate')),
+                "amount": _money(i.get('remaining')),
+                "overdue": i.get('overdue'),
+            } for i in sorted(p.get('installments', []), key=lambda i: i.get('installmentNo') or 0)],
+        } for p in result['plans']]
+    return report
+
+
+def emi_forecast(db, months=FORECAST_DEFAULT_MONTHS, customer_id=None, refresh=False):
+    """Forecast report for the next *months* IST months, optionally for one customer."""
+    key = (months, str(customer_id) if customer_id else None)
+    if not refresh:
+        with _lock:
+            hit = _cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
+
+    now = utc_now()
+    horizon = forecast_horizon(months, now)
+    result = next(db.emi_installments.aggregate(forecast_pipeline(now, horizon, customer_id), allowDiskUse=True), {})
+    report = _format(result, now, horizon, months)
+
+    with _lock:
+        if len(_cache) >= _CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = (time.monotonic() + EMI_FORECAST_CACHE_SECONDS, report)
+    return report
@@ -0,0 +1,190 @@
+"""
+EMI Installments
+Each installment is its own document in `emi_installments` ({planId,
+installmentNo, dueDate, amount, principal, interest, paidAmount, paidDate,
+status}, unique on planId + installmentNo). A payment or status change updates
+one row, and due-date queries run on the (status, dueDate) index. Plans keep
+the plan_summary() counters, so listings never read installments.
+
+Rows also carry the plan's customer and bill number, which lets the forecast
+report aggregate installments without joining plans. Plans written before the
+collection existed hold an embedded `installments` array;
+migrate_embedded_installments() moves those over in batches at startup.
+"""
+
+import logging
+from datetime import timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.emi_schedule import plan_summary
+from utils.tzutils import utc_now
+
+logger = logging.getLogger(__name__)
+
+OPEN_INSTALLMENT_STATUSES = ['pending', 'partial', 'overdue']
+PLAN_ROW_FIELDS = ('customerId', 'customerName', 'customerPhone', 'billNumber')
+# Plan-level copies are only for reports; readers get the installment fields
+INSTALLMENT_PROJECTION = {"planId": 0, "updatedAt": 0, "scheduleLock": 0, **{f: 0 for f in PLAN_ROW_FIELDS}}
+MIGRATION_BATCH_SIZE = 500
+# A prepayment locks the open rows it rebuilds; a lock older than this was left by a failed request
+SCHEDULE_LOCK_SECONDS = 120
+
+
+def installment_rows(plan, installments, now=None):
+    """Documents for *installments* of *plan* (which must already have an _id)."""
+    now = now or utc_now()
+    shared = {"planId": plan['_id'], **{f: plan.get(f) for f in PLAN_ROW_FIELDS}}
+    rows = []
+    for number, installment in enumerate(installments, start=1):
+        row = {k: v for k, v in installment.items() if k != '_id'}
+        row['installmentNo'] = row.get('installmentNo') or number
+        row.setdefault('status', 'pending')
+        row.setdefault('paidAmount', 0)
+        rows.append({**row, **shared, "updatedAt": now})
+    return rows
+
+
+def create_plan(db, plan, installments):
+    """Insert a plan with its summary counters and its installment rows. Returns the plan id."""
+    plan = {k: v for k, v in plan.items() if k != 'installments'}
+    plan.update(plan_summary(installments))
+    plan_id = db.emi_plans.insert_one(plan).inserted_id
+    plan['_id'] = plan_id
+    try:
+        if installments:
+            db.emi_installments.insert_many(installment_rows(plan, installments))
+    except Exception:
+        db.emi_plans.delete_one({"_id": plan_id})
+        db.emi_installments.delete_many({"planId": plan_id})
+        raise
+    return plan_id
+
+
+def load_installments(db, plan_id):
+    return list(db.emi_installments.find({"planId": plan_id}, INSTALLMENT_PROJECTION).sort("installmentNo", 1))
+
+
+def installments_by_plan(db, plan_ids):
+    """{planId: [installments in order]} for many plans in one indexed query."""
+    grouped = {plan_id: [] for plan_id in plan_ids}
+    projection = {k: v for k, v in INSTALLMENT_PROJECTION.items() if k != 'planId'}
+    cursor = db.emi_installments.find({"planId": {"$in": list(plan_ids)}}, projection)
+    for row in cursor.sort([("planId", 1), ("installmentNo", 1)]):
+        grouped.setdefault(row.pop('planId'), []).append(row)
+    return grouped
+
+
+def status_snapshot(installments):
+    return {i['installmentNo']: (i.get('status'), i.get('paidDate'), i.get('paidAmount', 0)) for i in installments}
+
+
+def status_update_ops(installments, snapshot, now=None):
+    """
+    One UpdateOne per stored installment whose status or paid date changed since *snapshot*.
+    Each is guarded on the row's previous status and paid amount, so a payment recorded
+    meanwhile is never overwritten.
+    """
+    now = now or utc_now()
+    ops = []
+    for installment in installments:
+        if '_id' not in installment:
+            continue
+        status, paid_date, paid_amount = snapshot.get(installment['installmentNo'], (None, None, 0))
+        if (installment.get('status'), installment.get('paidDate')) == (status, paid_date):
+            continue
+        ops.append(UpdateOne(
+            {"_id": installment['_id'], "status": status, "paidAmount": paid_amount},
+            {"$set": {"status": installment.get('status'), "paidDate": installment.get('paidDate'), "updatedAt": now}}
+        ))
+    return ops
+
+
+def unlocked_filter(now=None):
+    """Query clause for rows no prepayment is rebuilding; payments only touch these."""
+    now = now or utc_now()
+    return {"$or": [
+        {"scheduleLock": {"$exists": False}},
+        {"scheduleLock.at": {"$lt": now - timedelta(seconds=SCHEDULE_LOCK_SECONDS)}},
+    ]}
+
+
+def lock_open_installments(db, plan_id, installments, token, now=None):
+    """
+    Lock the stored, still unpaid rows of *installments* under *token* before they are rebuilt.
+    Returns False, leaving nothing locked, if any was paid or locked by another request since it was read.
+    """
+    now = now or utc_now()
+    ids = [i['_id'] for i in installments]
+    if not ids:
+        return True
+    result = db.emi_installments.update_many(
+        {"_id": {"$in": ids}, "planId": plan_id, "paidAmount": 0, **unlocked_filter(now)},
+        {"$set": {"scheduleLock": {"token": token, "at": now}}}
+    )
+    if result.modified_count < len(ids):
+        unlock_installments(db, token)
+        return False
+    return True
+
+
+def unlock_installments(db, token):
+    db.emi_installments.update_many({"scheduleLock.token": token}, {"$unset": {"scheduleLock": ""}})
+
+
+def replace_open_installments(db, plan, installments, token):
+    """
+    Swap the rows locked under *token* for the rebuilt schedule in *installments* (the rows without an _id).
+    Stored rows keep their _id.
+    """
+    db.emi_installments.delete_many({"planId": plan['_id'], "scheduleLock.token": token})
+    rebuilt = [i for i in installments if '_id' not in i]
+    if rebuilt:
+        db.emi_installments.insert_many(installment_rows(plan, rebuilt))
+
+
+def delete_plans(db, query):
+    """Delete the plans matching *query* together with their installments."""
+    plan_ids = [p['_id'] for p in db.emi_plans.find(query, {"_id": 1})]
+    if not plan_ids:
+        return 0
+    db.emi_installments.delete_many({"planId": {"$in": plan_ids}})
+    return db.emi_plans.delete_many({"_id": {"$in": plan_ids}}).deleted_count
+
+
+def migrate_embedded_installments(db, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Move embedded `installments` arrays into emi_installments, a batch of plans at a time, and
+    stamp each plan's summary counters. Safe to re-run after an interruption: rows already
+    copied are skipped by the unique (planId, installmentNo) index. Returns the plans migrated.
+    """
+    migrated = 0
+    fields = {"installments": 1, **{f: 1 for f in PLAN_ROW_FIELDS}}
+    while True:
+        plans = list(db.emi_plans.find({"installments": {"$exists": True}}, fields).limit(batch_size))
+        if not plans:
+            break
+        now = utc_now()
+        rows, plan_ops = [], []
+        for plan in plans:
+            installments = plan.get('installments') or []
+            plan_rows = installment_rows(plan, installments, now)
+            rows.extend(plan_rows)
+            # A concurrent migrator may already have stamped this plan and payments may have moved
+            # its counters since; only the copy that still holds the array writes the summary
+            plan_ops.append(UpdateOne(
+                {"_id": plan['_id'], "installments": {"$exists": True}},
+                {"$set": plan_summary(plan_rows), "$unset": {"installments": ""}}
+            ))
+        if rows:
+            try:
+                db.emi_installments.insert_many(rows, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                    raise
+        db.emi_plans.bulk_write(plan_ops, ordered=False)
+        migrated += len(plans)
+    if migrated:
+        logger.info(f"[emi-installments] Moved installments of {migrated} plans into emi_installments")
+    return migrated
@@ -0,0 +1,236 @@
+"""
+EMI Schedule Engine
+Builds installment schedules for EMI plans: flat or reducing-balance interest,
+due dates on the same calendar day each month (clamped to short months, in
+IST), and recomputation of the open installments after a prepayment.
+
+The arithmetic runs on NumPy arrays, one row per plan, so schedule_arrays()
+prices thousands of plans in one pass; build_installments() is the same code
+for a single plan. Amounts are rounded to paise at every step and the last
+installment absorbs the remainder, so principal parts always sum to the
+financed amount.
+"""
+
+import calendar
+import math
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.tzutils import utc_to_ist
+
+INTEREST_FLAT = 'flat'
+INTEREST_REDUCING = 'reducing'
+INTEREST_METHODS = (INTEREST_FLAT, INTEREST_REDUCING)
+
+PREPAY_REDUCE_EMI = 'reduce_emi'
+PREPAY_REDUCE_TENURE = 'reduce_tenure'
+PREPAY_MODES = (PREPAY_REDUCE_EMI, PREPAY_REDUCE_TENURE)
+
+# Payments write 'completed'; older admin approvals wrote 'paid'
+PAID_STATUSES = ('completed', 'paid')
+
+
+def add_months(moment, months):
+    """Same IST calendar day *months* later, clamped to the month's last day (returned in UTC)."""
+    local = utc_to_ist(moment)
+    month_index = local.month - 1 + months
+    year, month = local.year + month_index // 12, month_index % 12 + 1
+    day = min(local.day, calendar.monthrange(year, month)[1])
+    return local.replace(year=year, month=month, day=day).astimezone(timezone.utc)
+
+
+def due_dates(start_date, tenure, first_month=1):
+    return [add_months(start_date, m) for m in range(first_month, first_month + tenure)]
+
+
+def monthly_amounts(principals, annual_rates, tenures, reducing):
+    """Unrounded monthly installment per plan (arrays, or scalars broadcast to arrays)."""
+    principals = np.asarray(principals, dtype=float)
+    rates = np.asarray(annual_rates, dtype=float)
+    tenures = np.asarray(tenures, dtype=float)
+    reducing = np.asarray(reducing, dtype=bool)
+
+    monthly_rate = rates / 1200.0
+    flat = principals * (1 + rates / 100.0 * tenures / 12.0) / tenures
+    growth = np.power(1 + monthly_rate, tenures)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = principals * monthly_rate * growth / (growth - 1)
+    return np.where(reducing & (monthly_rate > 0), annuity, flat)
+
+
+def schedule_arrays(principals, annual_rates, tenures, reducing):
+    """
+    Price many plans at once. Returns (amount, principal, interest) arrays shaped
+    (plans, max tenure); months past a plan's tenure are zero.
+    """
+    principals = np.round(np.asarray(principals, dtype=float), 2)
+    rates = np.asarray(annual_rates, dtype=float)
+    tenures = np.asarray(tenures, dtype=int)
+    reducing = np.asarray(reducing, dtype=bool)
+    if np.any(tenures < 1):
+        raise ValueError('Tenure must be at least one month')
+
+    plans, months = len(principals), int(tenures.max()) if len(tenures) else 0
+    emi = np.round(monthly_amounts(principals, rates, tenures, reducing), 2)
+    # Flat: interest is spread in whole paise rounded down (the last month takes the rest)
+    # and principal makes up the level installment
+    flat_interest_total = np.round(principals * rates / 100.0 * tenures / 12.0, 2)
+    flat_interest_each = np.floor(np.round(flat_interest_total / tenures * 100, 6)) / 100
+    flat_principal_each = np.round(emi - flat_interest_each, 2)
+    monthly_rate = rates / 1200.0
+
+    amount = np.zeros((plans, months))
+    principal = np.zeros((plans, months))
+    interest = np.zeros((plans, months))
+    balance = principals.copy()
+    for k in range(months):
+        active = k < tenures
+        last = k == tenures - 1
+        month_interest = np.where(
+            reducing,
+            np.round(balance * monthly_rate, 2),
+            np.where(last, flat_interest_total - flat_interest_each * (tenures - 1), flat_interest_each),
+        )
+        month_principal = np.where(reducing, emi - month_interest, flat_principal_each)
+        month_principal = np.where(last, balance, np.clip(month_principal, 0, balance))
+
+        month_principal = np.where(active, month_principal, 0)
+        month_interest = np.where(active, np.round(month_interest, 2), 0)
+        principal[:, k] = month_principal
+        interest[:, k] = month_interest
+        amount[:, k] = np.round(month_principal + month_interest, 2)
+        balance = np.round(balance - month_principal, 2)
+    return amount, principal, interest
+
+
+def build_installments(principal, tenure, start_date, annual_rate=0, method=INTEREST_FLAT, first_no=1):
+    """Installment documents for one plan, numbered from *first_no* and due monthly from its start date."""
+    if method not in INTEREST_METHODS:
+        raise ValueError(f"Interest method must be one of: {', '.join(INTEREST_METHODS)}")
+    amount, principal_parts, interest_parts = schedule_arrays(
+        [principal], [annual_rate], [tenure], [method == INTEREST_REDUCING]
+    )
+    dates = due_dates(start_date, tenure, first_month=first_no)
+    return [{
+        "installmentNo": first_no + k,
+        "dueDate": dates[k],
+        "amount": float(amount[0, k]),
+        "principal": float(principal_parts[0, k]),
+        "interest": float(interest_parts[0, k]),
+        "status": "pending",
+        "paidAmount": 0,
+        "paidDate": None,
+    } for k in range(tenure)]
+
+
+def schedule_totals(installments):
+    """Monthly EMI (first installment), total interest and total payable of a schedule."""
+    return {
+        "monthlyEmi": installments[0]['amount'] if installments else 0,
+        "totalInterest": round(sum(i.get('interest', 0) for i in installments), 2),
+        "totalPayable": round(sum(i['amount'] for i in installments), 2),
+    }
+
+
+def tenure_for_amount(principal, annual_rate, emi, method=INTEREST_FLAT):
+    """Months needed to repay *principal* at roughly *emi* per month, or None if *emi* never covers interest."""
+    if principal <= 0:
+        return 0
+    monthly_rate = annual_rate / 1200.0
+    if method == INTEREST_REDUCING and monthly_rate > 0:
+        if emi <= principal * monthly_rate:
+            return None
+        months = -math.log(1 - principal * monthly_rate / emi) / math.log(1 + monthly_rate)
+    else:
+        per_month_principal = emi - principal * monthly_rate
+        if per_month_principal <= 0:
+            return None
+        months = principal / per_month_principal
+    # Tolerate rounding in a previously rounded EMI
+    return max(1, math.ceil(months - 1e-6))
+
+
+def outstanding_principal(installments):
+    """Principal still owed on installments that are not paid (pre-engine plans carry no split)."""
+    return round(sum(
+        float(i.get('principal', i.get('amount', 0)) or 0)
+        for i in installments if i.get('status') not in PAID_STATUSES
+    ), 2)
+
+
+def plan_summary(installments):
+    """
+    Precomputed plan fields for listings: paid, outstanding and overdue totals, installment
+    counters by status and the next due date.
+    """
+    total_paid = outstanding = overdue = 0.0
+    paid_count = partial_count = overdue_count = 0
+    next_due = None
+    for i in installments:
+        amount = float(i.get('amount', 0) or 0)
+        paid = float(i.get('paidAmount', 0) or 0)
+        total_paid += paid
+        if i.get('status') in PAID_STATUSES:
+            paid_count += 1
+            continue
+        outstanding += max(amount - paid, 0)
+        if i.get('status') == 'overdue':
+            overdue_count += 1
+            overdue += max(amount - paid, 0)
+        elif i.get('status') == 'partial':
+            partial_count += 1
+        due = i.get('dueDate')
+        if isinstance(due, datetime):
+            due = due if due.tzinfo else due.replace(tzinfo=timezone.utc)
+            if next_due is None or due < next_due:
+                next_due = due
+    return {
+        "totalPaid": round(total_paid, 2),
+        "outstandingAmount": round(outstanding, 2),
+        "overdueAmount": round(overdue, 2),
+        "installmentCount": len(installments),
+        "paidInstallments": paid_count,
+        "partialInstallments": partial_count,
+        "overdueInstallments": overdue_count,
+        "nextDueDate": next_due,
+    }
+
+
+def recompute_after_prepayment(plan, prepayment, mode=PREPAY_REDUCE_EMI):
+    """
+    New installment list after *prepayment* is applied to the outstanding principal.
+    Completed installments are kept; the open ones are rebuilt from the next installment number,
+    keeping the plan's due-day. reduce_emi keeps the number of months, reduce_tenure keeps the
+    monthly amount. Raises ValueError for an invalid prepayment, a partly paid installment or an
+    open installment before a completed one.
+    """
+    if mode not in PREPAY_MODES:
+        raise ValueError(f"Prepayment mode must be one of: {', '.join(PREPAY_MODES)}")
+    installments = plan.get('installments', [])
+    completed = [i for i in installments if i.get('status') in PAID_STATUSES]
+    remaining = [i for i in installments if i.get('status') not in PAID_STATUSES]
+    if not remaining:
+        raise ValueError('Plan has no open installments')
+    if any(float(i.get('paidAmount', 0) or 0) > 0 for i in remaining):
+        raise ValueError('Settle the partly paid installment before prepaying')
+    first_no = min(i['installmentNo'] for i in remaining)
+    if any(i['installmentNo'] > first_no for i in completed):
+        raise ValueError('Settle the earlier open installments before prepaying')
+
+    outstanding = outstanding_principal(installments)
+    prepayment = round(float(prepayment), 2)
+    if prepayment <= 0 or prepayment > outstanding:
+        raise ValueError(f"Prepayment must be between ₹0.01 and the outstanding ₹{outstanding}")
+
+    left = round(outstanding - prepayment, 2)
+    if left <= 0:
+        return completed
+
+    rate = float(plan.get('interestRate', 0) or 0)
+    method = plan.get('interestMethod', INTEREST_FLAT)
+    tenure = len(remaining)
+    if mode == PREPAY_REDUCE_TENURE:
+        tenure = min(tenure, tenure_for_amount(left, rate, remaining[0]['amount'], method) or tenure)
+
+    return completed + build_installments(left, tenure, plan['startDate'], rate, method, first_no=first_no)
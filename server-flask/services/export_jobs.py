@@ -0,0 +1,324 @@
+"""
+Export Job Queue
+Mongo-backed queue for long-running exports. The web process only enqueues a
+job document; a worker claims it atomically, writes the file into local
+storage and records progress so clients can poll and download when it's done.
+
+Exports are built by `python export_worker.py`, a separate process on the same
+host as the web service (it shares EXPORT_JOB_DIR; render.yaml starts both).
+For single-process development, EXPORT_JOBS_INLINE_WORKER=true runs the worker
+in a background thread of the web process instead; inline workers take a lease
+in `worker_leases` first, so only one web process at a time builds exports.
+"""
+
+import logging
+import os
+import socket
+import tempfile
+import time
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.export_service import (
+    EXPORT_DATASETS, EXPORT_FORMATS, resolve_columns, build_query, write_export, export_filename
+)
+from utils.tzutils import utc_now, to_iso_string
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'inventory-exports'))
+EXPORT_JOB_POLL_SECONDS = int(os.environ.get('EXPORT_JOB_POLL_SECONDS', '5'))
+# A running job whose heartbeat is older than this is assumed dead and re-queued
+EXPORT_JOB_LEASE_SECONDS = int(os.environ.get('EXPORT_JOB_LEASE_SECONDS', '300'))
+EXPORT_JOB_RETENTION_HOURS = int(os.environ.get('EXPORT_JOB_RETENTION_HOURS', '24'))
+EXPORT_JOB_MAX_ATTEMPTS = 3
+# How long an inline worker keeps the export lease without renewing it (renewed every poll)
+EXPORT_WORKER_LEASE_SECONDS = int(os.environ.get('EXPORT_WORKER_LEASE_SECONDS', '900'))
+EXPORT_WORKER_LEASE = 'export-jobs'
+# Source documents processed between progress/heartbeat writes
+EXPORT_JOB_PROGRESS_EVERY = 2000
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_EXPIRED = 'expired'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_export_job(db, params, user):
+    """
+    Validate export params and insert a queued job.
+    params: {dataset, format, columns, startDate, endDate}. Raises ValueError on bad input.
+    """
+    dataset = params.get('dataset')
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"dataset must be one of: {', '.join(EXPORT_DATASETS)}")
+    fmt = (params.get('format') or 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    columns = params.get('columns') or []
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(',') if c.strip()]
+    resolve_columns(dataset, columns)
+    try:
+        build_query(dataset, params.get('startDate'), params.get('endDate'))
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+
+    now = utc_now()
+    job = {
+        "dataset": dataset,
+        "format": fmt,
+        "columns": columns,
+        "startDate": params.get('startDate'),
+        "endDate": params.get('endDate'),
+        "status": JOB_QUEUED,
+        "progress": {"processed": 0, "total": None},
+        "attempts": 0,
+        "createdBy": user.get('userId'),
+        "createdByUsername": user.get('username'),
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    result = db.export_jobs.insert_one(job)
+    job['_id'] = result.inserted_id
+    return job
+
+
+def claim_next_job(db, worker=None):
+    """Atomically take the oldest queued job (or one whose worker stopped heartbeating)."""
+    now = utc_now()
+    stale_before = now - timedelta(seconds=EXPORT_JOB_LEASE_SECONDS)
+    return db.export_jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": JOB_QUEUED},
+                {"status": JOB_RUNNING, "heartbeatAt": {"$lt": stale_before}},
+            ],
+            "attempts": {"$lt": EXPORT_JOB_MAX_ATTEMPTS},
+        },
+        {
+            "$set": {
+                "status": JOB_RUNNING,
+                "workerId": worker or worker_id(),
+                # Identifies this attempt; a reclaimed job gets a new one
+                "claimToken": ObjectId(),
+                "startedAt": now,
+                "heartbeatAt": now,
+                "updatedAt": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("createdAt", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def artifact_path(job):
+    """File for one attempt at *job*; a reclaimed job never writes over the previous attempt's file."""
+    return os.path.join(EXPORT_JOB_DIR, f"{job['_id']}-{job['claimToken']}.{EXPORT_FORMATS[job['format']]['extension']}")
+
+
+def run_export_job(db, job):
+    """Build the artifact for a claimed job, reporting progress as it goes."""
+    job_id = job['_id']
+    attempt = {"_id": job_id, "claimToken": job['claimToken']}
+    dataset = job['dataset']
+    columns = resolve_columns(dataset, job.get('columns'))
+    query = build_query(dataset, job.get('startDate'), job.get('endDate'))
+    collection = EXPORT_DATASETS[dataset]['collection']
+    total = db[collection].count_documents(query)
+    db.export_jobs.update_one({"_id": job_id}, {"$set": {"progress.total": total}})
+
+    processed = 0
+
+    def on_document():
+        nonlocal processed
+        processed += 1
+        if processed % EXPORT_JOB_PROGRESS_EVERY == 0:
+            now = utc_now()
+            current = db.export_jobs.find_one_and_update(
+                attempt,
+                {"$set": {"progress.processed": processed, "heartbeatAt": now, "updatedAt": now}},
+                projection={"cancelRequested": 1},
+            )
+            # Cancelled, or our lease lapsed and another worker took the job over
+            if not current or current.get('cancelRequested'):
+                raise JobCancelled()
+
+    os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+    path = artifact_path(job)
+    part_path = f"{path}.part"
+    try:
+        with open(part_path, 'wb') as out:
+            write_export(dataset, job['format'], query, columns, out, on_document)
+        os.replace(part_path, path)
+    except BaseException:
+        _remove_quietly(part_path)
+        raise
+
+    now = utc_now()
+    result = db.export_jobs.update_one(
+        {**attempt, "status": JOB_RUNNING},
+        {"$set": {
+            "status": JOB_DONE,
+            "progress": {"processed": processed, "total": total},
+            "artifact": {
+                "path": path,
+                "filename": export_filename(dataset, job['format'], now.strftime('%Y%m%d_%H%M%S')),
+                "size": os.path.getsize(path),
+                "mimetype": EXPORT_FORMATS[job['format']]['mimetype'],
+            },
+            "finishedAt": now,
+            "expiresAt": now + timedelta(hours=EXPORT_JOB_RETENTION_HOURS),
+            "updatedAt": now,
+        }}
+    )
+    if not result.matched_count:
+        # Another attempt owns the job now; its own file is the artifact
+        _remove_quietly(path)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def process_next_job(db, worker=None):
+    """Claim and run one job. Returns True if a job was processed."""
+    job = claim_next_job(db, worker)
+    if not job:
+        return False
+
+    logger.info(f"[export-jobs] Running job {job['_id']} ({job['dataset']} as {job['format']})")
+    try:
+        run_export_job(db, job)
+        logger.info(f"[export-jobs] Job {job['_id']} finished")
+    except JobCancelled:
+        db.export_jobs.update_one(
+            {"_id": job['_id'], "claimToken": job['claimToken'], "status": JOB_RUNNING},
+            {"$set": {"status": JOB_CANCELLED, "finishedAt": utc_now(), "updatedAt": utc_now()}}
+        )
+        logger.info(f"[export-jobs] Job {job['_id']} cancelled")
+    except Exception as e:
+        logger.error(f"[export-jobs] Job {job['_id']} failed: {e}", exc_info=True)
+        db.export_jobs.update_one(
+            {"_id": job['_id'], "claimToken": job['claimToken'], "status": JOB_RUNNING},
+            {"$set": {"status": JOB_FAILED, "error": str(e), "finishedAt": utc_now(), "updatedAt": utc_now()}}
+        )
+    return True
+
+
+def cleanup_expired_jobs(db):
+    """
+    Delete artifacts past their retention window and mark the jobs expired.
+    Also fails jobs whose worker died on the last allowed attempt.
+    """
+    now = utc_now()
+    stale_before = now - timedelta(seconds=EXPORT_JOB_LEASE_SECONDS)
+    db.export_jobs.update_many(
+        {"status": JOB_RUNNING, "heartbeatAt": {"$lt": stale_before}, "attempts": {"$gte": EXPORT_JOB_MAX_ATTEMPTS}},
+        {"$set": {"status": JOB_FAILED, "error": "Worker stopped responding", "finishedAt": now, "updatedAt": now}}
+    )
+
+    expired = 0
+    for job in db.export_jobs.find({"status": JOB_DONE, "expiresAt": {"$lt": now}}, {"artifact": 1}):
+        path = (job.get('artifact') or {}).get('path')
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"[export-jobs] Could not remove artifact {path}: {e}")
+                continue
+        db.export_jobs.update_one({"_id": job['_id']}, {"$set": {"status": JOB_EXPIRED, "updatedAt": now}})
+        expired += 1
+    return expired
+
+
+def take_worker_lease(db, worker, now=None):
+    """Take or renew the inline export worker lease. Returns True while *worker* holds it."""
+    now = now or utc_now()
+    try:
+        return db.worker_leases.find_one_and_update(
+            {"_id": EXPORT_WORKER_LEASE, "$or": [{"leasedBy": worker}, {"leaseUntil": {"$lt": now}}]},
+            {"$set": {"leasedBy": worker, "leaseUntil": now + timedelta(seconds=EXPORT_WORKER_LEASE_SECONDS)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        ) is not None
+    except DuplicateKeyError:
+        # Held by another process
+        return False
+
+
+def run_worker(db, poll_seconds=EXPORT_JOB_POLL_SECONDS, stop_event=None, leased=False):
+    """
+    Worker loop: drain the queue, then poll. Expired artifacts are swept between polls.
+    With *leased* (the inline worker) jobs are only run while this process holds the export lease.
+    """
+    worker = worker_id()
+    logger.info(f"[export-jobs] Worker {worker} started (poll: {poll_seconds}s, dir: {EXPORT_JOB_DIR})")
+    while stop_event is None or not stop_event.is_set():
+        try:
+            if leased and not take_worker_lease(db, worker):
+                time.sleep(poll_seconds)
+                continue
+            while process_next_job(db, worker):
+                if leased:
+                    take_worker_lease(db, worker)
+            cleanup_expired_jobs(db)
+        except Exception as e:
+            logger.error(f"[export-jobs] Worker loop error: {e}", exc_info=True)
+        time.sleep(poll_seconds)
+
+
+def serialize_job(job):
+    artifact = job.get('artifact') or {}
+    progress = job.get('progress') or {}
+    total = progress.get('total')
+    processed = progress.get('processed', 0)
+    return {
+        "id": str(job['_id']),
+        "dataset": job.get('dataset'),
+        "format": job.get('format'),
+        "columns": job.get('columns') or [],
+        "startDate": job.get('startDate'),
+        "endDate": job.get('endDate'),
+        "status": job.get('status'),
+        "progress": {
+            "processed": processed,
+            "total": total,
+            "percent": round(processed * 100.0 / total, 1) if total else (100.0 if job.get('status') == JOB_DONE else 0.0),
+        },
+        "error": job.get('error'),
+        "fileName": artifact.get('filename'),
+        "fileSize": artifact.get('size'),
+        "downloadUrl": f"/api/exports/jobs/{job['_id']}/download" if job.get('status') == JOB_DONE else None,
+        "createdBy": job.get('createdByUsername'),
+        "createdAt": to_iso_string(job.get('createdAt')),
+        "startedAt": to_iso_string(job.get('startedAt')),
+        "finishedAt": to_iso_string(job.get('finishedAt')),
+        "expiresAt": to_iso_string(job.get('expiresAt')),
+    }
+
+
+def get_job(db, job_id):
+    if not ObjectId.is_valid(str(job_id)):
+        return None
+    return db.export_jobs.find_one({"_id": ObjectId(str(job_id))})
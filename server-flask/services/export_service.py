@@ -0,0 +1,336 @@
+"""
+Export Service
+Dataset definitions and writers (CSV, XLSX, Parquet) for tabular exports.
+Rows are always read from batched, projected cursors so memory stays flat
+regardless of how many documents an export covers.
+"""
+
+import csv
+import io
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Documents fetched per cursor round trip, and CSV rows buffered before a chunk is sent
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_FLUSH_ROWS = 500
+# Rows converted to a DataFrame / Parquet row group at a time
+EXPORT_COLUMNAR_CHUNK_ROWS = int(os.environ.get('EXPORT_COLUMNAR_CHUNK_ROWS', '50000'))
+EXPORT_STREAM_CHUNK = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': {'mimetype': 'text/csv', 'extension': 'csv'},
+    'xlsx': {'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'extension': 'xlsx'},
+    'parquet': {'mimetype': 'application/vnd.apache.parquet', 'extension': 'parquet'},
+}
+
+# key: name accepted by ?columns=, header: CSV/XLSX header, field: source field for the projection,
+# kind: str | int | float | datetime (drives typed formats), value: typed value from the row,
+# csv: optional formatter applied to the value in CSV output only
+ExportColumn = namedtuple('ExportColumn', 'key header field kind value csv')
+
+
+def _col(key, header, field, kind, value, csv=None):
+    return ExportColumn(key, header, field, kind, value, csv)
+
+
+def _date_str(value, fmt='%Y-%m-%d'):
+    return value.strftime(fmt) if isinstance(value, datetime) else str(value)
+
+
+def _money(value):
+    return round(value or 0, 2)
+
+
+def _line(row):
+    return row.get('_line') or {}
+
+
+_INVOICE_HEADER_COLUMNS = [
+    _col('billNumber', 'Invoice No', 'billNumber', 'str', lambda b: b.get('billNumber', 'N/A')),
+    _col('billDate', 'Date', 'billDate', 'datetime', lambda b: b.get('billDate'),
+         lambda v: _date_str(v, '%Y-%m-%d %H:%M')),
+    _col('customerName', 'Customer Name', 'customerName', 'str', lambda b: b.get('customerName', 'Walk-in')),
+]
+
+EXPORT_DATASETS = {
+    'products': {
+        'collection': 'products',
+        'sort': [("name", 1)],
+        'date_field': None,
+        'filename': 'products_export',
+        'columns': [
+            _col('name', 'Product Name', 'name', 'str', lambda p: p.get('name', 'N/A')),
+            _col('category', 'Category', 'category', 'str', lambda p: p.get('category', 'General')),
+            _col('price', 'Price (Inclusive)', 'price', 'float', lambda p: p.get('price', 0)),
+            _col('costPrice', 'Cost Price', 'costPrice', 'float', lambda p: p.get('costPrice', 0)),
+            _col('quantity', 'Stock Quantity', 'quantity', 'int', lambda p: p.get('quantity', 0)),
+            _col('hsnCode', 'HSN/SKU', 'hsnCode', 'str', lambda p: p.get('hsnCode', 'N/A')),
+            _col('status', 'Status', 'quantity', 'str',
+                 lambda p: 'In Stock' if (p.get('quantity') or 0) > 0 else 'Out of Stock'),
+        ],
+    },
+    'customers': {
+        'collection': 'customers',
+        'sort': [("name", 1)],
+        'date_field': None,
+        'filename': 'customers_export',
+        'columns': [
+            _col('name', 'Name', 'name', 'str', lambda c: c.get('name', 'N/A')),
+            _col('phone', 'Phone', 'phone', 'str', lambda c: c.get('phone', 'N/A')),
+            _col('email', 'Email', 'email', 'str', lambda c: c.get('email', 'N/A')),
+            _col('address', 'Address', 'address', 'str', lambda c: c.get('address', 'N/A')),
+            _col('place', 'Place', 'place', 'str', lambda c: c.get('place', 'N/A')),
+            _col('city', 'City', 'city', 'str', lambda c: c.get('city', 'N/A')),
+            _col('gstin', 'GSTIN', 'gstin', 'str', lambda c: c.get('gstin', 'N/A')),
+            _col('createdAt', 'Member Since', 'createdAt', 'datetime',
+                 lambda c: c['createdAt'] if isinstance(c.get('createdAt'), datetime) else None,
+                 lambda v: _date_str(v) if v else 'N/A'),
+        ],
+    },
+    'invoices': {
+        'collection': 'bills',
+        'sort': [("billDate", -1)],
+        'date_field': 'billDate',
+        'filename': 'invoices_export',
+        'columns': _INVOICE_HEADER_COLUMNS + [
+            _col('subtotal', 'Subtotal', 'subtotal', 'float', lambda b: _money(b.get('subtotal'))),
+            _col('gstAmount', 'Tax (GST)', 'gstAmount', 'float', lambda b: _money(b.get('gstAmount'))),
+            _col('grandTotal', 'Grand Total', 'grandTotal', 'float', lambda b: _money(b.get('grandTotal'))),
+            _col('totalProfit', 'Profit', 'totalProfit', 'float', lambda b: _money(b.get('totalProfit'))),
+            _col('paymentMode', 'Payment Mode', 'paymentMode', 'str', lambda b: b.get('paymentMode', 'cash')),
+        ],
+    },
+    # Invoices flattened to one row per line item (?level=line on the invoices export)
+    'invoice_lines': {
+        'collection': 'bills',
+        'sort': [("billDate", -1)],
+        'date_field': 'billDate',
+        'filename': 'invoice_lines_export',
+        'explode': 'items',
+        'columns': _INVOICE_HEADER_COLUMNS + [
+            _col('paymentMode', 'Payment Mode', 'paymentMode', 'str', lambda b: b.get('paymentMode', 'cash')),
+            _col('productId', 'Product ID', 'items', 'str',
+                 lambda r: str(_line(r)['productId']) if _line(r).get('productId') else None),
+            _col('productName', 'Product Name', 'items', 'str', lambda r: _line(r).get('productName', 'N/A')),
+            _col('hsnCode', 'HSN', 'items', 'str', lambda r: _line(r).get('hsnCode', 'N/A')),
+            _col('quantity', 'Quantity', 'items', 'int', lambda r: _line(r).get('quantity', 0)),
+            _col('unitPrice', 'Unit Price', 'items', 'float', lambda r: _money(_line(r).get('unitPrice'))),
+            _col('gstPercent', 'GST %', 'items', 'float', lambda r: _line(r).get('gstPercent', 0)),
+            _col('lineSubtotal', 'Line Total', 'items', 'float', lambda r: _money(_line(r).get('lineSubtotal'))),
+            _col('lineGstAmount', 'Line GST', 'items', 'float', lambda r: _money(_line(r).get('lineGstAmount'))),
+            _col('lineProfit', 'Line Profit', 'items', 'float', lambda r: _money(_line(r).get('lineProfit'))),
+        ],
+    },
+    'expenses': {
+        'collection': 'expenses',
+        'sort': [("date", -1)],
+        'date_field': 'date',
+        'filename': 'expenses_export',
+        'columns': [
+            _col('date', 'Date', 'date', 'datetime', lambda e: e.get('date'), _date_str),
+            _col('description', 'Description', 'description', 'str', lambda e: e.get('description', 'N/A')),
+            _col('category', 'Category', 'category', 'str', lambda e: e.get('category', 'General')),
+            _col('amount', 'Amount', 'amount', 'float', lambda e: _money(e.get('amount'))),
+            _col('mode', 'Mode', 'mode', 'str', lambda e: e.get('mode', 'cash')),
+        ],
+    },
+    'returns': {
+        'collection': 'returns',
+        'sort': [("returnDate", -1)],
+        'date_field': 'returnDate',
+        'filename': 'returns_export',
+        'columns': [
+            _col('id', 'Return ID', '_id', 'str', lambda r: str(r.get('_id'))),
+            _col('returnDate', 'Date', 'returnDate', 'datetime', lambda r: r.get('returnDate'), _date_str),
+            _col('billNumber', 'Invoice No', 'billNumber', 'str', lambda r: r.get('billNumber', 'N/A')),
+            _col('productName', 'Product Name', 'productName', 'str', lambda r: r.get('productName', 'N/A')),
+            _col('quantity', 'Quantity', 'quantity', 'int', lambda r: r.get('quantity', 0)),
+            _col('refundAmount', 'Refund Amount', 'refundAmount', 'float', lambda r: _money(r.get('refundAmount'))),
+            _col('reason', 'Reason', 'reason', 'str', lambda r: r.get('reason', 'N/A')),
+        ],
+    },
+}
+
+
+# ==================== QUERY / CURSOR ====================
+
+def resolve_columns(dataset_name, keys=None):
+    """Columns for a dataset, optionally narrowed (and ordered) by a list of column keys."""
+    columns = EXPORT_DATASETS[dataset_name]['columns']
+    if not keys:
+        return list(columns)
+    by_key = {column.key: column for column in columns}
+    unknown = [key for key in keys if key not in by_key]
+    if unknown:
+        raise ValueError(
+            f"Unknown column(s): {', '.join(unknown)}. Available: {', '.join(by_key)}"
+        )
+    return [by_key[key] for key in keys]
+
+
+def date_range_query(field, start_date, end_date):
+    """Build a {field: {$gte, $lte}} filter from YYYY-MM-DD strings (end date is inclusive)."""
+    query = {}
+    if start_date or end_date:
+        query[field] = {}
+        if start_date:
+            query[field]['$gte'] = datetime.strptime(start_date, '%Y-%m-%d')
+        if end_date:
+            query[field]['$lte'] = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    return query
+
+
+def build_query(dataset_name, start_date=None, end_date=None):
+    field = EXPORT_DATASETS[dataset_name]['date_field']
+    return date_range_query(field, start_date, end_date) if field else {}
+
+
+def iter_rows(dataset_name, query, columns, on_document=None):
+    """Yield export rows from a batched cursor that only fetches the fields the columns read.
+
+    *on_document*, if given, is called once per source document (used for job progress).
+    """
+    dataset = EXPORT_DATASETS[dataset_name]
+    projection = {column.field: 1 for column in columns}
+    projection.setdefault('_id', 0)
+
+    db = get_db()
+    cursor = db[dataset['collection']].find(query, projection).sort(dataset['sort']).batch_size(EXPORT_BATCH_SIZE)
+    explode = dataset.get('explode')
+    try:
+        for doc in cursor:
+            if on_document:
+                on_document()
+            if not explode:
+                yield doc
+                continue
+            for line in doc.get(explode) or []:
+                yield {**doc, '_line': line}
+    finally:
+        cursor.close()
+
+
+# ==================== WRITERS ====================
+
+def iter_csv(rows, columns):
+    """Yield UTF-8 CSV chunks of at most EXPORT_FLUSH_ROWS rows; only one chunk is ever buffered."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.header for column in columns])
+    formatters = [(column.value, column.csv) for column in columns]
+    pending = 0
+    for row in rows:
+        writer.writerow([fmt(value(row)) if fmt else value(row) for value, fmt in formatters])
+        pending += 1
+        if pending >= EXPORT_FLUSH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_xlsx(rows, columns, out):
+    """Write rows to *out* with a write-only workbook (rows are flushed to disk, not kept)."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Export')
+    sheet.append([column.header for column in columns])
+    for row in rows:
+        values = []
+        for column in columns:
+            value = column.value(row)
+            if isinstance(value, datetime) and value.tzinfo is not None:
+                value = value.replace(tzinfo=None)
+            values.append(value)
+        sheet.append(values)
+    workbook.save(out)
+
+
+def _parquet_schema(columns):
+    import pyarrow as pa
+
+    types = {
+        'str': pa.string(),
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'datetime': pa.timestamp('ms', tz='UTC'),
+    }
+    return pa.schema([(column.key, types[column.kind]) for column in columns])
+
+
+def _columnar_frame(chunk, columns):
+    """Typed DataFrame for one chunk of rows; unparseable values become nulls instead of failing."""
+    import pandas as pd
+
+    frame = pd.DataFrame(index=range(len(chunk)))
+    for column in columns:
+        values = [column.value(row) for row in chunk]
+        if column.kind == 'str':
+            frame[column.key] = pd.Series([None if v is None else str(v) for v in values], dtype=object)
+            continue
+        series = pd.Series(values, dtype=object)
+        if column.kind == 'float':
+            frame[column.key] = pd.to_numeric(series, errors='coerce').astype('float64')
+        elif column.kind == 'int':
+            frame[column.key] = pd.to_numeric(series, errors='coerce').round().astype('Int64')
+        else:
+            frame[column.key] = pd.to_datetime(series, errors='coerce', utc=True)
+    return frame
+
+
+def write_parquet(rows, columns, out):
+    """Write rows to *out* as Parquet, one row group per EXPORT_COLUMNAR_CHUNK_ROWS rows."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(columns)
+    with pq.ParquetWriter(out, schema, compression='snappy') as writer:
+        chunk = []
+        wrote = False
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= EXPORT_COLUMNAR_CHUNK_ROWS:
+                writer.write_table(pa.Table.from_pandas(_columnar_frame(chunk, columns), schema=schema, preserve_index=False))
+                chunk = []
+                wrote = True
+        if chunk or not wrote:
+            writer.write_table(pa.Table.from_pandas(_columnar_frame(chunk, columns), schema=schema, preserve_index=False))
+
+
+def write_export(dataset_name, fmt, query, columns, out, on_document=None):
+    """Render a complete export in *fmt* to the binary file object *out*."""
+    rows = iter_rows(dataset_name, query, columns, on_document)
+    if fmt == 'csv':
+        for chunk in iter_csv(rows, columns):
+            out.write(chunk)
+    elif fmt == 'xlsx':
+        write_xlsx(rows, columns, out)
+    elif fmt == 'parquet':
+        write_parquet(rows, columns, out)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def iter_file(fh, close=True):
+    """Yield a file object's contents in EXPORT_STREAM_CHUNK pieces."""
+    try:
+        while True:
+            chunk = fh.read(EXPORT_STREAM_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if close:
+            fh.close()
+
+
+def export_filename(dataset_name, fmt, stamp):
+    return f"{EXPORT_DATASETS[dataset_name]['filename']}_{stamp}.{EXPORT_FORMATS[fmt]['extension']}"
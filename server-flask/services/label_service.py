@@ -0,0 +1,90 @@
+"""
+Label Sheet Service
+Lays out product barcode labels N-up on A4 sheets in a single ReportLab pass.
+Barcode images come from the barcode_service LRU cache, and ReportLab embeds
+each distinct image once per document no matter how many labels repeat it.
+"""
+
+import io
+
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas as rl_canvas
+
+from services import pdf_layout as layout
+from services.barcode_service import render_barcode
+
+
+def _label_barcode(value, cache):
+    """ImageReader for a barcode value, shared by every label in this document."""
+    reader = cache.get(value)
+    if reader is None:
+        png = render_barcode(value, fmt='png', module_width=2, height=60, show_text=True)
+        reader = ImageReader(io.BytesIO(png))
+        cache[value] = reader
+    return reader
+
+
+def draw_label(c, label: dict, x: float, y: float, width: float, height: float, show_price: bool, barcode_cache: dict) -> None:
+    """Draw one label with its bottom-left corner at (x, y)."""
+    pad = layout.LABEL_PADDING
+
+    c.setStrokeColor(layout.LABEL_BORDER)
+    c.setLineWidth(0.3)
+    c.rect(x, y, width, height, fill=0, stroke=1)
+
+    name = str(label.get('name') or '')
+    max_name = layout.LABEL_NAME_MAX
+    display_name = name if len(name) <= max_name else name[:max_name - 1] + '…'
+    c.setFillColor(layout.LABEL_NAME_TEXT)
+    c.setFont("Helvetica-Bold", 7.5)
+    c.drawString(x + pad, y + height - pad - 7, display_name)
+
+    text_band = 9
+    if show_price and label.get('price') is not None:
+        c.setFont("Helvetica-Bold", 9)
+        c.setFillColor(layout.LABEL_PRICE_TEXT)
+        c.drawRightString(x + width - pad, y + height - pad - 18, f"Rs. {float(label['price']):.2f}")
+        text_band = 20
+
+    barcode_value = label.get('barcode')
+    if not barcode_value:
+        return
+
+    image = _label_barcode(barcode_value, barcode_cache)
+    img_w, img_h = image.getSize()
+    box_w = width - 2 * pad
+    box_h = height - 2 * pad - text_band - 1 * mm
+    scale = min(box_w / img_w, box_h / img_h)
+    draw_w, draw_h = img_w * scale, img_h * scale
+    c.drawImage(image, x + (width - draw_w) / 2, y + pad, width=draw_w, height=draw_h)
+
+
+def build_label_sheet_pdf(labels: list, columns: int = layout.LABEL_DEFAULT_COLUMNS,
+                          rows: int = layout.LABEL_DEFAULT_ROWS, show_price: bool = True) -> io.BytesIO:
+    """Render *labels* (one dict per physical label) onto A4 sheets and return a BytesIO buffer.
+
+    Labels fill left to right, top to bottom; a new page starts every columns × rows labels.
+    """
+    buffer = io.BytesIO()
+    c = rl_canvas.Canvas(buffer, pagesize=(layout.LABEL_PAGE_W, layout.LABEL_PAGE_H))
+    c.setTitle("Product Labels")
+
+    margin = layout.LABEL_SHEET_MARGIN
+    label_w = (layout.LABEL_PAGE_W - 2 * margin) / columns
+    label_h = (layout.LABEL_PAGE_H - 2 * margin) / rows
+    per_page = columns * rows
+    barcode_cache = {}
+
+    for index, label in enumerate(labels):
+        slot = index % per_page
+        if index and slot == 0:
+            c.showPage()
+        col, row = slot % columns, slot // columns
+        x = margin + col * label_w
+        y = layout.LABEL_PAGE_H - margin - (row + 1) * label_h
+        draw_label(c, label, x, y, label_w, label_h, show_price, barcode_cache)
+
+    c.save()
+    buffer.seek(0)
+    return buffer
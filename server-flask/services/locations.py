@@ -0,0 +1,244 @@
+"""
+Stock Locations
+Per-location stock lives in `stock_levels` ({productId, locationId, quantity},
+unique on the pair). `products.quantity` remains the total across locations and
+is updated in the same bulk calls, so the POS still reads one number per product
+and adding stores never adds work to a checkout. Per-location availability comes
+from an aggregation over the (productId, locationId) index.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from utils.tzutils import utc_now, to_iso_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATION_CODE = 'MAIN'
+LOCATION_TYPES = ('store', 'warehouse')
+
+OPENING_BATCH_SIZE = 1000
+# A worker that claimed products to open and has not finished after this long is presumed dead
+OPENING_CLAIM_SECONDS = 600
+
+_default_lock = threading.Lock()
+_default_location_id = None
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        super().__init__('Insufficient stock')
+        self.shortages = shortages
+
+
+def ensure_default_location(db):
+    """Create the main store on first run; everything that predates locations lives there."""
+    now = utc_now()
+    db.locations.update_one(
+        {"code": DEFAULT_LOCATION_CODE},
+        {"$setOnInsert": {
+            "code": DEFAULT_LOCATION_CODE,
+            "name": "Main Store",
+            "type": "store",
+            "isDefault": True,
+            "active": True,
+            "createdAt": now,
+            "updatedAt": now,
+        }},
+        upsert=True,
+    )
+
+
+def default_location_id(db):
+    global _default_location_id
+    if _default_location_id is None:
+        with _default_lock:
+            if _default_location_id is None:
+                location = db.locations.find_one({"isDefault": True}, {"_id": 1})
+                if not location:
+                    ensure_default_location(db)
+                    location = db.locations.find_one({"isDefault": True}, {"_id": 1})
+                _default_location_id = location['_id']
+    return _default_location_id
+
+
+def resolve_location(db, value):
+    """
+    Location _id for an id or code from a request; the default location when *value* is empty.
+    Raises ValueError for unknown or inactive locations.
+    """
+    if value in (None, ''):
+        return default_location_id(db)
+    query = {"_id": ObjectId(str(value))} if ObjectId.is_valid(str(value)) else {"code": str(value).upper()}
+    location = db.locations.find_one(query, {"active": 1})
+    if not location or not location.get('active', True):
+        raise ValueError(f"Unknown location: {value}")
+    return location['_id']
+
+
+def adjust_stock_levels(db, changes, location_id, now=None):
+    """$inc (product, location) levels for already-merged (product ObjectId, delta) pairs."""
+    if not changes:
+        return
+    now = now or utc_now()
+    db.stock_levels.bulk_write([
+        UpdateOne(
+            {"productId": product_id, "locationId": location_id},
+            {"$inc": {"quantity": delta}, "$set": {"updatedAt": now}},
+            upsert=True,
+        )
+        for product_id, delta in changes
+    ], ordered=False)
+
+
+def set_stock_level(db, product_id, location_id, quantity):
+    """Set one location's level; returns the previous level (0 if none)."""
+    before = db.stock_levels.find_one_and_update(
+        {"productId": product_id, "locationId": location_id},
+        {"$set": {"quantity": quantity, "updatedAt": utc_now()}},
+        projection={"quantity": 1},
+        upsert=True,
+    )
+    return float(before.get('quantity', 0) or 0) if before else 0.0
+
+
+def open_stock_levels(db, batch_size=OPENING_BATCH_SIZE):
+    """
+    Put stock of products that predate locations into the default location, less anything already
+    recorded at a location, so the levels sum to the product total. New products are opened on creation.
+
+    Every worker runs this at startup, so each chunk is first claimed with a `stockLevelsOpeningBy`
+    token and only the claimed products are incremented. A claim older than OPENING_CLAIM_SECONDS
+    (its worker died) is taken over; the levels are re-read after claiming, so finishing an
+    interrupted chunk adds only what is still missing.
+    """
+    location_id = default_location_id(db)
+    token = ObjectId()
+    opened = 0
+    while True:
+        now = utc_now()
+        claimable = {
+            "stockLevelsOpenedAt": {"$exists": False},
+            "$or": [
+                {"stockLevelsOpeningBy": {"$exists": False}},
+                {"stockLevelsOpeningAt": {"$lt": now - timedelta(seconds=OPENING_CLAIM_SECONDS)}},
+            ],
+        }
+        candidates = [p['_id'] for p in db.products.find(claimable, {"_id": 1}).limit(batch_size)]
+        if not candidates:
+            break
+        db.products.update_many(
+            {"_id": {"$in": candidates}, **claimable},
+            {"$set": {"stockLevelsOpeningBy": token, "stockLevelsOpeningAt": now}},
+        )
+        chunk = list(db.products.find({"_id": {"$in": candidates}, "stockLevelsOpeningBy": token}, {"quantity": 1}))
+        if not chunk:
+            continue
+        ids = [p['_id'] for p in chunk]
+        existing = {product_id: levels['total'] for product_id, levels in availability(db, ids).items()}
+        changes = []
+        for product in chunk:
+            try:
+                quantity = float(product.get('quantity', 0) or 0)
+            except (TypeError, ValueError):
+                quantity = 0.0
+            changes.append((product['_id'], quantity - existing.get(product['_id'], 0)))
+        adjust_stock_levels(db, changes, location_id)
+        db.products.update_many(
+            {"_id": {"$in": ids}, "stockLevelsOpeningBy": token},
+            {"$set": {"stockLevelsOpenedAt": utc_now()}, "$unset": {"stockLevelsOpeningBy": "", "stockLevelsOpeningAt": ""}},
+        )
+        opened += len(chunk)
+    if opened:
+        logger.info(f"[locations] Opened default-location stock for {opened} products")
+    return opened
+
+
+def availability(db, product_ids, location_ids=None):
+    """
+    {productId: {"total": n, "locations": {locationId: quantity}}} for the given products.
+    One aggregation over the (productId, locationId) index however many locations exist.
+    """
+    match = {"productId": {"$in": list(product_ids)}}
+    if location_ids:
+        match["locationId"] = {"$in": list(location_ids)}
+    result = {}
+    for row in db.stock_levels.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$productId",
+            "total": {"$sum": "$quantity"},
+            "locations": {"$push": {"locationId": "$locationId", "quantity": "$quantity"}},
+        }},
+    ]):
+        result[row['_id']] = {
+            "total": row['total'],
+            "locations": {loc['locationId']: loc['quantity'] for loc in row['locations']},
+        }
+    return result
+
+
+def transfer_stock(db, transfer_id, from_location, to_location, items):
+    """
+    Move stock between locations. Each source level is decremented only if it holds enough, and the
+    decremented levels are tagged with *transfer_id*; if any line falls short the tagged levels are put
+    back and InsufficientStock is raised, so a transfer applies completely or not at all.
+    Product totals do not change. *items* are merged (product ObjectId, quantity > 0) pairs.
+    """
+    now = utc_now()
+    result = db.stock_levels.bulk_write([
+        UpdateOne(
+            {"productId": product_id, "locationId": from_location, "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity}, "$set": {"updatedAt": now}, "$addToSet": {"pendingTransfers": transfer_id}},
+        )
+        for product_id, quantity in items
+    ], ordered=False)
+
+    if result.modified_count < len(items):
+        taken = {
+            level['productId'] for level in db.stock_levels.find(
+                {"locationId": from_location, "pendingTransfers": transfer_id}, {"productId": 1}
+            )
+        }
+        rollback = [(product_id, quantity) for product_id, quantity in items if product_id in taken]
+        if rollback:
+            db.stock_levels.bulk_write([
+                UpdateOne(
+                    {"productId": product_id, "locationId": from_location, "pendingTransfers": transfer_id},
+                    {"$inc": {"quantity": quantity}, "$pull": {"pendingTransfers": transfer_id}},
+                )
+                for product_id, quantity in rollback
+            ], ordered=False)
+        levels = {
+            level['productId']: level.get('quantity', 0) for level in db.stock_levels.find(
+                {"locationId": from_location, "productId": {"$in": [pid for pid, _ in items]}},
+                {"productId": 1, "quantity": 1},
+            )
+        }
+        raise InsufficientStock([
+            {"productId": str(product_id), "requested": quantity, "available": levels.get(product_id, 0)}
+            for product_id, quantity in items if product_id not in taken
+        ])
+
+    adjust_stock_levels(db, items, to_location, now)
+    db.stock_levels.update_many(
+        {"locationId": from_location, "pendingTransfers": transfer_id}, {"$pull": {"pendingTransfers": transfer_id}}
+    )
+
+
+def serialize_location(location):
+    return {
+        "id": str(location['_id']),
+        "code": location.get('code'),
+        "name": location.get('name'),
+        "type": location.get('type', 'store'),
+        "address": location.get('address', ''),
+        "isDefault": location.get('isDefault', False),
+        "active": location.get('active', True),
+        "createdAt": to_iso_string(location.get('createdAt')),
+        "updatedAt": to_iso_string(location.get('updatedAt')),
+    }
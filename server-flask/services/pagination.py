@@ -0,0 +1,146 @@
+"""
+Keyset Pagination
+Opaque cursors for listing endpoints sorted on (field, _id). The next page is
+read with a range predicate on the sort index instead of skip(), so page 500
+costs the same as page 1.
+"""
+
+import base64
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+CURSOR_VERSION = 1
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$d": int(value.timestamp() * 1000)}
+    if isinstance(value, ObjectId):
+        return {"$o": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$d" in value:
+        return datetime.fromtimestamp(value["$d"] / 1000.0, tz=timezone.utc)
+    if isinstance(value, dict) and "$o" in value:
+        return ObjectId(value["$o"])
+    return value
+
+
+def encode_cursor(sort_value, doc_id):
+    payload = json.dumps({"v": CURSOR_VERSION, "k": _encode_value(sort_value), "i": _encode_value(doc_id)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort value, _id) from a cursor. Raises ValueError if malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload.get('v') != CURSOR_VERSION:
+            raise ValueError('unsupported cursor version')
+        return _decode_value(payload['k']), _decode_value(payload['i'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def keyset_query(field, after_value, after_id, direction=1):
+    """Predicate for rows strictly after (after_value, after_id) in (field, _id) order."""
+    op = "$gt" if direction == 1 else "$lt"
+    return {"$or": [
+        {field: {op: after_value}},
+        {field: after_value, "_id": {op: after_id}},
+    ]}
+
+
+def _page_query(query, field, cursor, direction):
+    if not cursor:
+        return query
+    after_value, after_id = decode_cursor(cursor)
+    after = keyset_query(field, after_value, after_id, direction)
+    return {"$and": [query, after]} if query else after
+
+
+# Aggregation rows carry their sort value here through caller stages that may project it away
+SORT_KEY_FIELD = '_keysetSort'
+
+
+def _is_inclusion(projection):
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    return any(fields.values()) if fields else bool(projection.get('_id'))
+
+
+def _projection_with_sort_key(projection, field):
+    """
+    *projection* widened so rows always carry *field* and _id for the next cursor, plus the
+    keys added that way, which are stripped from the page again.
+    """
+    if not projection:
+        return projection, []
+    if _is_inclusion(projection):
+        added = [k for k in (field, '_id') if not projection.get(k, k == '_id')]
+        return {**projection, **{k: 1 for k in added}}, added
+    added = [k for k in (field, '_id') if k in projection]
+    return {k: v for k, v in projection.items() if k not in added} or None, added
+
+
+def _split_page(docs, field, limit, strip=()):
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get(field), last['_id'])
+    for doc in docs:
+        for key in strip:
+            doc.pop(key, None)
+    return docs, next_cursor
+
+
+def keyset_page(collection, query, field, limit, cursor=None, projection=None, direction=1):
+    """
+    Fetch one page sorted on (field, _id). Returns (documents, next cursor or None).
+    *query* is combined with the cursor predicate; one extra row is read to know if there is a next page.
+    The sort field and _id are always read for the cursor, and dropped again if *projection* left them out.
+    """
+    page_query = _page_query(query, field, cursor, direction)
+    projection, added = _projection_with_sort_key(projection, field)
+    docs = list(
+        collection.find(page_query, projection).sort([(field, direction), ("_id", direction)]).limit(limit + 1)
+    )
+    return _split_page(docs, field, limit, added)
+
+
+def keyset_aggregate(collection, query, field, limit, cursor=None, stages=(), direction=1):
+    """
+    keyset_page as an aggregation: the page is matched, sorted and cut on the (field, _id) index
+    first, then *stages* (projections, $lookup joins) run on those rows only. The sort value is
+    copied aside before *stages*, so they may project the sort field and _id away.
+    """
+    keep = {SORT_KEY_FIELD: {"k": f"${field}", "i": "$_id"}}
+    pipeline = [
+        {"$match": _page_query(query, field, cursor, direction)},
+        {"$sort": {field: direction, "_id": direction}},
+        {"$limit": limit + 1},
+        {"$addFields": keep},
+        *[_keep_sort_key(stage) for stage in stages],
+    ]
+    docs = list(collection.aggregate(pipeline))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        sort_key = docs[-1][SORT_KEY_FIELD]
+        next_cursor = encode_cursor(sort_key.get('k'), sort_key['i'])
+    for doc in docs:
+        doc.pop(SORT_KEY_FIELD, None)
+    return docs, next_cursor
+
+
+def _keep_sort_key(stage):
+    # An inclusion $project would drop the copied sort value; carry it through
+    projection = stage.get('$project')
+    if projection and _is_inclusion(projection):
+        return {"$project": {**projection, SORT_KEY_FIELD: 1}}
+    return stage
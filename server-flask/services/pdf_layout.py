@@ -0,0 +1,192 @@
+"""
+Precompiled PDF layout
+Paragraph styles, table styles, colours and static flowables shared by every
+invoice and PVC card render. Everything here is built once per process at
+import time (or once per company snapshot) instead of on each PDF.
+"""
+
+import copy
+from functools import lru_cache
+
+from reportlab.lib import colors
+from reportlab.lib.colors import HexColor
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import TableStyle, Paragraph, Spacer
+
+# ==================== INVOICE STYLES ====================
+
+INVOICE_STYLES = getSampleStyleSheet()
+INVOICE_STYLES.add(ParagraphStyle(name='CompanyHeader', fontSize=22, fontName='Helvetica-Bold', textColor=colors.HexColor('#1e40af'), spaceAfter=5))
+INVOICE_STYLES.add(ParagraphStyle(name='CompanySub', fontSize=9, textColor=colors.grey, spaceAfter=2))
+INVOICE_STYLES.add(ParagraphStyle(name='InvoiceTitle', fontSize=24, fontName='Helvetica-Bold', alignment=TA_RIGHT, spaceAfter=10))
+INVOICE_STYLES.add(ParagraphStyle(name='MetaLabel', fontSize=9, textColor=colors.grey, alignment=TA_RIGHT))
+INVOICE_STYLES.add(ParagraphStyle(name='MetaValue', fontSize=10, fontName='Helvetica-Bold', alignment=TA_RIGHT))
+INVOICE_STYLES.add(ParagraphStyle(name='SectionTitle', fontSize=10, fontName='Helvetica-Bold', textColor=colors.HexColor('#1e40af'), spaceBefore=10, spaceAfter=5, textTransform='uppercase'))
+INVOICE_STYLES.add(ParagraphStyle(name='BillingInfo', fontSize=10, leading=14))
+INVOICE_STYLES.add(ParagraphStyle(name='BillingName', fontSize=12, fontName='Helvetica-Bold', leading=16))
+
+FOOTER_STYLE = ParagraphStyle(name='Footer', fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
+THANKS_STYLE = ParagraphStyle(name='Thanks', fontSize=12, fontName='Helvetica-Bold', alignment=TA_CENTER, spaceAfter=5)
+GENERATED_STYLE = ParagraphStyle(name='Generated', fontSize=8, textColor=colors.lightgrey, alignment=TA_CENTER)
+
+# ==================== INVOICE TABLE STYLES ====================
+
+HEADER_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+])
+
+BILLING_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8fafc')),
+    ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('LEFTPADDING', (0, 0), (-1, -1), 15),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 15),
+])
+
+ITEMS_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#64748b')),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f1f5f9')),
+    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+    ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.2, colors.HexColor('#e2e8f0')),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+])
+
+SUMMARY_TABLE_STYLE = TableStyle([
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ('TOPPADDING', (0, 0), (-1, -1), 4),
+    ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+])
+
+SUMMARY_WRAPPER_STYLE = TableStyle([
+    ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+])
+
+ITEMS_HEADER_ROW = ['#', 'ITEM DESCRIPTION', 'QTY', 'UNIT PRICE', 'AMOUNT']
+
+# Static labels that appear on every invoice
+SECTION_BILLED_TO = Paragraph("BILLED TO", INVOICE_STYLES['SectionTitle'])
+SECTION_PAYMENT_INFO = Paragraph("PAYMENT INFO", INVOICE_STYLES['SectionTitle'])
+SECTION_EMI_DETAILS = Paragraph("EMI DETAILS", INVOICE_STYLES['SectionTitle'])
+PAID_STATUS = Paragraph("<b>Status:</b> <font color='#10b981'>PAID ✓</font>", INVOICE_STYLES['BillingInfo'])
+SUBTOTAL_LABEL = Paragraph("Subtotal", INVOICE_STYLES['Normal'])
+CGST_LABEL = Paragraph("CGST (9%)", INVOICE_STYLES['Normal'])
+SGST_LABEL = Paragraph("SGST (9%)", INVOICE_STYLES['Normal'])
+IGST_LABEL = Paragraph("IGST (18%)", INVOICE_STYLES['Normal'])
+GRAND_TOTAL_LABEL = Paragraph("<b>Grand Total</b>", INVOICE_STYLES['Normal'])
+
+
+def _company_key(company_info):
+    return (
+        company_info.get('name', ''),
+        company_info.get('address', ''),
+        company_info.get('phone', ''),
+        company_info.get('email', ''),
+        company_info.get('gstin', ''),
+    )
+
+
+@lru_cache(maxsize=16)
+def _company_header_block(company_key):
+    name, address, phone, email, gstin = company_key
+    return (
+        Paragraph(f"⚡ {name}", INVOICE_STYLES['CompanyHeader']),
+        Paragraph(address, INVOICE_STYLES['CompanySub']),
+        Paragraph(f"Phone: {phone} | Email: {email}", INVOICE_STYLES['CompanySub']),
+        Paragraph(f"GSTIN: {gstin}", INVOICE_STYLES['CompanySub']),
+    )
+
+
+@lru_cache(maxsize=16)
+def _company_footer(company_key):
+    _, _, phone, email, _ = company_key
+    return (
+        Spacer(1, 40),
+        Paragraph("Thank you for your business!", THANKS_STYLE),
+        Paragraph(f"For queries, contact us at {phone} | {email}", FOOTER_STYLE),
+        Spacer(1, 10),
+        Paragraph("This is a computer-generated invoice and does not require a physical signature.", GENERATED_STYLE),
+    )
+
+
+def static_flowable(flowable):
+    """
+    Deep copy of a prebuilt flowable, so the parsed frags and any wrap/split state
+    (blPara, width, height) are private to one document. Only the style, which
+    layout never mutates, stays shared. Still about half the cost of re-parsing.
+    """
+    style = getattr(flowable, 'style', None)
+    return copy.deepcopy(flowable, {id(style): style} if style is not None else None)
+
+
+def company_header_block(company_info):
+    """Left half of the invoice header (company name, address, contact, GSTIN)."""
+    return [static_flowable(f) for f in _company_header_block(_company_key(company_info))]
+
+
+def invoice_footer(company_info):
+    """Closing flowables of an invoice: thanks line, contact line and generated-by note."""
+    return [static_flowable(f) for f in _company_footer(_company_key(company_info))]
+
+
+# ==================== PVC CARD LAYOUT ====================
+
+CARD_W = 85.6 * mm
+CARD_H = 54.0 * mm
+
+CARD_BACKGROUND = HexColor('#f0f4ff')
+CARD_ACCENT = HexColor('#2563eb')
+CARD_BODY = HexColor('#ffffff')
+CARD_ACCENT_DARK = HexColor('#1e40af')
+CARD_ACCENT_TEXT = HexColor('#bfdbfe')
+CARD_NAME_TEXT = HexColor('#0f172a')
+CARD_SEPARATOR = HexColor('#e2e8f0')
+CARD_BODY_TEXT = HexColor('#475569')
+CARD_LABEL_TEXT = HexColor('#94a3b8')
+CARD_VALUE_TEXT = HexColor('#334155')
+
+CARD_ACCENT_BAR_H = 8 * mm
+CARD_BOTTOM_STRIP_H = 2 * mm
+CARD_MARGIN = 4 * mm
+CARD_VALUE_X = 18 * mm
+CARD_LINE_STEP = 4 * mm
+CARD_TITLE_STEP = 4.5 * mm
+CARD_QR_SIZE = 22 * mm
+CARD_NAME_MAX = 24
+
+# ==================== LABEL SHEET LAYOUT ====================
+
+LABEL_PAGE_W = 210 * mm
+LABEL_PAGE_H = 297 * mm
+LABEL_DEFAULT_COLUMNS = 3
+LABEL_DEFAULT_ROWS = 8
+LABEL_MAX_COLUMNS = 6
+LABEL_MAX_ROWS = 16
+LABEL_SHEET_MARGIN = 4 * mm
+LABEL_PADDING = 2 * mm
+LABEL_NAME_MAX = 32
+
+LABEL_BORDER = HexColor('#e2e8f0')
+LABEL_NAME_TEXT = HexColor('#0f172a')
+LABEL_PRICE_TEXT = HexColor('#1e40af')
+
+# ==================== PVC CARD SHEET (IMPOSITION) ====================
+
+PVC_SHEET_W = 210 * mm
+PVC_SHEET_H = 297 * mm
+PVC_SHEET_COLUMNS = 2
+PVC_SHEET_ROWS = 5
+PVC_SHEET_GAP = 3 * mm
+PVC_SHEET_CUT_GUIDE = HexColor('#cbd5e1')
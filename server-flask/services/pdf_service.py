@@ -1,45 +1,94 @@
 
 import io
+import json
+import logging
+import os
 from datetime import datetime
 from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
 
 from utils.constants import COMPANY_NAME, COMPANY_PHONE, COMPANY_ADDRESS, COMPANY_EMAIL, COMPANY_GSTIN
 from utils.tzutils import format_ist_date, format_ist_time
+from services import disk_cache
+from services import pdf_layout as layout
+from services.pdf_layout import INVOICE_STYLES as styles, static_flowable
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_NAMESPACE = 'invoice-pdf'
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+
+def default_company_info():
+    return {
+        "name": COMPANY_NAME,
+        "address": COMPANY_ADDRESS,
+        "phone": COMPANY_PHONE,
+        "email": COMPANY_EMAIL,
+        "gstin": COMPANY_GSTIN
+    }
+
+
+def invoice_cache_key(invoice, company_info=None):
+    """
+    Content-addressed key for a rendered invoice.
+    Any change to the bill document or company snapshot yields a new key,
+    so cached PDFs never need explicit invalidation.
+    """
+    payload = json.dumps(
+        {"invoice": invoice, "company": company_info or default_company_info()},
+        sort_keys=True,
+        default=str
+    )
+    return disk_cache.make_key(str(invoice.get('_id')), payload)
+
+
+def get_cached_invoice_pdf(invoice, company_info=None):
+    """Return previously rendered PDF bytes for this exact invoice content, or None."""
+    return disk_cache.read(PDF_CACHE_NAMESPACE, invoice_cache_key(invoice, company_info), '.pdf')
+
+
+def render_invoice_pdf_bytes(invoice, company_info=None):
+    """Render an invoice to PDF bytes, reusing the on-disk render cache."""
+    key = invoice_cache_key(invoice, company_info)
+    cached = disk_cache.read(PDF_CACHE_NAMESPACE, key, '.pdf')
+    if cached is not None:
+        return cached
+
+    data = generate_invoice_pdf(invoice, company_info).getvalue()
+    disk_cache.write(PDF_CACHE_NAMESPACE, key, data, '.pdf')
+    return data
+
+
+def prune_invoice_pdf_cache():
+    return disk_cache.prune(PDF_CACHE_NAMESPACE, PDF_CACHE_MAX_BYTES)
+
+
+def render_invoice_pdf_job(invoice, company_info=None):
+    """
+    Process-pool entry point for bulk rendering.
+    Returns (billNumber, pdf_bytes, error) so one bad invoice never aborts a batch.
+    """
+    bill_number = str(invoice.get('billNumber') or invoice.get('_id'))
+    try:
+        return bill_number, render_invoice_pdf_bytes(invoice, company_info), None
+    except Exception as e:
+        logger.error(f"Invoice render failed for {bill_number}: {e}")
+        return bill_number, None, str(e)
+
 
 def generate_invoice_pdf(invoice, company_info=None):
     """
     Generate a professional PDF invoice using ReportLab.
     Returns a BytesIO buffer containing the PDF data.
+    Styles, table styles and the company header/footer come prebuilt from pdf_layout.
     """
     if company_info is None:
-        company_info = {
-            "name": COMPANY_NAME,
-            "address": COMPANY_ADDRESS,
-            "phone": COMPANY_PHONE,
-            "email": COMPANY_EMAIL,
-            "gstin": COMPANY_GSTIN
-        }
+        company_info = default_company_info()
 
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=20, leftMargin=20, topMargin=20, bottomMargin=20)
     elements = []
-    styles = getSampleStyleSheet()
-
-    # Custom Styles
-    styles.add(ParagraphStyle(name='CompanyHeader', fontSize=22, fontName='Helvetica-Bold', textColor=colors.HexColor('#1e40af'), spaceAfter=5))
-    styles.add(ParagraphStyle(name='CompanySub', fontSize=9, textColor=colors.grey, spaceAfter=2))
-    styles.add(ParagraphStyle(name='InvoiceTitle', fontSize=24, fontName='Helvetica-Bold', alignment=TA_RIGHT, spaceAfter=10))
-    styles.add(ParagraphStyle(name='MetaLabel', fontSize=9, textColor=colors.grey, alignment=TA_RIGHT))
-    styles.add(ParagraphStyle(name='MetaValue', fontSize=10, fontName='Helvetica-Bold', alignment=TA_RIGHT))
-    styles.add(ParagraphStyle(name='SectionTitle', fontSize=10, fontName='Helvetica-Bold', textColor=colors.HexColor('#1e40af'), spaceBefore=10, spaceAfter=5, textTransform='uppercase'))
-    styles.add(ParagraphStyle(name='BillingInfo', fontSize=10, leading=14))
-    styles.add(ParagraphStyle(name='BillingName', fontSize=12, fontName='Helvetica-Bold', leading=16))
 
     # --- Header ---
     # We use a table for the header to align company info left and invoice title right
@@ -50,12 +99,7 @@ def generate_invoice_pdf(invoice, company_info=None):
 
     header_data = [
         [
-            [
-                Paragraph(f"⚡ {company_info['name']}", styles['CompanyHeader']),
-                Paragraph(company_info['address'], styles['CompanySub']),
-                Paragraph(f"Phone: {company_info['phone']} | Email: {company_info['email']}", styles['CompanySub']),
-                Paragraph(f"GSTIN: {company_info['gstin']}", styles['CompanySub']),
-            ],
+            layout.company_header_block(company_info),
             [
                 Paragraph("TAX INVOICE", styles['InvoiceTitle']),
                 Paragraph("Invoice No:", styles['MetaLabel']),
@@ -71,11 +115,7 @@ def generate_invoice_pdf(invoice, company_info=None):
     ]
 
     header_table = Table(header_data, colWidths=[350, 180])
-    header_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-    ]))
+    header_table.setStyle(layout.HEADER_TABLE_STYLE)
     elements.append(header_table)
     elements.append(Spacer(1, 15))
 
@@ -89,16 +129,16 @@ def generate_invoice_pdf(invoice, company_info=None):
     billing_data = [
         [
             [
-                Paragraph("BILLED TO", styles['SectionTitle']),
+                static_flowable(layout.SECTION_BILLED_TO),
                 Paragraph(customer_name, styles['BillingName']),
                 Paragraph(f"Phone: {customer_phone}" if customer_phone else "", styles['BillingInfo']),
                 Paragraph(customer_address if customer_address else "", styles['BillingInfo']),
                 Paragraph(customer_place if customer_place else "", styles['BillingInfo']),
             ],
             [
-                Paragraph("PAYMENT INFO", styles['SectionTitle']),
+                static_flowable(layout.SECTION_PAYMENT_INFO),
                 Paragraph(f"<b>Method:</b> {payment_mode}", styles['BillingInfo']),
-                Paragraph(f"<b>Status:</b> <font color='#10b981'>PAID ✓</font>", styles['BillingInfo']),
+                static_flowable(layout.PAID_STATUS),
             ]
         ]
     ]
@@ -110,25 +150,17 @@ def generate_invoice_pdf(invoice, company_info=None):
         emi_text += f"<b>Monthly EMI:</b> ₹{float(emi_details.get('emiAmount', 0)):.2f}<br/>"
         emi_text += f"<b>Down Payment:</b> ₹{float(emi_details.get('downPayment', 0)):.2f}"
         billing_data[0][1].append(Spacer(1, 5))
-        billing_data[0][1].append(Paragraph("EMI DETAILS", styles['SectionTitle']))
+        billing_data[0][1].append(static_flowable(layout.SECTION_EMI_DETAILS))
         billing_data[0][1].append(Paragraph(emi_text, styles['BillingInfo']))
 
     billing_table = Table(billing_data, colWidths=[300, 230])
-    billing_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8fafc')),
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ('LEFTPADDING', (0, 0), (-1, -1), 15),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-    ]))
+    billing_table.setStyle(layout.BILLING_TABLE_STYLE)
     elements.append(billing_table)
     elements.append(Spacer(1, 20))
 
     # --- Items Table ---
     # Table Header
-    items_data = [['#', 'ITEM DESCRIPTION', 'QTY', 'UNIT PRICE', 'AMOUNT']]
+    items_data = [list(layout.ITEMS_HEADER_ROW)]
     
     # Table Content
     for idx, item in enumerate(invoice.get('items', []), 1):
@@ -165,58 +197,34 @@ def generate_invoice_pdf(invoice, company_info=None):
 
     # Create Table
     items_table = Table(items_data, colWidths=[30, 280, 50, 80, 90])
-    items_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#64748b')),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f1f5f9')),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.2, colors.HexColor('#e2e8f0')),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-    ]))
+    items_table.setStyle(layout.ITEMS_TABLE_STYLE)
     elements.append(items_table)
     elements.append(Spacer(1, 10))
 
     # --- Summary Section ---
     summary_elements = []
-    summary_elements.append([Paragraph("Subtotal", styles['Normal']), f"₹{subtotal:.2f}"])
+    summary_elements.append([static_flowable(layout.SUBTOTAL_LABEL), f"₹{subtotal:.2f}"])
     if discount_amt > 0:
         summary_elements.append([Paragraph(f"Discount ({discount_pct}%)", styles['Normal']), f"-₹{discount_amt:.2f}"])
     
     if cgst > 0:
-        summary_elements.append([Paragraph("CGST (9%)", styles['Normal']), f"₹{cgst:.2f}"])
-        summary_elements.append([Paragraph("SGST (9%)", styles['Normal']), f"₹{sgst:.2f}"])
+        summary_elements.append([static_flowable(layout.CGST_LABEL), f"₹{cgst:.2f}"])
+        summary_elements.append([static_flowable(layout.SGST_LABEL), f"₹{sgst:.2f}"])
     elif igst > 0:
-        summary_elements.append([Paragraph("IGST (18%)", styles['Normal']), f"₹{igst:.2f}"])
+        summary_elements.append([static_flowable(layout.IGST_LABEL), f"₹{igst:.2f}"])
     
-    summary_elements.append([Paragraph("<b>Grand Total</b>", styles['Normal']), Paragraph(f"<b>₹{grand_total:.2f}</b>", styles['Normal'])])
+    summary_elements.append([static_flowable(layout.GRAND_TOTAL_LABEL), Paragraph(f"<b>₹{grand_total:.2f}</b>", styles['Normal'])])
 
     summary_table = Table(summary_elements, colWidths=[150, 80])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-    ]))
+    summary_table.setStyle(layout.SUMMARY_TABLE_STYLE)
 
     # Wrap summary table in another table for right alignment
     full_summary = Table([[None, summary_table]], colWidths=[300, 230])
-    full_summary.setStyle(TableStyle([
-        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-    ]))
+    full_summary.setStyle(layout.SUMMARY_WRAPPER_STYLE)
     elements.append(full_summary)
 
     # --- Footer ---
-    elements.append(Spacer(1, 40))
-    footer_style = ParagraphStyle(name='Footer', fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
-    elements.append(Paragraph("Thank you for your business!", ParagraphStyle(name='Thanks', fontSize=12, fontName='Helvetica-Bold', alignment=TA_CENTER, spaceAfter=5)))
-    elements.append(Paragraph(f"For queries, contact us at {company_info['phone']} | {company_info['email']}", footer_style))
-    elements.append(Spacer(1, 10))
-    elements.append(Paragraph("This is a computer-generated invoice and does not require a physical signature.", ParagraphStyle(name='Generated', fontSize=8, textColor=colors.lightgrey, alignment=TA_CENTER)))
+    elements.extend(layout.invoice_footer(company_info))
 
     doc.build(elements)
     buffer.seek(0)
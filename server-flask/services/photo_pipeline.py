@@ -0,0 +1,276 @@
+"""
+Product Photo Pipeline
+Uploads are written to a local staging directory and acknowledged straight
+away; a worker claims the job, renders WebP thumbnails with Pillow, pushes the
+original and every variant to Cloudinary and fills in the photo entry on the
+product. The catalog grid then loads a small thumbnail instead of the original.
+
+Staged files only exist on the machine that received the upload, so jobs are
+claimed by workers on the same host. Each web process runs one worker thread
+(PHOTO_JOBS_INLINE_WORKER=true), or run `python photo_worker.py` on that host.
+"""
+
+import io
+import logging
+import os
+import socket
+import tempfile
+import time
+from datetime import timedelta
+
+from PIL import Image, ImageOps
+from pymongo import ReturnDocument
+
+from services.cloudinary_service import validate_file, upload_buffer, upload_image_bytes, delete_cloudinary_asset
+from utils.tzutils import utc_now
+
+logger = logging.getLogger(__name__)
+
+PHOTO_STAGING_DIR = os.environ.get(
+    'PHOTO_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'inventory-photo-staging')
+)
+PHOTO_JOB_POLL_SECONDS = int(os.environ.get('PHOTO_JOB_POLL_SECONDS', '2'))
+PHOTO_JOB_LEASE_SECONDS = int(os.environ.get('PHOTO_JOB_LEASE_SECONDS', '120'))
+PHOTO_JOB_MAX_ATTEMPTS = 3
+PHOTO_JOB_RETRY_SECONDS = 30
+PHOTO_FOLDER = "inventory/products"
+
+# Longest edge in pixels for each WebP variant
+THUMBNAIL_SIZES = {"thumb": 160, "small": 320, "medium": 640}
+# Variant used for product.thumbnail (catalog grid and POS cards)
+GRID_VARIANT = "small"
+WEBP_QUALITY = 80
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+PHOTO_PROCESSING = 'processing'
+PHOTO_READY = 'ready'
+PHOTO_FAILED = 'failed'
+
+_EXTENSIONS = {'image/jpeg': '.jpg', 'image/jpg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
+
+
+def host_id():
+    return socket.gethostname()
+
+
+def stage_photo_upload(db, product_id, file, user):
+    """
+    Validate and stage an uploaded photo, add a 'processing' entry to the product and queue a job.
+    Returns the photo entry. Raises ValueError for invalid files.
+    """
+    validate_file(file)
+    now = utc_now()
+    photo_id = f"{product_id}-{int(time.time() * 1000)}"
+
+    os.makedirs(PHOTO_STAGING_DIR, exist_ok=True)
+    path = os.path.join(PHOTO_STAGING_DIR, f"{photo_id}{_EXTENSIONS.get(file.mimetype, '')}")
+    file.save(path)
+    try:
+        # Header check only; rejects files that are not images before anything is queued
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        _remove_staged(path)
+        raise ValueError('Invalid image file')
+
+    entry = {
+        "id": photo_id,
+        "url": None,
+        "storage": "cloudinary",
+        "status": PHOTO_PROCESSING,
+        "filename": file.filename,
+        "uploadedAt": now,
+        "uploadedBy": user.get('userId'),
+        "uploadedByUsername": user.get('username')
+    }
+    db.products.update_one({"_id": product_id}, {"$push": {"photos": entry}, "$set": {"updatedAt": now}})
+    db.photo_jobs.insert_one({
+        "productId": product_id,
+        "photoId": photo_id,
+        "path": path,
+        "filename": file.filename,
+        "host": host_id(),
+        "status": JOB_QUEUED,
+        "attempts": 0,
+        "createdBy": user.get('userId'),
+        "createdAt": now,
+        "updatedAt": now,
+    })
+    return entry
+
+
+def render_variants(path):
+    """{variant name: (webp bytes, width, height)} for every THUMBNAIL_SIZES entry."""
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        variants = {}
+        for name, edge in THUMBNAIL_SIZES.items():
+            variant = image.copy()
+            variant.thumbnail((edge, edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            variant.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+            variants[name] = (buffer.getvalue(), variant.width, variant.height)
+        return variants
+
+
+def claim_next_job(db, host=None):
+    """Atomically take the oldest queued photo job staged on this host (or one whose worker died)."""
+    now = utc_now()
+    stale_before = now - timedelta(seconds=PHOTO_JOB_LEASE_SECONDS)
+    return db.photo_jobs.find_one_and_update(
+        {
+            "host": host or host_id(),
+            "$or": [
+                {"status": JOB_QUEUED, "retryAt": {"$not": {"$gt": now}}},
+                {"status": JOB_RUNNING, "startedAt": {"$lt": stale_before}},
+            ],
+            "attempts": {"$lt": PHOTO_JOB_MAX_ATTEMPTS},
+        },
+        {"$set": {"status": JOB_RUNNING, "startedAt": now, "updatedAt": now}, "$inc": {"attempts": 1}},
+        sort=[("createdAt", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def run_photo_job(db, job):
+    """Render and upload one staged photo, then fill in its entry on the product."""
+    photo_id = job['photoId']
+    variants = render_variants(job['path'])
+
+    original = upload_buffer(job['path'], folder=PHOTO_FOLDER, public_id=photo_id, overwrite=True)
+    uploaded = {}
+    for name, (data, width, height) in variants.items():
+        result = upload_image_bytes(io.BytesIO(data), f"{PHOTO_FOLDER}/variants", f"{photo_id}-{name}")
+        uploaded[name] = {
+            "url": result['url'],
+            "publicId": result['publicId'],
+            "width": width,
+            "height": height,
+            "bytes": len(data),
+        }
+
+    now = utc_now()
+    result = db.products.update_one(
+        {"_id": job['productId'], "photos.id": photo_id},
+        {"$set": {
+            "photos.$.url": original['url'],
+            "photos.$.cloudinaryPublicId": original['publicId'],
+            "photos.$.variants": uploaded,
+            "photos.$.status": PHOTO_READY,
+            "photo": original['url'],
+            "thumbnail": uploaded.get(GRID_VARIANT, {}).get('url'),
+            "updatedAt": now,
+        }}
+    )
+    if not result.matched_count:
+        # Product or photo was deleted while the job ran
+        _delete_uploaded(original['publicId'], uploaded)
+
+    db.photo_jobs.update_one({"_id": job['_id']}, {"$set": {"status": JOB_DONE, "finishedAt": now, "updatedAt": now}})
+    _remove_staged(job['path'])
+
+
+def _delete_uploaded(public_id, variants):
+    delete_cloudinary_asset(public_id)
+    for variant in (variants or {}).values():
+        delete_cloudinary_asset(variant.get('publicId'))
+
+
+def _remove_staged(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"[photo-jobs] Could not remove staged file {path}: {e}")
+
+
+def delete_photo_assets(db, photo):
+    """Remove a photo's stored original and variants, and drop any pending job for it."""
+    if photo.get('storage') == 'cloudinary' and photo.get('cloudinaryPublicId'):
+        _delete_uploaded(photo['cloudinaryPublicId'], photo.get('variants'))
+    job = db.photo_jobs.find_one_and_delete({"photoId": photo.get('id'), "status": {"$in": [JOB_QUEUED, JOB_FAILED]}})
+    if job:
+        _remove_staged(job['path'])
+
+
+def process_next_job(db, host=None):
+    """Claim and run one job. Returns True if a job was processed."""
+    job = claim_next_job(db, host)
+    if not job:
+        return False
+
+    try:
+        run_photo_job(db, job)
+        logger.info(f"[photo-jobs] Processed photo {job['photoId']}")
+    except Exception as e:
+        logger.error(f"[photo-jobs] Photo {job['photoId']} failed (attempt {job['attempts']}): {e}", exc_info=True)
+        if job['attempts'] >= PHOTO_JOB_MAX_ATTEMPTS:
+            db.photo_jobs.update_one(
+                {"_id": job['_id']},
+                {"$set": {"status": JOB_FAILED, "error": str(e), "updatedAt": utc_now()}}
+            )
+            _fail_photo(db, job, str(e))
+        else:
+            db.photo_jobs.update_one(
+                {"_id": job['_id']},
+                {"$set": {
+                    "status": JOB_QUEUED,
+                    "error": str(e),
+                    "retryAt": utc_now() + timedelta(seconds=PHOTO_JOB_RETRY_SECONDS),
+                    "updatedAt": utc_now(),
+                }}
+            )
+    return True
+
+
+def _fail_photo(db, job, error):
+    """Mark a job's photo entry failed and drop its staged file; the job will not be retried."""
+    db.products.update_one(
+        {"_id": job['productId'], "photos.id": job['photoId']},
+        {"$set": {"photos.$.status": PHOTO_FAILED, "photos.$.error": error}}
+    )
+    _remove_staged(job['path'])
+
+
+def fail_abandoned_jobs(db, host=None):
+    """
+    Fail this host's jobs whose worker died during the last allowed attempt; claim_next_job never
+    takes them again. Returns how many were failed.
+    """
+    error = "Worker stopped responding"
+    stale = {
+        "host": host or host_id(),
+        "status": JOB_RUNNING,
+        "startedAt": {"$lt": utc_now() - timedelta(seconds=PHOTO_JOB_LEASE_SECONDS)},
+        "attempts": {"$gte": PHOTO_JOB_MAX_ATTEMPTS},
+    }
+    failed = 0
+    while True:
+        job = db.photo_jobs.find_one_and_update(
+            stale, {"$set": {"status": JOB_FAILED, "error": error, "updatedAt": utc_now()}}
+        )
+        if not job:
+            break
+        logger.error(f"[photo-jobs] Photo {job['photoId']} failed: {error}")
+        _fail_photo(db, job, error)
+        failed += 1
+    return failed
+
+
+def run_worker(db, poll_seconds=PHOTO_JOB_POLL_SECONDS, stop_event=None):
+    """Worker loop: drain this host's queue, then poll. Abandoned final attempts are failed between polls."""
+    logger.info(f"[photo-jobs] Worker started on {host_id()} (poll: {poll_seconds}s, dir: {PHOTO_STAGING_DIR})")
+    while stop_event is None or not stop_event.is_set():
+        try:
+            while process_next_job(db):
+                pass
+            fail_abandoned_jobs(db)
+        except Exception as e:
+            logger.error(f"[photo-jobs] Worker loop error: {e}", exc_info=True)
+        time.sleep(poll_seconds)
@@ -0,0 +1,81 @@
+"""
+Product Photo Proxy
+Serves resized WebP copies of product photos from the local disk cache. Entries
+are keyed by (source URL, width), so a new photo gets a new key and cached
+copies never need invalidating; the key doubles as the strong ETag. Versioned
+URLs (see proxy_url) are safe to cache for a year in browsers and CDNs.
+"""
+
+import io
+import logging
+import os
+import threading
+import urllib.request
+
+from PIL import Image, ImageOps
+
+from services import disk_cache
+
+logger = logging.getLogger(__name__)
+
+PHOTO_CACHE_NAMESPACE = 'product-photos'
+PHOTO_CACHE_MAX_BYTES = int(os.environ.get('PHOTO_CACHE_MAX_MB', '512')) * 1024 * 1024
+PHOTO_PROXY_WIDTHS = (160, 320, 640, 1024)
+PHOTO_PROXY_DEFAULT_WIDTH = 320
+PHOTO_FETCH_TIMEOUT_SECONDS = 10
+PHOTO_FETCH_MAX_BYTES = 10 * 1024 * 1024
+WEBP_QUALITY = 80
+# Prune the namespace after this many cache writes in a process
+PRUNE_EVERY_WRITES = 50
+
+_write_lock = threading.Lock()
+_writes = 0
+
+
+def photo_version(photo_url, width):
+    return disk_cache.make_key(photo_url, width)[:32]
+
+
+def proxy_url(product_id, photo_url, width=PHOTO_PROXY_DEFAULT_WIDTH):
+    """Versioned proxy path for a product photo (relative, like other /api photo URLs)."""
+    return f"/api/products/{product_id}/photo?w={width}&v={photo_version(photo_url, width)}"
+
+
+def _fetch(photo_url):
+    if not photo_url.startswith(('http://', 'https://')):
+        raise ValueError('Photo is not stored remotely')
+    with urllib.request.urlopen(photo_url, timeout=PHOTO_FETCH_TIMEOUT_SECONDS) as response:
+        data = response.read(PHOTO_FETCH_MAX_BYTES + 1)
+    if len(data) > PHOTO_FETCH_MAX_BYTES:
+        raise ValueError('Photo is too large to resize')
+    return data
+
+
+def resize_photo(data, width):
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        image.thumbnail((width, width), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        return buffer.getvalue()
+
+
+def get_resized_photo(photo_url, width):
+    """WebP bytes of *photo_url* scaled to fit *width*, from the disk cache or rendered and stored."""
+    global _writes
+    key = photo_version(photo_url, width)
+    cached = disk_cache.read(PHOTO_CACHE_NAMESPACE, key, '.webp')
+    if cached is not None:
+        return cached
+
+    data = resize_photo(_fetch(photo_url), width)
+    disk_cache.write(PHOTO_CACHE_NAMESPACE, key, data, '.webp')
+    with _write_lock:
+        _writes += 1
+        should_prune = _writes % PRUNE_EVERY_WRITES == 0
+    if should_prune:
+        removed = disk_cache.prune(PHOTO_CACHE_NAMESPACE, PHOTO_CACHE_MAX_BYTES)
+        if removed:
+            logger.info(f"[photo-proxy] Pruned {removed} cached photos")
+    return data
@@ -0,0 +1,278 @@
+"""
+Product Import Service
+Bulk-loads supplier stock lists. Rows are validated column-wise with pandas,
+then upserted by barcode, SKU or name through chunked bulk_write calls.
+New products get their barcode in the same write (the _id is chosen client-side).
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.collation import Collation, CollationStrength
+from pymongo.errors import BulkWriteError
+
+from services.barcode_service import generate_product_barcode
+from services.product_search import search_terms_for, name_key
+from services.stock_ledger import record_stock_changes, REASON_IMPORT
+from services.tabular_import import map_columns, row_numbers, chunked
+from services.warranty_service import stamp_renewal_prices
+from utils.tzutils import utc_now
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_IMPORT_ALIASES = {
+    'name': ['name', 'productname', 'product', 'item', 'itemname'],
+    'price': ['price', 'priceinclusive', 'sellingprice', 'mrp', 'saleprice', 'rate'],
+    'costPrice': ['costprice', 'cost', 'purchaseprice', 'buyingprice'],
+    'quantity': ['quantity', 'qty', 'stock', 'stockquantity', 'openingstock'],
+    'gstPercent': ['gst', 'gstpercent', 'gstrate', 'tax', 'taxrate'],
+    'hsnCode': ['hsn', 'hsncode', 'hsnsku', 'hsnsac'],
+    'sku': ['sku', 'itemcode', 'productcode', 'code'],
+    'barcode': ['barcode', 'ean', 'ean13', 'upc'],
+    'category': ['category', 'group'],
+    'minStock': ['minstock', 'reorderlevel', 'minimumstock'],
+    'warrantyMonths': ['warranty', 'warrantymonths'],
+    'warrantyRenewalPrice': ['warrantyrenewalprice', 'renewalprice'],
+}
+
+# Same defaults as products.add_product
+PRODUCT_DEFAULTS = {
+    'quantity': 0,
+    'costPrice': 0.0,
+    'gstPercent': 18.0,
+    'hsnCode': '9999',
+    'minStock': 10,
+    'warrantyMonths': 12,
+    'warrantyRenewalPrice': 0.0,
+}
+
+FLOAT_FIELDS = ('price', 'costPrice', 'gstPercent', 'warrantyRenewalPrice')
+INT_FIELDS = ('quantity', 'minStock', 'warrantyMonths')
+TEXT_FIELDS = ('name', 'hsnCode', 'sku', 'barcode', 'category')
+MAX_GST_PERCENT = 28
+
+QUANTITY_MODES = ('set', 'add')
+
+# Name matches ignore case; products has a name index with this collation (database._create_indexes)
+NAME_COLLATION = Collation(locale='en', strength=CollationStrength.SECONDARY)
+
+
+def _numeric(series):
+    return pd.to_numeric(series.str.replace(',', '', regex=False), errors='coerce')
+
+
+def validate_products(frame):
+    """
+    Vectorised validation of a mapped product frame.
+    Returns (typed frame, list of error lists aligned with rows, match keys).
+    Blank cells mean "leave unchanged" for existing products and "use the default" for new ones.
+    """
+    count = len(frame)
+    errors = [[] for _ in range(count)]
+    typed = pd.DataFrame(index=frame.index)
+
+    def flag(mask, message):
+        for pos in np.flatnonzero(np.asarray(mask, dtype=bool)):
+            errors[pos].append(message)
+
+    for field in TEXT_FIELDS:
+        typed[field] = frame[field]
+
+    for field in FLOAT_FIELDS + INT_FIELDS:
+        raw = frame[field]
+        present = raw != ''
+        values = _numeric(raw)
+        flag(present & values.isna(), f"{field} must be a number")
+        flag(present & (values < 0), f"{field} cannot be negative")
+        if field in INT_FIELDS:
+            flag(present & values.notna() & (values % 1 != 0), f"{field} must be a whole number")
+        typed[field] = values.where(present)
+
+    flag(frame['name'] == '', "name is required")
+    flag(typed['gstPercent'] > MAX_GST_PERCENT, f"gstPercent cannot exceed {MAX_GST_PERCENT}")
+
+    # Barcode wins, then SKU, then name (case-insensitive) as the upsert key
+    key_type = np.where(frame['barcode'] != '', 'barcode', np.where(frame['sku'] != '', 'sku', 'name'))
+    key_value = np.where(key_type == 'barcode', frame['barcode'],
+                         np.where(key_type == 'sku', frame['sku'], frame['name']))
+    keys = pd.Series([f"{t}:{v.lower() if t == 'name' else v}" for t, v in zip(key_type, key_value)], index=frame.index)
+
+    rows = row_numbers(frame)
+    duplicated = keys.duplicated(keep='first') & (pd.Series(key_value, index=frame.index) != '')
+    if duplicated.any():
+        first_row = rows.groupby(keys).transform('min')
+        for pos in np.flatnonzero(duplicated.to_numpy()):
+            errors[pos].append(f"duplicate of row {int(first_row.iloc[pos])} in this file")
+
+    return typed, errors, list(zip(key_type, key_value))
+
+
+def _match_key(key):
+    """Lookup form of a (key_type, value) upsert key: names compare case-insensitively."""
+    key_type, value = key
+    return (key_type, value.lower()) if key_type == 'name' else key
+
+
+def _find_existing(db, keys):
+    """
+    Map _match_key(key) -> existing product for one chunk: one $or query on barcode/SKU and one
+    query on name under NAME_COLLATION, so each uses its own index.
+    """
+    barcodes = [v for t, v in keys if t == 'barcode']
+    skus = [v for t, v in keys if t == 'sku']
+    names = [v for t, v in keys if t == 'name']
+    fields = {"name": 1, "barcode": 1, "sku": 1, "hsnCode": 1, "quantity": 1}
+    clauses = []
+    if barcodes:
+        clauses.append({"barcode": {"$in": barcodes}})
+    if skus:
+        clauses.append({"sku": {"$in": skus}})
+
+    existing = {}
+    if clauses:
+        for product in db.products.find({"$or": clauses}, fields):
+            if product.get('barcode'):
+                existing.setdefault(('barcode', product['barcode']), product)
+            if product.get('sku'):
+                existing.setdefault(('sku', product['sku']), product)
+    if names:
+        for product in db.products.find({"name": {"$in": names}}, fields, collation=NAME_COLLATION):
+            existing.setdefault(_match_key(('name', product['name'])), product)
+    return existing
+
+
+def _build_update(row, key, existing, quantity_mode, user, now):
+    """UpdateOne for one row: $set supplied fields; $setOnInsert identity, barcode and defaults."""
+    key_type, key_value = key
+    given = {}
+    for field in TEXT_FIELDS:
+        if row[field]:
+            given[field] = row[field]
+    for field in FLOAT_FIELDS:
+        if pd.notna(row[field]):
+            given[field] = float(row[field])
+    for field in INT_FIELDS:
+        if pd.notna(row[field]):
+            given[field] = int(row[field])
+    if key_type == 'name' and existing:
+        # Matched ignoring case; keep the stored spelling
+        given.pop('name', None)
+
+    update = {"$set": {**given, "updatedAt": now, "lastModified": now,
+                       "lastModifiedBy": user.get('userId'), "lastModifiedByUsername": user.get('username')}}
+    quantity = given.pop('quantity', None)
+    if quantity is not None and quantity_mode == 'add':
+        del update["$set"]['quantity']
+        update["$inc"] = {"quantity": quantity}
+
+    new_id = existing['_id'] if existing else ObjectId()
+    if existing:
+        query = {"_id": existing['_id']}
+    else:
+        query = {key_type: key_value}
+        on_insert = {
+            "_id": new_id,
+            "photo": None,
+            "photos": [],
+            "createdAt": now,
+            "ledgerOpenedAt": now,
+            "stockLevelsOpenedAt": now,
+            "createdBy": user.get('userId'),
+            "createdByUsername": user.get('username'),
+        }
+        if 'barcode' not in given:
+            on_insert["barcode"] = generate_product_barcode(row['name'], str(new_id))
+        for field, default in PRODUCT_DEFAULTS.items():
+            if field not in update["$set"] and field not in update.get("$inc", {}):
+                on_insert[field] = default
+        update["$setOnInsert"] = on_insert
+
+    current = {**(existing or {}), **update.get("$setOnInsert", {}), **given}
+    update["$set"]["searchTerms"] = search_terms_for(current)
+    update["$set"]["nameLower"] = name_key(current.get('name'))
+
+    if key_type == 'name' and not existing:
+        return UpdateOne(query, update, upsert=True, collation=NAME_COLLATION), new_id
+    return UpdateOne(query, update, upsert=not existing), new_id
+
+
+def _stock_delta(row, existing, quantity_mode):
+    """Quantity change this row makes, for the stock ledger."""
+    if pd.isna(row['quantity']):
+        return 0 if existing else PRODUCT_DEFAULTS['quantity']
+    quantity = int(row['quantity'])
+    if existing and quantity_mode == 'set':
+        try:
+            return quantity - float(existing.get('quantity', 0) or 0)
+        except (TypeError, ValueError):
+            return quantity
+    return quantity
+
+
+def import_products(db, frame, user, quantity_mode='set', dry_run=False):
+    """
+    Validate and upsert a raw (unmapped) product frame.
+    Returns {"summary": {...}, "rows": [per-row report]}.
+    """
+    if quantity_mode not in QUANTITY_MODES:
+        raise ValueError(f"quantityMode must be one of: {', '.join(QUANTITY_MODES)}")
+
+    mapped = map_columns(frame, PRODUCT_IMPORT_ALIASES)
+    if not (mapped['name'] != '').any():
+        raise ValueError("No product name column found (expected a header like 'Name' or 'Product Name')")
+
+    typed, errors, keys = validate_products(mapped)
+    rows = row_numbers(mapped).tolist()
+    report = [
+        {"row": rows[pos], "key": f"{keys[pos][0]}:{keys[pos][1]}", "status": "error" if errors[pos] else "pending",
+         "errors": errors[pos]}
+        for pos in range(len(mapped))
+    ]
+
+    now = utc_now()
+    valid_positions = [pos for pos in range(len(mapped)) if not errors[pos]]
+    for chunk in chunked(valid_positions):
+        existing = _find_existing(db, [keys[pos] for pos in chunk])
+        ops, op_positions, stock_changes, renewal_prices = [], [], {}, {}
+        for pos in chunk:
+            row = typed.iloc[pos]
+            match = existing.get(_match_key(keys[pos]))
+            if not match and pd.isna(row['price']):
+                report[pos].update(status="error", errors=["price is required for new products"])
+                continue
+            op, product_id = _build_update(row, keys[pos], match, quantity_mode, user, now)
+            report[pos].update(status="updated" if match else "created", id=str(product_id))
+            ops.append(op)
+            op_positions.append(pos)
+            stock_changes[pos] = (product_id, _stock_delta(row, match, quantity_mode))
+            if match and pd.notna(row['warrantyRenewalPrice']):
+                renewal_prices[pos] = (product_id, float(row['warrantyRenewalPrice']))
+
+        if dry_run or not ops:
+            continue
+
+        try:
+            db.products.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                pos = op_positions[write_error['index']]
+                report[pos].update(status="error", errors=[write_error.get('errmsg', 'write failed')])
+                report[pos].pop('id', None)
+                stock_changes.pop(pos, None)
+                renewal_prices.pop(pos, None)
+        record_stock_changes(db, stock_changes.values(), REASON_IMPORT, 'import', None, user)
+        # Existing warranties carry their product's renewal price
+        stamp_renewal_prices(db, dict(renewal_prices.values()))
+
+    summary = {"rows": len(report), "created": 0, "updated": 0, "errors": 0, "dryRun": dry_run}
+    for entry in report:
+        if entry['status'] == 'created':
+            summary['created'] += 1
+        elif entry['status'] == 'updated':
+            summary['updated'] += 1
+        else:
+            summary['errors'] += 1
+    return {"summary": summary, "rows": report}
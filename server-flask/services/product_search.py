@@ -0,0 +1,165 @@
+"""
+Product Search
+Every product carries a `searchTerms` array maintained on write: the prefixes of
+each name/code token plus `~`-tagged trigrams of the name tokens. A multikey
+index on that array lets POS search resolve each keystroke without scanning the
+catalog. Results are ranked exact code match, then name prefix, then token
+prefix, then fuzzy (trigram overlap). Name-prefix hits are read from the stored
+lowercase `nameLower` with an anchored, case-sensitive regex, which is a plain
+range scan on the (nameLower, _id) index.
+"""
+
+import math
+import re
+
+SEARCH_PREFIX_MAX = 20          # longer query tokens are truncated to this before lookup
+SEARCH_MAX_TOKENS = 6
+FUZZY_MIN_OVERLAP = 0.4         # share of the query's trigrams a fuzzy hit must contain
+TRIGRAM_TAG = '~'
+
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+MATCH_TOKEN = 'token'
+MATCH_FUZZY = 'fuzzy'
+_MATCH_RANK = {MATCH_EXACT: 0, MATCH_PREFIX: 1, MATCH_TOKEN: 2, MATCH_FUZZY: 3}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text or '').lower())
+
+
+def _trigrams(token):
+    return {TRIGRAM_TAG + token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def build_search_terms(name, barcode=None, sku=None, hsn_code=None):
+    """Index terms for one product. Codes are prefix-searchable; only the name is fuzzy-matched."""
+    terms = set()
+    name_tokens = tokenize(name)
+    for token in name_tokens + tokenize(barcode) + tokenize(sku) + tokenize(hsn_code):
+        for end in range(1, min(len(token), SEARCH_PREFIX_MAX) + 1):
+            terms.add(token[:end])
+    for token in name_tokens:
+        terms.update(_trigrams(token))
+    return sorted(terms)
+
+
+def name_key(name):
+    """Stored `nameLower` for a product name."""
+    return str(name or '').strip().lower()
+
+
+def search_terms_for(product):
+    return build_search_terms(product.get('name'), product.get('barcode'), product.get('sku'), product.get('hsnCode'))
+
+
+def _with_match(product, match_type):
+    product.pop('searchTerms', None)
+    product.pop('nameLower', None)
+    product['_matchType'] = match_type
+    return product
+
+
+def _query_terms(text):
+    """(prefix terms, trigrams, minimum trigram overlap) for a search string."""
+    tokens = [t[:SEARCH_PREFIX_MAX] for t in tokenize(text)[:SEARCH_MAX_TOKENS]]
+    # Longest first: it's the most selective index key
+    terms = sorted(set(tokens), key=len, reverse=True)
+    grams = sorted(set().union(*(_trigrams(t) for t in tokens))) if tokens else []
+    return terms, grams, max(1, math.ceil(len(grams) * FUZZY_MIN_OVERLAP))
+
+
+def _exact_query(text):
+    return {"$or": [{"barcode": text}, {"sku": text}]}
+
+
+def _name_prefix_query(text):
+    return {"nameLower": {"$regex": f"^{re.escape(name_key(text))}"}}
+
+
+def _fuzzy_pipeline(grams, min_overlap, exclude):
+    """
+    Products sharing at least *min_overlap* of *grams*, with their overlap as `_score`. Every product
+    with any of the trigrams is scored before anything is cut, so the best matches are never dropped.
+    """
+    return [
+        {"$match": {"searchTerms": {"$in": grams}, **exclude}},
+        {"$addFields": {"_score": {"$size": {"$filter": {
+            "input": "$searchTerms", "as": "term", "cond": {"$in": ["$$term", grams]}
+        }}}}},
+        {"$match": {"_score": {"$gte": min_overlap}}},
+    ]
+
+
+def search_products(db, query, limit=20, projection=None):
+    """
+    Ranked product search. Returns up to *limit* product documents, each tagged with `_matchType`.
+    *projection* follows find() inclusion syntax; searchTerms/nameLower are never returned.
+    """
+    text = str(query or '').strip()
+    if not text or limit <= 0:
+        return []
+
+    projection = dict(projection) if projection else {"searchTerms": 0, "nameLower": 0}
+    inclusive = any(projection.values())
+    if inclusive:
+        projection.setdefault('name', 1)
+        projection.pop('searchTerms', None)
+        projection.pop('nameLower', None)
+
+    results, seen = [], set()
+
+    # 1. Scanned or typed barcode / SKU
+    for product in db.products.find(_exact_query(text), projection).limit(limit):
+        seen.add(product['_id'])
+        results.append(_with_match(product, MATCH_EXACT))
+
+    terms, grams, min_overlap = _query_terms(text)
+    if not terms or len(results) >= limit:
+        return results[:limit]
+
+    # 2. Every query token is a prefix of some product token: names starting with the query first,
+    # then the rest, each page read in name order so the best hits are never cut off
+    prefix_match = {"searchTerms": {"$all": terms}}
+    tiers = ((MATCH_PREFIX, _name_prefix_query(text), "nameLower"), (MATCH_TOKEN, {}, "name"))
+    for match_type, query_filter, sort_field in tiers:
+        cursor = db.products.find({**prefix_match, **query_filter, "_id": {"$nin": list(seen)}}, projection)
+        for product in cursor.sort([(sort_field, 1), ("_id", 1)]).limit(limit - len(results)):
+            seen.add(product['_id'])
+            results.append(_with_match(product, match_type))
+        if len(results) >= limit:
+            return results
+
+    # 3. Typos: rank by how many of the query's trigrams the product name shares
+    if not grams:
+        return results
+    pipeline = _fuzzy_pipeline(grams, min_overlap, {"_id": {"$nin": list(seen)}}) + [
+        {"$sort": {"_score": -1, "name": 1}},
+        {"$limit": limit - len(results)},
+    ]
+    if inclusive:
+        pipeline.append({"$project": projection})
+    for product in db.products.aggregate(pipeline):
+        product.pop('_score', None)
+        results.append(_with_match(product, MATCH_FUZZY))
+
+    return results
+
+
+def count_search_matches(db, query):
+    """How many products search_products() can return for *query* with no limit."""
+    text = str(query or '').strip()
+    if not text:
+        return 0
+    terms, grams, min_overlap = _query_terms(text)
+    if not terms:
+        return db.products.count_documents(_exact_query(text))
+    prefix_match = {"searchTerms": {"$all": terms}}
+    total = db.products.count_documents({"$or": [*_exact_query(text)["$or"], prefix_match]})
+    if grams:
+        exclude = {"barcode": {"$ne": text}, "sku": {"$ne": text}, "searchTerms": {"$not": {"$all": terms}}}
+        for row in db.products.aggregate(_fuzzy_pipeline(grams, min_overlap, exclude) + [{"$count": "n"}]):
+            total += row['n']
+    return total
@@ -0,0 +1,306 @@
+"""
+Background Scheduler
+Cron-style jobs shared by every process that runs the scheduler. Each job has a
+document in `scheduler_jobs` holding its next due time and a lease; a process
+runs a job only after atomically taking that lease, so with four gunicorn
+workers (or a separate `python -m scheduler`) each due run happens exactly once.
+The lease is renewed while the job runs, so a long run is never re-claimed.
+Every run is recorded in `scheduler_runs` with its timing and outcome.
+
+Schedules are five-field cron expressions (minute hour day month weekday,
+weekday 0 = Sunday) evaluated in IST. Override one with SCHEDULE_<JOB_NAME>
+(e.g. SCHEDULE_EMI_STATUS_SYNC="*/30 * * * *"), or set it to "off".
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.tzutils import utc_now, to_iso_string
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+SCHEDULER_POLL_SECONDS = int(os.environ.get('SCHEDULER_POLL_SECONDS', '30'))
+SCHEDULER_RUN_RETENTION_DAYS = 30
+DEFAULT_LEASE_SECONDS = 600
+
+_CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CronSchedule:
+    """Parsed cron expression supporting *, */n, a-b, a-b/n and comma lists."""
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.fields = {}
+        for (name, low, high), part in zip(_CRON_FIELDS, parts):
+            self.fields[name] = self._parse(part, low, high)
+        # Standard cron: when both day and weekday are restricted, either may match
+        self._day_any = parts[2] == '*'
+        self._weekday_any = parts[4] == '*'
+
+    @staticmethod
+    def _parse(part, low, high):
+        values = set()
+        for item in part.split(','):
+            step = 1
+            if '/' in item:
+                item, step_text = item.split('/', 1)
+                step = int(step_text)
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(v) for v in item.split('-', 1))
+            else:
+                start = end = int(item)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Cron field {part!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.fields['day']
+        weekday_ok = (moment.isoweekday() % 7) in self.fields['weekday']
+        if self._day_any or self._weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """First matching minute strictly after *moment* (returned in UTC)."""
+        candidate = moment.astimezone(IST).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.fields['month'] or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.fields['hour']:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.fields['minute']:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate.astimezone(timezone.utc)
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class ScheduledJob:
+    def __init__(self, name, schedule, func, lease_seconds=DEFAULT_LEASE_SECONDS, enabled=True):
+        override = os.environ.get(f"SCHEDULE_{name.upper().replace('-', '_')}")
+        if override:
+            schedule = override
+        self.name = name
+        self.enabled = enabled and schedule.lower() != 'off'
+        self.schedule = CronSchedule(schedule) if self.enabled else None
+        self.func = func
+        self.lease_seconds = lease_seconds
+
+
+def register_jobs(db, jobs):
+    """Create or update each job's state document; a changed schedule is re-timed from now."""
+    now = utc_now()
+    for job in jobs:
+        if not job.enabled:
+            continue
+        state = db.scheduler_jobs.find_one({"_id": job.name}, {"schedule": 1})
+        if state and state.get('schedule') == job.schedule.expression:
+            continue
+        try:
+            db.scheduler_jobs.update_one(
+                {"_id": job.name},
+                {"$set": {"schedule": job.schedule.expression, "nextRunAt": job.schedule.next_after(now)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another process registered it at the same moment
+            pass
+
+
+def claim_job(db, job, worker=None, now=None):
+    """Take the job's lease if it is due and nobody holds it. Returns the state document or None."""
+    now = now or utc_now()
+    return db.scheduler_jobs.find_one_and_update(
+        {
+            "_id": job.name,
+            "nextRunAt": {"$lte": now},
+            "$or": [{"leaseUntil": None}, {"leaseUntil": {"$lt": now}}],
+        },
+        {"$set": {
+            "leaseUntil": now + timedelta(seconds=job.lease_seconds),
+            "leasedBy": worker or worker_id(),
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _summarize(result):
+    """Keep scalar fields of a job's return value for the run record."""
+    if not isinstance(result, dict):
+        return None
+    return {k: v for k, v in result.items() if isinstance(v, (str, int, float, bool)) or v is None}
+
+
+def _renew_lease(db, job, worker, stop):
+    """Push the lease forward every third of lease_seconds until *stop* is set."""
+    interval = max(job.lease_seconds / 3, 1)
+    while not stop.wait(interval):
+        try:
+            renewed = db.scheduler_jobs.update_one(
+                {"_id": job.name, "leasedBy": worker},
+                {"$set": {"leaseUntil": utc_now() + timedelta(seconds=job.lease_seconds)}},
+            )
+            if not renewed.matched_count:
+                logger.warning(f"[scheduler] {job.name} lease was taken over while running on {worker}")
+                return
+        except Exception as e:
+            logger.warning(f"[scheduler] Could not renew the {job.name} lease: {e}")
+
+
+def run_job(db, job, worker=None):
+    """Run a claimed job, record the run, schedule the next one and release the lease."""
+    worker = worker or worker_id()
+    started = utc_now()
+    clock = time.perf_counter()
+    status, error, result = 'success', None, None
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_renew_lease, args=(db, job, worker, stop),
+                                 name=f"scheduler-lease-{job.name}", daemon=True)
+    heartbeat.start()
+    try:
+        result = job.func(db)
+        if isinstance(result, dict) and result.get('success') is False:
+            status, error = 'failed', result.get('error') or result.get('message')
+    except Exception as e:
+        logger.error(f"[scheduler] Job {job.name} failed: {e}", exc_info=True)
+        status, error = 'failed', str(e)
+    finally:
+        stop.set()
+        heartbeat.join()
+    finished = utc_now()
+    duration_ms = round((time.perf_counter() - clock) * 1000, 1)
+
+    db.scheduler_runs.insert_one({
+        "job": job.name,
+        "status": status,
+        "error": error,
+        "result": _summarize(result),
+        "worker": worker,
+        "startedAt": started,
+        "finishedAt": finished,
+        "durationMs": duration_ms,
+    })
+    db.scheduler_jobs.update_one(
+        {"_id": job.name, "leasedBy": worker},
+        {"$set": {
+            "nextRunAt": job.schedule.next_after(finished),
+            "leaseUntil": None,
+            "lastRunAt": started,
+            "lastStatus": status,
+            "lastDurationMs": duration_ms,
+        }}
+    )
+    logger.info(f"[scheduler] {job.name} {status} in {duration_ms} ms")
+    return status
+
+
+def run_due_jobs(db, jobs, worker=None):
+    """Run every enabled job that is due and not leased elsewhere. Returns the names that ran here."""
+    ran = []
+    for job in jobs:
+        if job.enabled and claim_job(db, job, worker):
+            run_job(db, job, worker)
+            ran.append(job.name)
+    return ran
+
+
+def run_scheduler(db, jobs, poll_seconds=SCHEDULER_POLL_SECONDS, stop_event=None):
+    worker = worker_id()
+    register_jobs(db, jobs)
+    enabled = [job.name for job in jobs if job.enabled]
+    logger.info(f"[scheduler] {worker} scheduling {', '.join(enabled)} (poll: {poll_seconds}s)")
+    while stop_event is None or not stop_event.is_set():
+        try:
+            run_due_jobs(db, jobs, worker)
+        except Exception as e:
+            logger.error(f"[scheduler] Loop error: {e}", exc_info=True)
+        time.sleep(poll_seconds)
+
+
+def serialize_job_state(state, recent_runs):
+    return {
+        "name": state['_id'],
+        "schedule": state.get('schedule'),
+        "nextRunAt": to_iso_string(state.get('nextRunAt')),
+        "lastRunAt": to_iso_string(state.get('lastRunAt')),
+        "lastStatus": state.get('lastStatus'),
+        "lastDurationMs": state.get('lastDurationMs'),
+        "running": state.get('leaseUntil') is not None,
+        "leasedBy": state.get('leasedBy') if state.get('leaseUntil') else None,
+        "recentRuns": [{
+            "status": run.get('status'),
+            "error": run.get('error'),
+            "result": run.get('result'),
+            "worker": run.get('worker'),
+            "startedAt": to_iso_string(run.get('startedAt')),
+            "durationMs": run.get('durationMs'),
+        } for run in recent_runs],
+    }
+
+
+# ----- Job definitions -----
+
+def _emi_status_sync(db):
+    from routes.emi import sync_all_emi_statuses
+    return sync_all_emi_statuses(db)
+
+
+def _emi_plan_reconcile(db):
+    from routes.emi import reconcile_emi_plans
+    return reconcile_emi_plans(db)
+
+
+def _salary_processing(db):
+    from services.salary_scheduler import process_monthly_salaries
+    return process_monthly_salaries()
+
+
+def _warranty_expiry(db):
+    from routes.warranties import expire_warranties
+    return {"expired": expire_warranties(db)}
+
+
+def _payment_link_cleanup(db):
+    from routes.payment_links import expire_payment_links
+    return {"expired": expire_payment_links(db)}
+
+
+def _stock_reconcile(db):
+    from services.stock_ledger import reconcile_stock, take_snapshot
+    run = reconcile_stock(db, {"userId": None, "username": "scheduler"})
+    take_snapshot(db)
+    return {"checkedProducts": run['checkedProducts'], "driftCount": run['driftCount']}
+
+
+def default_jobs():
+    return [
+        ScheduledJob('emi-status-sync', '0 * * * *', _emi_status_sync,
+                     enabled=os.environ.get('EMI_AUTO_SYNC_ENABLED', 'true').lower() == 'true'),
+        ScheduledJob('emi-plan-reconcile', '*/30 * * * *', _emi_plan_reconcile),
+        ScheduledJob('salary-processing', '30 0 * * *', _salary_processing),
+        ScheduledJob('warranty-expiry', '15 0 * * *', _warranty_expiry),
+        ScheduledJob('payment-link-cleanup', '*/15 * * * *', _payment_link_cleanup),
+        ScheduledJob('stock-reconcile', '0 3 * * *', _stock_reconcile, lease_seconds=1800),
+    ]
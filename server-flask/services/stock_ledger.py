@@ -0,0 +1,313 @@
+"""
+Stock Ledger
+Append-only `stock_movements` log written next to every stock change. The
+product's `quantity` stays the materialized current level (updated with $inc in
+the same call), and the ledger records why it moved. Periodic snapshots bound
+how much of the ledger a reconciliation has to re-sum, and the reconciliation
+compares each product's quantity to snapshot + later movements to surface drift.
+`stock_snapshots` holds one current snapshot per product, advanced in place by each run.
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from services.locations import adjust_stock_levels, default_location_id
+from utils.tzutils import utc_now, to_iso_string
+
+logger = logging.getLogger(__name__)
+
+# Movement reasons
+REASON_OPENING = 'opening'
+REASON_SALE = 'sale'
+REASON_SALE_REVERSAL = 'sale_reversal'
+REASON_RETURN = 'return'
+REASON_RETURN_REVERSAL = 'return_reversal'
+REASON_ADJUSTMENT = 'adjustment'
+REASON_IMPORT = 'import'
+REASON_RECONCILIATION = 'reconciliation'
+REASON_TRANSFER_OUT = 'transfer_out'
+REASON_TRANSFER_IN = 'transfer_in'
+MOVEMENT_REASONS = (
+    REASON_OPENING, REASON_SALE, REASON_SALE_REVERSAL, REASON_RETURN, REASON_RETURN_REVERSAL,
+    REASON_ADJUSTMENT, REASON_IMPORT, REASON_RECONCILIATION, REASON_TRANSFER_OUT, REASON_TRANSFER_IN,
+)
+
+DRIFT_TOLERANCE = 1e-6
+# Products written this recently may have their $inc applied but the movement not yet inserted
+RECONCILE_SETTLE_SECONDS = 60
+# Products read per round trip by the opening-balance pass and the reconciliation
+LEDGER_BATCH_SIZE = 1000
+
+
+def _as_object_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    if value and ObjectId.is_valid(str(value)):
+        return ObjectId(str(value))
+    return None
+
+
+def _movement(product_id, delta, reason, ref_type, ref_id, user, at, note=None, location_id=None):
+    movement = {
+        "productId": product_id,
+        "locationId": location_id,
+        "delta": delta,
+        "reason": reason,
+        "refType": ref_type,
+        "refId": ref_id,
+        "userId": (user or {}).get('userId'),
+        "username": (user or {}).get('username'),
+        "at": at,
+    }
+    if note:
+        movement["note"] = note
+    return movement
+
+
+def _merge_changes(changes):
+    """Sum deltas per product, keeping first-seen order. Unknown ids and zero deltas are dropped."""
+    merged = OrderedDict()
+    for product_id, delta in changes:
+        oid = _as_object_id(product_id)
+        try:
+            delta = float(delta or 0)
+        except (TypeError, ValueError):
+            continue
+        if oid is None or not delta:
+            continue
+        merged[oid] = merged.get(oid, 0.0) + delta
+    return [(oid, delta) for oid, delta in merged.items() if abs(delta) > DRIFT_TOLERANCE]
+
+
+def apply_stock_changes(db, changes, reason, ref_type=None, ref_id=None, user=None, note=None, location_id=None):
+    """
+    $inc product totals and the location's stock levels, and append the matching movements,
+    each in one bulk call. *changes* is an iterable of (product id, signed delta); *location_id*
+    defaults to the main location. Returns the number of products changed.
+    """
+    merged = _merge_changes(changes)
+    if not merged:
+        return 0
+
+    now = utc_now()
+    db.products.bulk_write([
+        UpdateOne({"_id": oid}, {"$inc": {"quantity": delta}, "$set": {"updatedAt": now}})
+        for oid, delta in merged
+    ], ordered=False)
+    record_stock_changes(db, merged, reason, ref_type, ref_id, user, at=now, note=note, location_id=location_id)
+    return len(merged)
+
+
+def record_stock_changes(db, changes, reason, ref_type=None, ref_id=None, user=None, at=None, note=None,
+                         location_id=None):
+    """Apply location levels and append movements for product totals the caller has already written."""
+    merged = _merge_changes(changes)
+    if not merged:
+        return
+    location_id = location_id or default_location_id(db)
+    adjust_stock_levels(db, merged, location_id, at)
+    record_movements(db, merged, reason, ref_type, ref_id, user, at=at, note=note, location_id=location_id)
+
+
+def record_movements(db, changes, reason, ref_type=None, ref_id=None, user=None, at=None, note=None,
+                     location_id=None):
+    """Append movements for stock changes the caller has already written (e.g. inside an import bulk_write)."""
+    merged = _merge_changes(changes)
+    if not merged:
+        return
+    at = at or utc_now()
+    try:
+        db.stock_movements.insert_many(
+            [_movement(oid, delta, reason, ref_type, ref_id, user, at, note, location_id) for oid, delta in merged],
+            ordered=False,
+        )
+    except Exception as e:
+        # The stock change itself has been applied; a missing movement shows up as drift on reconcile
+        logger.error(f"[stock-ledger] Failed to record {reason} movements for {ref_type}/{ref_id}: {e}")
+
+
+def serialize_movement(movement):
+    return {
+        "id": str(movement['_id']),
+        "productId": str(movement.get('productId')),
+        "locationId": str(movement['locationId']) if movement.get('locationId') else None,
+        "delta": movement.get('delta'),
+        "reason": movement.get('reason'),
+        "refType": movement.get('refType'),
+        "refId": str(movement['refId']) if movement.get('refId') is not None else None,
+        "note": movement.get('note'),
+        "username": movement.get('username'),
+        "at": to_iso_string(movement.get('at')),
+    }
+
+
+def _sum_movements(db, match):
+    totals = {}
+    for row in db.stock_movements.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$productId", "total": {"$sum": "$delta"}, "count": {"$sum": 1}}},
+    ]):
+        totals[row['_id']] = (row['total'], row['count'])
+    return totals
+
+
+def _snapshot_quantities(db, product_ids):
+    """{productId: quantity} from the current snapshots of *product_ids*."""
+    return {
+        row['productId']: row.get('quantity', 0)
+        for row in db.stock_snapshots.find({"productId": {"$in": product_ids}}, {"productId": 1, "quantity": 1})
+    }
+
+
+def compact_snapshots(db):
+    """
+    Delete the superseded generations left by runs that inserted a new snapshot per product,
+    keeping each product's newest. Returns the number removed (0 once done).
+    """
+    removed = 0
+    for row in db.stock_snapshots.aggregate([
+        {"$sort": {"productId": 1, "at": -1}},
+        {"$group": {"_id": "$productId", "keep": {"$first": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        removed += db.stock_snapshots.delete_many({"productId": row['_id'], "_id": {"$ne": row['keep']}}).deleted_count
+    return removed
+
+
+def last_snapshot_cutoff(db):
+    run = db.stock_snapshot_runs.find_one(sort=[("cutoff", -1)])
+    return run['cutoff'] if run else None
+
+
+def record_opening_balances(db, user=None, batch_size=LEDGER_BATCH_SIZE):
+    """
+    Open the ledger for products that predate it: one opening movement per product so that its
+    movements sum to the current quantity. New products are opened when they are created.
+    Pending products are read a batch at a time in _id order.
+    """
+    opened, last_id = 0, None
+    query = {"ledgerOpenedAt": {"$exists": False}}
+    while True:
+        page = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        chunk = list(db.products.find(page, {"quantity": 1}).sort("_id", 1).limit(batch_size))
+        if not chunk:
+            break
+        last_id = chunk[-1]['_id']
+        ids = [p['_id'] for p in chunk]
+        recorded = _sum_movements(db, {"productId": {"$in": ids}})
+        opening = []
+        for product in chunk:
+            try:
+                quantity = float(product.get('quantity', 0) or 0)
+            except (TypeError, ValueError):
+                quantity = 0.0
+            opening.append((product['_id'], quantity - recorded.get(product['_id'], (0, 0))[0]))
+        record_movements(db, opening, REASON_OPENING, 'system', None, user, note="Opening balance")
+        db.products.update_many({"_id": {"$in": ids}}, {"$set": {"ledgerOpenedAt": utc_now()}})
+        opened += len(chunk)
+    return opened
+
+
+def take_snapshot(db):
+    """
+    Fold movements since the previous snapshot run into each product's current snapshot.
+    Only products that moved are touched; everyone else's snapshot is still current.
+    """
+    previous = last_snapshot_cutoff(db)
+    # Trail "now" so movements stamped just before the cutoff but still being inserted are not skipped
+    cutoff = utc_now() - timedelta(seconds=RECONCILE_SETTLE_SECONDS)
+    match = {"at": {"$lte": cutoff}}
+    if previous:
+        match["at"]["$gt"] = previous
+
+    moved = _sum_movements(db, match)
+    if moved:
+        db.stock_snapshots.bulk_write([
+            UpdateOne(
+                {"productId": product_id},
+                {"$inc": {"quantity": total, "movements": count}, "$set": {"at": cutoff}},
+                upsert=True,
+            )
+            for product_id, (total, count) in moved.items()
+        ], ordered=False)
+
+    db.stock_snapshot_runs.insert_one({"cutoff": cutoff, "products": len(moved), "createdAt": utc_now()})
+    logger.info(f"[stock-ledger] Snapshot at {to_iso_string(cutoff)} covering {len(moved)} products")
+    return {"cutoff": to_iso_string(cutoff), "products": len(moved)}
+
+
+def reconcile_stock(db, user=None, fix=False):
+    """
+    Compare every product's quantity with its ledger balance (latest snapshot + later movements).
+    Products without history get an opening balance first; products written in the last minute are skipped.
+    With fix=True the ledger is brought in line by a reconciliation movement (the product quantity is
+    treated as the physical truth). The run and its drifts are stored in stock_reconciliations.
+    """
+    record_opening_balances(db, user)
+    cutoff = last_snapshot_cutoff(db)
+    recent = _sum_movements(db, {"at": {"$gt": cutoff}} if cutoff else {})
+    settle_before = utc_now() - timedelta(seconds=RECONCILE_SETTLE_SECONDS)
+
+    drifts = []
+    checked, last_id = 0, None
+    while True:
+        page = {} if last_id is None else {"_id": {"$gt": last_id}}
+        batch = list(db.products.find(page, {"name": 1, "quantity": 1, "updatedAt": 1})
+                     .sort("_id", 1).limit(LEDGER_BATCH_SIZE))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+        snapshots = _snapshot_quantities(db, [p['_id'] for p in batch]) if cutoff else {}
+        for product in batch:
+            updated = product.get('updatedAt')
+            if updated is not None and updated.tzinfo is None:
+                updated = updated.replace(tzinfo=settle_before.tzinfo)
+            if updated is not None and updated > settle_before:
+                continue
+            checked += 1
+            try:
+                quantity = float(product.get('quantity', 0) or 0)
+            except (TypeError, ValueError):
+                quantity = 0.0
+            ledger = snapshots.get(product['_id'], 0) + recent.get(product['_id'], (0, 0))[0]
+            if abs(quantity - ledger) > DRIFT_TOLERANCE:
+                drifts.append({
+                    "productId": product['_id'],
+                    "name": product.get('name'),
+                    "quantity": quantity,
+                    "ledgerQuantity": ledger,
+                    "drift": quantity - ledger,
+                })
+
+    now = utc_now()
+    run = {
+        "checkedProducts": checked,
+        "driftCount": len(drifts),
+        "drifts": drifts[:500],
+        "fixed": bool(fix and drifts),
+        "createdAt": now,
+        "createdBy": (user or {}).get('username'),
+    }
+    result = db.stock_reconciliations.insert_one(run)
+    if fix and drifts:
+        record_movements(db, [(d['productId'], d['drift']) for d in drifts], REASON_RECONCILIATION,
+                         'reconciliation', result.inserted_id, user, note="Ledger aligned to counted stock")
+    if drifts:
+        logger.warning(f"[stock-ledger] Reconciliation found drift on {len(drifts)} of {checked} products")
+    return run
+
+
+def serialize_reconciliation(run):
+    return {
+        "id": str(run['_id']) if run.get('_id') else None,
+        "checkedProducts": run.get('checkedProducts', 0),
+        "driftCount": run.get('driftCount', 0),
+        "fixed": run.get('fixed', False),
+        "drifts": [{**d, "productId": str(d['productId'])} for d in run.get('drifts', [])],
+        "createdAt": to_iso_string(run.get('createdAt')),
+        "createdBy": run.get('createdBy'),
+    }
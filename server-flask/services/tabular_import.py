@@ -0,0 +1,84 @@
+"""
+Tabular Import Helpers
+Reads uploaded CSV/XLSX files into string DataFrames and maps free-form
+spreadsheet headers onto our field names. Shared by the bulk import services.
+"""
+
+import io
+import os
+import re
+
+import pandas as pd
+
+IMPORT_MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '20000'))
+IMPORT_CHUNK_SIZE = 1000
+
+CSV_EXTENSIONS = ('.csv', '.txt')
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def header_key(header):
+    """'Price (Inclusive)' -> 'priceinclusive'"""
+    return re.sub(r'[^a-z0-9]', '', str(header).lower())
+
+
+def read_table(file):
+    """
+    Read a werkzeug FileStorage (CSV or XLSX) into a DataFrame of stripped strings.
+    Raises ValueError for unsupported, oversized or empty files.
+    """
+    if not file or not file.filename:
+        raise ValueError('No file uploaded')
+
+    filename = file.filename.lower()
+    data = file.read(IMPORT_MAX_FILE_SIZE + 1)
+    if len(data) > IMPORT_MAX_FILE_SIZE:
+        raise ValueError('File too large. Maximum size is 10 MB')
+
+    try:
+        if filename.endswith(CSV_EXTENSIONS):
+            frame = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        elif filename.endswith(EXCEL_EXTENSIONS):
+            frame = pd.read_excel(io.BytesIO(data), dtype=str, keep_default_na=False, engine='openpyxl')
+        else:
+            raise ValueError('Unsupported file type. Upload a .csv or .xlsx file')
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f'Could not read file: {e}')
+
+    if frame.empty:
+        raise ValueError('File has no data rows')
+    if len(frame) > IMPORT_MAX_ROWS:
+        raise ValueError(f'Too many rows ({len(frame)}); limit is {IMPORT_MAX_ROWS} per import')
+
+    return frame.apply(lambda col: col.astype(str).str.strip())
+
+
+def map_columns(frame, aliases):
+    """
+    Rename spreadsheet columns to field names using {field: [header keys...]}.
+    Unrecognised columns are dropped; recognised fields missing from the file are added empty.
+    """
+    lookup = {alias: field for field, keys in aliases.items() for alias in keys}
+    renamed = {}
+    for column in frame.columns:
+        field = lookup.get(header_key(column))
+        if field and field not in renamed.values():
+            renamed[column] = field
+    frame = frame[list(renamed)].rename(columns=renamed)
+    for field in aliases:
+        if field not in frame.columns:
+            frame[field] = ''
+    return frame
+
+
+def row_numbers(frame):
+    """Spreadsheet row numbers (header is row 1) aligned with the frame index."""
+    return frame.index.to_series() + 2
+
+
+def chunked(items, size=IMPORT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,77 @@
+"""
+Warranty Renewal Prices
+Each warranty stores its product's warranty renewal price as `renewalPrice`,
+so the admin listing reads it straight off the warranty instead of loading
+products. It is stamped when checkout creates the warranty and re-stamped
+whenever the product's warrantyRenewalPrice changes. backfill_renewal_prices()
+prices warranties written before the field was kept.
+"""
+
+import logging
+
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+
+from utils.tzutils import utc_now
+
+logger = logging.getLogger(__name__)
+
+RENEWAL_PRICE_BATCH_SIZE = 1000
+
+
+def _product_id_values(product_id):
+    # Older warranties hold the product id as a string
+    return [product_id, str(product_id)]
+
+
+def stamp_renewal_prices(db, prices):
+    """Re-stamp the warranties of each product in {productId: renewal price} in one bulk_write."""
+    if not prices:
+        return 0
+    now = utc_now()
+    ops = [
+        UpdateMany({"productId": {"$in": _product_id_values(product_id)}},
+                   {"$set": {"renewalPrice": float(price or 0), "renewalPriceAt": now}})
+        for product_id, price in prices.items()
+    ]
+    return db.warranties.bulk_write(ops, ordered=False).modified_count
+
+
+def backfill_renewal_prices(db, batch_size=RENEWAL_PRICE_BATCH_SIZE):
+    """
+    Price warranties that have never been stamped, a batch at a time: by productId, else by the
+    product name on the warranty. A product without a renewal price keeps the warranty's own
+    renewalPrice. Returns the number of warranties priced.
+    """
+    priced = 0
+    while True:
+        batch = list(db.warranties.find(
+            {"renewalPriceAt": {"$exists": False}}, {"productId": 1, "productName": 1, "renewalPrice": 1}
+        ).limit(batch_size))
+        if not batch:
+            break
+
+        ids = {ObjectId(w['productId']) for w in batch if w.get('productId') and ObjectId.is_valid(w['productId'])}
+        names = {w['productName'] for w in batch if w.get('productName')}
+        by_id, by_name = {}, {}
+        query = {"$or": [{"_id": {"$in": list(ids)}}, {"name": {"$in": list(names)}}]}
+        for product in db.products.find(query, {"name": 1, "warrantyRenewalPrice": 1}):
+            by_id[product['_id']] = product
+            by_name.setdefault(product.get('name'), product)
+
+        now = utc_now()
+        ops = []
+        for warranty in batch:
+            product_id = warranty.get('productId')
+            product = by_id.get(ObjectId(product_id)) if product_id and ObjectId.is_valid(product_id) else None
+            product = product or by_name.get(warranty.get('productName'))
+            price = float((product or {}).get('warrantyRenewalPrice', 0) or 0)
+            if price == 0:
+                price = float(warranty.get('renewalPrice', 0) or 0)
+            ops.append(UpdateOne({"_id": warranty['_id']},
+                                 {"$set": {"renewalPrice": price, "renewalPriceAt": now}}))
+        db.warranties.bulk_write(ops, ordered=False)
+        priced += len(ops)
+    if priced:
+        logger.info(f"[warranties] Stamped renewal prices on {priced} warranties")
+    return priced
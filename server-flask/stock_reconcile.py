@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Stock ledger maintenance job.
+Folds recent stock_movements into snapshots and checks every product's
+quantity against its ledger balance, storing the result in stock_reconciliations.
+Schedule it (e.g. nightly) next to the web service.
+
+Usage: python stock_reconcile.py [--no-snapshot] [--fix]
+"""
+
+import logging
+import sys
+
+from flask import Flask
+
+from config import Config
+from database import connect_db
+from services.stock_ledger import take_snapshot, reconcile_stock
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    app = Flask('stock-reconcile')
+    app.config.from_object(Config)
+    db = connect_db(app)
+    if db is None:
+        logger.error("Stock reconcile could not connect to MongoDB")
+        sys.exit(1)
+
+    user = {"userId": None, "username": "stock-reconcile"}
+    run = reconcile_stock(db, user, fix='--fix' in sys.argv)
+    logger.info(f"[stock-ledger] Checked {run['checkedProducts']} products, drift on {run['driftCount']}")
+    for drift in run['drifts'][:20]:
+        logger.info(f"[stock-ledger]   {drift['name']}: quantity {drift['quantity']} vs ledger {drift['ledgerQuantity']}")
+
+    if '--no-snapshot' not in sys.argv:
+        take_snapshot(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test barcode/QR encoding against known reference values.
+Runs offline: no database or server needed.
+"""
+
+from services import barcode_service
+
+
+def test_code128_encoding():
+    """Code128 symbol values match the reference encoding (sets B and C)"""
+    cases = {
+        "PROD": [104, 48, 50, 47, 36, 22, 106],
+        "12345678": [105, 12, 34, 56, 78, 47, 106],
+        "PRODABC12345678": [104, 48, 50, 47, 36, 33, 34, 35, 99, 12, 34, 56, 78, 29, 106],
+        "A1234B": [104, 33, 17, 18, 19, 20, 34, 90, 106],
+    }
+    for value, expected in cases.items():
+        actual = barcode_service.code128_values(value)
+        assert actual == expected, f"{value}: {actual} != {expected}"
+        print(f"  ✅ code128 {value}")
+
+
+def test_ean13_encoding():
+    """EAN-13 check digit is computed/validated and the symbol is 95 modules"""
+    assert barcode_service.normalize_ean13("400638133393") == "4006381333931"
+    assert barcode_service.is_ean13("4006381333931")
+    assert not barcode_service.is_ean13("4006381333932")
+    modules = barcode_service.ean13_modules("4006381333931")
+    assert len(modules) == 95
+    assert modules.startswith("101") and modules.endswith("101")
+    print("  ✅ ean13 4006381333931")
+
+
+def test_render_cache():
+    """Identical payloads are served from the LRU cache"""
+    before = barcode_service.cache_info().hits
+    first = barcode_service.render_qr({"id": "abc", "price": 10}, fmt="png")
+    second = barcode_service.render_qr({"price": 10, "id": "abc"}, fmt="png")
+    assert first == second and first.startswith(b"\x89PNG")
+    assert barcode_service.cache_info().hits == before + 1
+    svg = barcode_service.render_barcode("PROD123", fmt="svg")
+    assert svg.startswith(b"<svg")
+    print("  ✅ render cache")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("BARCODE SERVICE TEST")
+    print("=" * 60)
+    test_code128_encoding()
+    test_ean13_encoding()
+    test_render_cache()
+    print("\n✅ ALL BARCODE TESTS PASSED")
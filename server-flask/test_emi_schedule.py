@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Property tests for the EMI schedule engine (services/emi_schedule.py).
+Runs offline: no database or server needed. Install the test tools with
+`pip install -r requirements-dev.txt`.
+"""
+
+import calendar
+from datetime import datetime, timezone
+
+import numpy as np
+from hypothesis import given, settings, strategies as st
+
+from services import emi_schedule
+from services.emi_schedule import INTEREST_FLAT, INTEREST_REDUCING
+from utils.tzutils import utc_to_ist
+
+principals = st.decimals(min_value='100', max_value='5000000', places=2).map(float)
+rates = st.one_of(st.just(0.0), st.floats(min_value=0.5, max_value=36, allow_nan=False).map(lambda r: round(r, 2)))
+tenures = st.integers(min_value=1, max_value=60)
+methods = st.sampled_from([INTEREST_FLAT, INTEREST_REDUCING])
+starts = st.datetimes(min_value=datetime(2020, 1, 1), max_value=datetime(2035, 12, 31)).map(
+    lambda d: d.replace(tzinfo=timezone.utc)
+)
+
+
+@settings(max_examples=300, deadline=None)
+@given(principals, rates, tenures, methods, starts)
+def test_schedule_repays_principal(principal, rate, tenure, method, start):
+    """Principal parts sum to the financed amount; every amount is principal plus interest"""
+    installments = emi_schedule.build_installments(principal, tenure, start, rate, method)
+    assert len(installments) == tenure
+    assert abs(sum(i['principal'] for i in installments) - principal) < 0.005
+    for i in installments:
+        assert i['principal'] >= 0 and i['interest'] >= 0
+        assert abs(i['amount'] - (i['principal'] + i['interest'])) < 0.005
+    if rate == 0:
+        assert all(i['interest'] == 0 for i in installments)
+
+
+@settings(max_examples=300, deadline=None)
+@given(principals, rates, tenures, methods, starts)
+def test_installments_are_level(principal, rate, tenure, method, start):
+    """All but the last installment equal the monthly EMI; the last only absorbs rounding"""
+    installments = emi_schedule.build_installments(principal, tenure, start, rate, method)
+    emi = installments[0]['amount']
+    assert all(i['amount'] == emi for i in installments[:-1])
+    # Up to a paisa of EMI and interest rounding per month, compounded on a reducing balance
+    growth = 1 + rate / 1200 if method == INTEREST_REDUCING else 1
+    drift = sum(0.01 * growth ** k for k in range(tenure))
+    assert abs(installments[-1]['amount'] - emi) <= drift + 0.01
+
+
+@settings(max_examples=200, deadline=None)
+@given(principals, rates, st.integers(min_value=2, max_value=60))
+def test_reducing_costs_no_more_than_flat(principal, rate, tenure):
+    """At the same nominal rate, reducing-balance interest never exceeds flat interest"""
+    start = datetime(2026, 1, 15, tzinfo=timezone.utc)
+    flat = emi_schedule.schedule_totals(emi_schedule.build_installments(principal, tenure, start, rate, INTEREST_FLAT))
+    reducing = emi_schedule.schedule_totals(emi_schedule.build_installments(principal, tenure, start, rate, INTEREST_REDUCING))
+    assert reducing['totalInterest'] <= flat['totalInterest'] + 0.01 * tenure
+
+
+@settings(max_examples=300, deadline=None)
+@given(starts, tenures)
+def test_due_dates_follow_calendar_months(start, tenure):
+    """One due date per calendar month, on the start day or the month's last day"""
+    local_start = utc_to_ist(start)
+    for offset, due in enumerate(emi_schedule.due_dates(start, tenure), start=1):
+        local = utc_to_ist(due)
+        month_index = local_start.month - 1 + offset
+        assert (local.year, local.month) == (local_start.year + month_index // 12, month_index % 12 + 1)
+        assert local.day == min(local_start.day, calendar.monthrange(local.year, local.month)[1])
+        assert local.time() == local_start.time()
+
+
+@settings(max_examples=100, deadline=None)
+@given(st.lists(st.tuples(principals, rates, tenures, methods), min_size=1, max_size=40))
+def test_batch_matches_single_plan(plans):
+    """schedule_arrays over many plans gives each plan's single-plan schedule"""
+    amount, principal, interest = emi_schedule.schedule_arrays(
+        [p[0] for p in plans], [p[1] for p in plans], [p[2] for p in plans],
+        [p[3] == INTEREST_REDUCING for p in plans],
+    )
+    start = datetime(2026, 3, 31, tzinfo=timezone.utc)
+    for row, (p, r, n, m) in enumerate(plans):
+        single = emi_schedule.build_installments(p, n, start, r, m)
+        assert np.allclose(amount[row, :n], [i['amount'] for i in single])
+        assert np.allclose(principal[row, :n], [i['principal'] for i in single])
+        assert np.allclose(interest[row, :n], [i['interest'] for i in single])
+        assert not amount[row, n:].any()
+
+
+@settings(max_examples=200, deadline=None)
+@given(principals, rates, st.integers(min_value=2, max_value=36), methods,
+       st.integers(min_value=0, max_value=35), st.floats(min_value=0.01, max_value=0.99),
+       st.sampled_from(emi_schedule.PREPAY_MODES))
+def test_prepayment_recomputes_open_installments(principal, rate, tenure, method, paid, share, mode):
+    """Prepaying reduces outstanding principal by exactly the prepayment and keeps paid installments"""
+    start = datetime(2026, 1, 31, tzinfo=timezone.utc)
+    installments = emi_schedule.build_installments(principal, tenure, start, rate, method)
+    paid = min(paid, tenure - 1)
+    for i in installments[:paid]:
+        i.update(status='completed', paidAmount=i['amount'])
+    plan = {"installments": installments, "interestRate": rate, "interestMethod": method, "startDate": start}
+
+    outstanding = emi_schedule.outstanding_principal(installments)
+    prepayment = max(0.01, round(outstanding * share, 2))
+    rebuilt = emi_schedule.recompute_after_prepayment(plan, prepayment, mode)
+
+    assert rebuilt[:paid] == installments[:paid]
+    assert abs(emi_schedule.outstanding_principal(rebuilt) - (outstanding - prepayment)) < 0.005
+    assert [i['installmentNo'] for i in rebuilt] == list(range(1, len(rebuilt) + 1))
+    assert len(rebuilt) <= tenure
+    if mode == emi_schedule.PREPAY_REDUCE_EMI and len(rebuilt) > paid:
+        assert len(rebuilt) == tenure
+        assert rebuilt[paid]['dueDate'] == installments[paid]['dueDate']
+
+
+@settings(max_examples=200, deadline=None)
+@given(principals, tenures, st.lists(st.sampled_from(['pending', 'partial', 'overdue', 'completed', 'paid']),
+                                     min_size=60, max_size=60))
+def test_plan_summary_counters(principal, tenure, statuses):
+    """Installment counters partition the schedule; paid and outstanding add up to the total"""
+    installments = emi_schedule.build_installments(principal, tenure, datetime(2026, 1, 15, tzinfo=timezone.utc))
+    for i, status in zip(installments, statuses):
+        paid = i['amount'] if status in emi_schedule.PAID_STATUSES else (round(i['amount'] / 2, 2) if status == 'partial' else 0)
+        i.update(status=status, paidAmount=paid)
+    summary = emi_schedule.plan_summary(installments)
+    assert summary['installmentCount'] == tenure
+    assert summary['paidInstallments'] + summary['partialInstallments'] + summary['overdueInstallments'] <= tenure
+    assert summary['paidInstallments'] == sum(s in emi_schedule.PAID_STATUSES for s in statuses[:tenure])
+    assert abs(summary['totalPaid'] + summary['outstandingAmount'] - sum(i['amount'] for i in installments)) < 0.01
+
+
+def test_prepayment_rejects_out_of_order_schedule():
+    """A completed installment after an open one cannot be renumbered around, so prepaying is refused"""
+    start = datetime(2026, 1, 31, tzinfo=timezone.utc)
+    installments = emi_schedule.build_installments(30000, 6, start)
+    installments[2].update(status='completed', paidAmount=installments[2]['amount'])
+    plan = {"installments": installments, "interestRate": 0, "interestMethod": INTEREST_FLAT, "startDate": start}
+    try:
+        emi_schedule.recompute_after_prepayment(plan, 1000)
+    except ValueError:
+        print("  ✅ out-of-order prepayment refused")
+    else:
+        raise AssertionError('prepayment should be refused')
+
+
+def test_legacy_paid_installments_are_settled():
+    """Installments marked 'paid' by older admin approvals count as settled, like 'completed'"""
+    start = datetime(2026, 1, 31, tzinfo=timezone.utc)
+    installments = emi_schedule.build_installments(30000, 6, start)
+    installments[0].update(status='paid', paidAmount=installments[0]['amount'])
+    assert emi_schedule.outstanding_principal(installments) == 25000
+    plan = {"installments": installments, "interestRate": 0, "interestMethod": INTEREST_FLAT, "startDate": start}
+    rebuilt = emi_schedule.recompute_after_prepayment(plan, 5000)
+    assert rebuilt[0] is installments[0]
+    assert [i['installmentNo'] for i in rebuilt] == [1, 2, 3, 4, 5, 6]
+    assert round(sum(i['principal'] for i in rebuilt[1:]), 2) == 20000
+    print("  ✅ legacy 'paid' installments settled")
+
+
+def test_known_schedules():
+    """Reference values: zero-interest split and a standard reducing-balance EMI"""
+    start = datetime(2026, 1, 31, 6, 30, tzinfo=timezone.utc)
+    flat = emi_schedule.build_installments(10000, 3, start, 0, INTEREST_FLAT)
+    assert [i['amount'] for i in flat] == [3333.33, 3333.33, 3333.34]
+    assert [utc_to_ist(i['dueDate']).day for i in flat] == [28, 31, 30]
+
+    reducing = emi_schedule.build_installments(100000, 12, start, 12, INTEREST_REDUCING)
+    assert reducing[0]['amount'] == 8884.88
+    assert reducing[0]['interest'] == 1000.0
+    assert emi_schedule.tenure_for_amount(100000, 12, 8884.88, INTEREST_REDUCING) == 12
+    print("  ✅ known schedules")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("EMI SCHEDULE ENGINE TEST")
+    print("=" * 60)
+    test_known_schedules()
+    test_prepayment_rejects_out_of_order_schedule()
+    test_legacy_paid_installments_are_settled()
+    for test in (test_schedule_repays_principal, test_installments_are_level, test_reducing_costs_no_more_than_flat,
+                 test_due_dates_follow_calendar_months, test_batch_matches_single_plan,
+                 test_prepayment_recomputes_open_installments, test_plan_summary_counters):
+        test()
+        print(f"  ✅ {test.__name__}")
+    print("\n✅ ALL EMI SCHEDULE TESTS PASSED")
@@ -60,7 +60,9 @@ export default function App() {
 
   const [recentActivity, setRecentActivity] = useState([]);
   const [warranties, setWarranties] = useState([]);
+  const [warrantyCounts, setWarrantyCounts] = useState(null);
   const [emiPlans, setEmiPlans] = useState([]);
+  const [emiPlanCounts, setEmiPlanCounts] = useState(null);
 
   // Custom hooks
   const {
@@ -994,6 +996,7 @@ Esc: Close modals/dialogs`;
       if (response.ok) {
         const data = await response.json();
         setWarranties(data.warranties || []);
+        setWarrantyCounts(data.counts || null);
       }
     } catch (err) {
       console.warn('[App] Warranties fetch failed:', err.message);
@@ -1007,6 +1010,7 @@ Esc: Close modals/dialogs`;
       if (response.ok) {
         const data = await response.json();
         setEmiPlans(data.emiPlans || []);
+        setEmiPlanCounts(data.counts || null);
       }
     } catch (err) {
       console.warn('[App] EMI plans fetch failed:', err.message);
@@ -1209,8 +1213,10 @@ Esc: Close modals/dialogs`;
       totalCustomers: customers.length,
       totalSales: invoices.length,
       lowStockCount: products.filter(p => p.quantity > 0 && p.quantity < p.minStock).length,
-      activeWarranties: warranties.filter(w => w.status === 'active').length,
-      activeEMIPlans: emiPlans.filter(p => p.status === 'active').length
+      // The warranty listing is paginated; its counts cover every warranty
+      activeWarranties: warrantyCounts ? warrantyCounts.active : warranties.filter(w => w.status === 'active').length,
+      // The EMI listing is paginated; its counts cover every plan
+      activeEMIPlans: emiPlanCounts ? emiPlanCounts.active : emiPlans.filter(p => p.status === 'active').length
     };
 
     const lowStockProducts = products.filter(p => p.quantity > 0 && p.quantity < p.minStock);
@@ -9,26 +9,48 @@ import { apiGet, apiPatch } from '../../utils/api';
 import { formatCurrency0 } from '../../constants';
 import './emi.css';
 
+const PAGE_SIZE = 50;
+
 const EMITracker = () => {
   const [emiPlans, setEmiPlans] = useState([]);
-  const [filteredPlans, setFilteredPlans] = useState([]);
+  const [counts, setCounts] = useState({ total: 0, active: 0, closed: 0, defaulted: 0 });
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [filterStatus, setFilterStatus] = useState('all');
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
 
   const [selectedPlan, setSelectedPlan] = useState(null);
 
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
   useEffect(() => {
     fetchEMIPlans();
-  }, []);
+  }, [filterStatus, debouncedSearch]);
+
+  // Filters and search run on the server; "overdue" lists plans with any overdue amount
+  const buildQuery = (cursor) => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (filterStatus === 'overdue') params.set('minOverdue', '0.01');
+    else if (filterStatus !== 'all') params.set('status', filterStatus);
+    if (debouncedSearch) params.set('search', debouncedSearch);
+    if (cursor) params.set('cursor', cursor);
+    return `/api/admin/emi-plans?${params.toString()}`;
+  };
 
-  const fetchEMIPlans = async () => {
+  const fetchEMIPlans = async (cursor = null) => {
     try {
       setLoading(true);
-      const response = await apiGet('/api/admin/emi-plans'); 
-      setEmiPlans(response.emiPlans || []);
-      setFilteredPlans(response.emiPlans || []);
+      setError(null);
+      const response = await apiGet(buildQuery(cursor));
+      const page = response.emiPlans || [];
+      setEmiPlans(prev => (cursor ? [...prev, ...page] : page));
+      setNextCursor(response.nextCursor || null);
+      if (response.counts) setCounts(response.counts);
     } catch (err) {
       setError(err.message);
       console.error('Failed to fetch EMI plans:', err);
@@ -37,49 +59,34 @@ const EMITracker = () => {
     }
   };
 
-  const handleViewDetails = (plan) => {
+  const handleViewDetails = async (plan) => {
+    // The listing carries summary fields only; the schedule comes from the plan itself
     setSelectedPlan(plan);
+    try {
+      const detail = await apiGet(`/api/emi/${plan.id}`);
+      setSelectedPlan(current => (current && current.id === plan.id ? { ...plan, installments: detail.installments || [] } : current));
+    } catch (err) {
+      console.error('Failed to fetch EMI schedule:', err);
+    }
   };
 
   const handleBackToList = () => {
     setSelectedPlan(null);
   };
 
-  useEffect(() => {
-    let filtered = emiPlans;
-
-    if (filterStatus !== 'all') {
-      filtered = filtered.filter(p => p.status?.toLowerCase() === filterStatus);
-    }
-
-    if (searchTerm) {
-      filtered = filtered.filter(p =>
-        p.customerName?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        p.billNumber?.includes(searchTerm)
-      );
-    }
-
-    setFilteredPlans(filtered);
-  }, [emiPlans, filterStatus, searchTerm]);
-
   if (error) {
     return (
       <div className="emi-tracker-container">
         <div className="error-state">
           <Icon name="alert-circle" size={32} />
           <p>{error}</p>
-          <button onClick={fetchEMIPlans} className="retry-btn">Retry</button>
+          <button onClick={() => fetchEMIPlans()} className="retry-btn">Retry</button>
         </div>
       </div>
     );
   }
 
-  const stats = {
-    total: emiPlans.length,
-    active: emiPlans.filter(p => p.status === 'active').length,
-    closed: emiPlans.filter(p => p.status === 'closed').length,
-    defaulted: emiPlans.filter(p => p.status === 'defaulted').length
-  };
+  const stats = counts;
 
   if (selectedPlan) {
     const progress = (selectedPlan.totalPaid / (selectedPlan.totalAmount || 1)) * 100;
@@ -200,7 +207,7 @@ const EMITracker = () => {
         </div>
         <button 
           className={`refresh-btn-premium ${loading ? 'spinning' : ''}`} 
-          onClick={fetchEMIPlans}
+          onClick={() => fetchEMIPlans()}
           disabled={loading}
           style={{
             display: 'flex',
@@ -271,17 +278,18 @@ const EMITracker = () => {
             <option value="active">Active</option>
             <option value="closed">Closed</option>
             <option value="defaulted">Defaulted</option>
+            <option value="overdue">Has Overdue Dues</option>
           </select>
         </div>
       </div>
 
       {/* Plans List */}
-      {loading ? (
+      {loading && emiPlans.length === 0 ? (
         <div className="emi-loading">
           <div className="spinner"></div>
           <p>Loading EMI plans...</p>
         </div>
-      ) : filteredPlans.length === 0 ? (
+      ) : emiPlans.length === 0 ? (
         <div className="emi-empty">
           <Icon name="info" size={48} />
           <p>No EMI plans found matching your criteria</p>
@@ -302,7 +310,7 @@ const EMITracker = () => {
               </tr>
             </thead>
             <tbody>
-              {filteredPlans.map(plan => (
+              {emiPlans.map(plan => (
                 <tr key={plan.id || plan._id}>
                   <td className="font-mono">{plan.billNumber}</td>
                   <td>
@@ -358,6 +366,13 @@ const EMITracker = () => {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <div style={{ display: 'flex', justifyContent: 'center', padding: '16px' }}>
+              <button className="retry-btn" onClick={() => fetchEMIPlans(nextCursor)} disabled={loading}>
+                {loading ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
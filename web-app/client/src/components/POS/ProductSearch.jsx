@@ -69,7 +69,7 @@ export default function ProductSearch({ products, onProductSelect }) {
           filteredProducts.map(product => {
             const isOut = product.quantity === 0;
             const isLow = product.quantity > 0 && product.quantity < (product.minStock || 5);
-            const photoUrl = normalizePhotoUrl(product.photo);
+            const photoUrl = normalizePhotoUrl(product.thumbnail || product.photo);
 
             return (
               <div 
@@ -210,7 +210,7 @@ export default function ProductCard({
           {/* ── Product thumbnail (Cloudinary CDN or placeholder) ────────── */}
           {(() => {
             const firstPhoto = product.photos?.find(p => p.url)?.url || product.photo;
-            const thumb = normalizePhotoUrl(firstPhoto);
+            const thumb = normalizePhotoUrl(product.thumbnail || firstPhoto);
 
             if (thumb && onUploadPhoto && canEditProp) {
               // Editable thumbnail — clicking opens the file picker
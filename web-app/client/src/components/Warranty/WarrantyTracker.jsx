@@ -9,26 +9,49 @@ import { apiGet, apiPatch, apiPost } from '../../utils/api';
 import WarrantyCard from './WarrantyCard';
 import './warranty.css';
 
+const PAGE_SIZE = 50;
+const EXPIRING_SOON_DAYS = 30;
+
 const WarrantyTracker = () => {
   const [warranties, setWarranties] = useState([]);
-  const [filteredWarranties, setFilteredWarranties] = useState([]);
+  const [counts, setCounts] = useState({ total: 0, active: 0, expiringSoon: 0, expired: 0, claimed: 0 });
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [filterStatus, setFilterStatus] = useState('all');
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
 
   const [viewMode, setViewMode] = useState('table'); // 'table' or 'cards'
 
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
   useEffect(() => {
     fetchWarranties();
-  }, []);
+  }, [filterStatus, debouncedSearch]);
+
+  // Filters and search run on the server; "expiring-soon" lists active warranties ending within 30 days
+  const buildQuery = (cursor) => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (filterStatus === 'expiring-soon') params.set('expiringWithinDays', String(EXPIRING_SOON_DAYS));
+    else if (filterStatus !== 'all') params.set('status', filterStatus);
+    if (debouncedSearch) params.set('search', debouncedSearch);
+    if (cursor) params.set('cursor', cursor);
+    return `/api/warranties?${params.toString()}`;
+  };
 
-  const fetchWarranties = async () => {
+  const fetchWarranties = async (cursor = null) => {
     try {
       setLoading(true);
-      const response = await apiGet('/api/warranties');
-      setWarranties(response.warranties || []);
-      setFilteredWarranties(response.warranties || []);
+      setError(null);
+      const response = await apiGet(buildQuery(cursor));
+      const page = response.warranties || [];
+      setWarranties(prev => (cursor ? [...prev, ...page] : page));
+      setNextCursor(response.nextCursor || null);
+      if (response.counts) setCounts(response.counts);
     } catch (err) {
       setError(err.message);
       console.error('Failed to fetch warranties:', err);
@@ -37,25 +60,6 @@ const WarrantyTracker = () => {
     }
   };
 
-  useEffect(() => {
-    let filtered = warranties;
-
-    if (filterStatus !== 'all') {
-      filtered = filtered.filter(w => w.status === filterStatus);
-    }
-
-    if (searchTerm) {
-      filtered = filtered.filter(w =>
-        w.productName?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        w.serialNumber?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        w.customerName?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        w.invoiceNumber?.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-    }
-
-    setFilteredWarranties(filtered);
-  }, [warranties, filterStatus, searchTerm]);
-
   const handleStatusUpdate = async (warrantyId, newStatus) => {
     try {
       await apiPatch(`/api/warranties/${warrantyId}`, { status: newStatus });
@@ -76,7 +80,7 @@ const WarrantyTracker = () => {
       try {
         const response = await apiPost(`/api/warranties/${warranty._id}/renew`, { paymentMethod: 'Cash' });
         alert(response.message || 'Warranty renewed successfully');
-        fetchWarranties(); // Refresh list to see new expiry
+        fetchWarranties(); // Refresh from the first page to see new expiry
       } catch (err) {
         console.error('Failed to renew warranty:', err);
         alert(err.message || 'Failed to renew warranty');
@@ -90,18 +94,13 @@ const WarrantyTracker = () => {
         <div className="error-state">
           <Icon name="alert-circle" size={32} />
           <p>{error}</p>
-          <button onClick={fetchWarranties} className="retry-btn">Retry</button>
+          <button onClick={() => fetchWarranties()} className="retry-btn">Retry</button>
         </div>
       </div>
     );
   }
 
-  const stats = {
-    total: warranties.length,
-    active: warranties.filter(w => w.status === 'active').length,
-    expiringSoon: warranties.filter(w => w.status === 'expiring-soon').length,
-    expired: warranties.filter(w => w.status === 'expired').length
-  };
+  const stats = counts;
 
   return (
     <div className="warranty-container">
@@ -134,7 +133,7 @@ const WarrantyTracker = () => {
         <div style={{ display: 'flex', gap: '12px', alignItems: 'center' }}>
           <button 
             className={`refresh-btn-premium ${loading ? 'spinning' : ''}`} 
-            onClick={fetchWarranties}
+            onClick={() => fetchWarranties()}
             disabled={loading}
             style={{
               display: 'flex',
@@ -211,7 +210,7 @@ const WarrantyTracker = () => {
           <Icon name="search" size={18} />
           <input
             type="text"
-            placeholder="Search by product, customer, or serial..."
+            placeholder="Search by customer, product, invoice or phone..."
             value={searchTerm}
             onChange={(e) => setSearchTerm(e.target.value)}
           />
@@ -222,17 +221,18 @@ const WarrantyTracker = () => {
             <option value="active">Active Only</option>
             <option value="expiring-soon">Expiring Soon</option>
             <option value="expired">Expired</option>
+            <option value="claimed">Claimed</option>
           </select>
         </div>
       </div>
 
       {/* Content */}
-      {loading ? (
+      {loading && warranties.length === 0 ? (
         <div className="warranty-loading">
           <div className="spinner"></div>
           <p>Loading warranties...</p>
         </div>
-      ) : filteredWarranties.length === 0 ? (
+      ) : warranties.length === 0 ? (
         <div className="warranty-empty">
           <Icon name="info" size={48} />
           <p>No warranties found</p>
@@ -252,7 +252,7 @@ const WarrantyTracker = () => {
               </tr>
             </thead>
             <tbody>
-              {filteredWarranties.map(w => (
+              {warranties.map(w => (
                 <tr key={w._id}>
                   <td className="font-bold">{w.productName}</td>
                   <td>{w.customerName || 'N/A'}</td>
@@ -314,7 +314,7 @@ const WarrantyTracker = () => {
         </div>
       ) : (
         <div className="warranties-grid">
-          {filteredWarranties.map(warranty => (
+          {warranties.map(warranty => (
             <WarrantyCard
               key={warranty._id}
               warranty={warranty}
@@ -323,6 +323,13 @@ const WarrantyTracker = () => {
           ))}
         </div>
       )}
+      {nextCursor && warranties.length > 0 && (
+        <div style={{ display: 'flex', justifyContent: 'center', padding: '16px' }}>
+          <button className="retry-btn" onClick={() => fetchWarranties(nextCursor)} disabled={loading}>
+            {loading ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -141,26 +141,29 @@ export const useProducts = (isOnline, isAuthenticated, currentUser, isAdmin) =>
 
   /**
    * Upload a photo for a product.
-   * Sends the file to the backend (Cloudinary) and refreshes the product list.
+   * The backend stages the file and processes it in the background, so until the
+   * next refresh the card shows a local preview of the file.
    * @param {string} productId
    * @param {File}   file
-   * @returns {string} Cloudinary CDN URL of the uploaded photo
+   * @returns {string} URL to display for the uploaded photo
    */
   const uploadProductPhoto = async (productId, file) => {
     const userId   = currentUser?.id       || null
     const username = currentUser?.username || 'unknown'
     const result   = await uploadProductPhotoAPI(productId, file, userId, username)
+    const newPhoto = result?.photo || {}
+    const preview  = newPhoto.url || URL.createObjectURL(file)
     // Optimistically update local state so the card re-renders immediately
     setProducts(prev => prev.map(p => {
       if ((p.id || p._id) !== productId) return p
-      const newPhoto = result?.photo || {}
       return {
         ...p,
-        photo:  newPhoto.url || p.photo,
-        photos: [...(p.photos || []), { id: newPhoto.id, url: newPhoto.url, storage: 'cloudinary', cloudinaryPublicId: newPhoto.id }]
+        photo:     preview,
+        thumbnail: preview,
+        photos: [...(p.photos || []), { id: newPhoto.id, url: preview, status: newPhoto.status, storage: 'cloudinary', cloudinaryPublicId: newPhoto.id }]
       }
     }))
-    return result?.photo?.url || null
+    return preview
   }
 
   /**